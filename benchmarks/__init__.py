@@ -0,0 +1,5 @@
+"""
+Benchmarks for the watch -> classify -> move pipeline.
+
+Run from the repository root: python -m benchmarks.run --help
+"""
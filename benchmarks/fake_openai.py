@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI endpoints the classifier uses, with
+configurable latency and error rates.
+
+Point the SDK at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+
+import argparse
+import http.server
+import itertools
+import json
+import random
+import threading
+import time
+
+ANSWERS = ("finance", "invoice", "travel", "legal", "medical", "education")
+
+
+class FakeOpenAI:
+    """
+    Serves POST /v1/responses, POST /v1/files and DELETE /v1/files/<id>.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.05, error_rate=0.0, throttle_rate=0.0,
+                 host="127.0.0.1", port=0, seed=1234):
+        """
+        Args:
+            latency (float): Seconds each request takes
+            jitter (float): Uniform extra latency in seconds
+            error_rate (float): Share of requests answered with 500
+            throttle_rate (float): Share of requests answered with 429
+            host (str): Interface to bind
+            port (int): Port (0 picks a free one)
+            seed (int): Random seed for latency and failures
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.stats = {"responses": 0, "uploads": 0, "deletes": 0, "errors": 0, "throttled": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._server = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """
+        Serve on a background thread and return the base URL.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _decide(self):
+        """
+        Pick this request's latency and outcome ("ok", "error" or "throttle").
+        """
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return delay, "error"
+        if roll < self.error_rate + self.throttle_rate:
+            return delay, "throttle"
+        return delay, "ok"
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if not self._delay_or_fail():
+                    return
+                if self.path.endswith("/responses"):
+                    fake._count("responses")
+                    self._json(200, _response(next(fake._ids), _answer(body)))
+                elif self.path.endswith("/files"):
+                    fake._count("uploads")
+                    self._json(200, {
+                        "id": f"file-{next(fake._ids)}", "object": "file", "bytes": len(body),
+                        "created_at": int(time.time()), "filename": "upload.pdf",
+                        "purpose": "assistants", "status": "processed",
+                    })
+                else:
+                    self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+            def do_DELETE(self):
+                fake._count("deletes")
+                file_id = self.path.rsplit("/", 1)[-1]
+                self._json(200, {"id": file_id, "object": "file", "deleted": True})
+
+            def _delay_or_fail(self):
+                delay, outcome = fake._decide()
+                time.sleep(delay)
+                if outcome == "error":
+                    fake._count("errors")
+                    self._json(500, {"error": {"message": "simulated failure", "type": "server_error"}})
+                    return False
+                if outcome == "throttle":
+                    fake._count("throttled")
+                    self._json(429, {"error": {"message": "simulated rate limit", "type": "rate_limit_error"}},
+                               {"Retry-After": "1"})
+                    return False
+                return True
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _answer(body):
+    """
+    A stable subcategory per request text, so repeated documents agree.
+    """
+    return ANSWERS[sum(body[-256:]) % len(ANSWERS)]
+
+
+def _response(number, text):
+    return {
+        "id": f"resp_{number}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": "gpt-4o-mini",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{number}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "error": None,
+        "incomplete_details": None,
+        "instructions": None,
+        "metadata": {},
+        "temperature": 1.0,
+        "top_p": 1.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for load tests")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOpenAI(args.latency, args.jitter, args.error_rate, args.throttle_rate, port=args.port)
+    print(f"OPENAI_BASE_URL={server.start()}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        server.stop()
+        print(json.dumps(server.stats))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Synthetic download storms: deterministic file sets written into a watch folder.
+"""
+
+import math
+import os
+import random
+import time
+
+# Relative weights of generated extensions ("" = no extension)
+DEFAULT_MIX = {
+    ".jpg": 25, ".png": 10, ".pdf": 5, ".docx": 8, ".txt": 7, ".xlsx": 3,
+    ".zip": 8, ".tar.gz": 3, ".mp4": 5, ".mp3": 6, ".dmg": 3, ".exe": 2,
+    ".csv": 5, ".xyz": 5, "": 5,
+}
+
+# PDF flavours: text a keyword model recognises, neutral text that needs the
+# API, and image-only "scans" that need an upload
+PDF_TEXTS = {
+    "keyword": "Invoice number 4711. Bill to ACME Ltd. Amount due 120.00 EUR. Due date 2024-05-01. "
+               "Please remit payment. Invoice total.",
+    "text": "Minutes of the quarterly meeting of the neighbourhood garden association.",
+    "scan": None,
+}
+
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_bytes(text):
+    """
+    Parse "4096", "64k", "16m" or "1g" into bytes.
+    """
+    text = text.strip().lower().rstrip("ib").rstrip("b")
+    unit = text[-1] if text and text[-1] in _UNITS else ""
+    return int(float(text[:-1] if unit else text) * _UNITS[unit])
+
+
+def parse_sizes(spec):
+    """
+    Build a size sampler from a distribution spec.
+
+    Args:
+        spec (str): "fixed:SIZE", "uniform:MIN,MAX" or "lognormal:MEDIAN,SIGMA"
+            with sizes like 4096, 64k or 16m
+
+    Returns:
+        callable: Takes a random.Random and returns a size in bytes
+    """
+    kind, _, params = spec.partition(":")
+    values = [p for p in params.split(",") if p]
+    if kind == "fixed":
+        size = parse_bytes(values[0])
+        return lambda rng: size
+    if kind == "uniform":
+        low, high = parse_bytes(values[0]), parse_bytes(values[1])
+        return lambda rng: rng.randint(low, high)
+    if kind == "lognormal":
+        mu, sigma = math.log(parse_bytes(values[0])), float(values[1])
+        return lambda rng: max(1, min(int(rng.lognormvariate(mu, sigma)), 1024 ** 3))
+    raise ValueError(f"Unknown size distribution: {spec!r}")
+
+
+def make_pdf(text):
+    """
+    Return the bytes of a minimal one-page PDF showing text (None: no text layer).
+    """
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode() if text else b"q Q"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+class PlannedFile:
+    """
+    One file of a storm.
+    """
+    __slots__ = ("name", "size", "duplicate_of", "pdf_kind", "partial")
+
+    def __init__(self, name, size, duplicate_of=None, pdf_kind=None, partial=False):
+        self.name = name
+        self.size = size
+        self.duplicate_of = duplicate_of
+        self.pdf_kind = pdf_kind
+        self.partial = partial
+
+
+class LoadSpec:
+    """
+    Parameters of a synthetic download storm.
+    """
+
+    def __init__(self, files=1000, sizes="lognormal:16k,1.5", mix=None, collision_rate=0.1,
+                 duplicate_rate=0.05, pdf_kinds=None, partial_rate=0.1, rate=0.0, seed=1234):
+        """
+        Args:
+            files (int): Number of files
+            sizes (str): Size distribution, see parse_sizes()
+            mix (dict): Extension -> relative weight; defaults to DEFAULT_MIX
+            collision_rate (float): Share of files whose name already exists
+                in the destination folder
+            duplicate_rate (float): Share of files that repeat an earlier
+                file's content under a new name
+            pdf_kinds (dict): PDF flavour -> weight ("keyword", "text", "scan")
+            partial_rate (float): Share written as ".crdownload" and renamed
+                when complete, like a browser does
+            rate (float): Files per second (0 writes as fast as possible)
+            seed (int): Random seed; the same spec always yields the same storm
+        """
+        self.files = files
+        self.sizes = sizes
+        self.mix = mix or DEFAULT_MIX
+        self.collision_rate = collision_rate
+        self.duplicate_rate = duplicate_rate
+        self.pdf_kinds = pdf_kinds or {"keyword": 4, "text": 4, "scan": 2}
+        self.partial_rate = partial_rate
+        self.rate = rate
+        self.seed = seed
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in (
+            "files", "sizes", "mix", "collision_rate", "duplicate_rate",
+            "pdf_kinds", "partial_rate", "rate", "seed",
+        )}
+
+
+class LoadGenerator:
+    """
+    Plans and writes a storm into a watch folder.
+    """
+
+    def __init__(self, spec, watch_folder):
+        """
+        Args:
+            spec (LoadSpec): What to generate
+            watch_folder (str or Path): Folder the files are written into
+        """
+        self.spec = spec
+        self.watch_folder = os.fspath(watch_folder)
+        self.plan = self._plan()
+        self._by_name = {planned.name: planned for planned in self.plan}
+        self.bytes_written = 0
+        self._block = random.Random(spec.seed).randbytes(1024 * 1024) if hasattr(random.Random, "randbytes") \
+            else os.urandom(1024 * 1024)
+
+    def _plan(self):
+        spec = self.spec
+        rng = random.Random(spec.seed)
+        sample_size = parse_sizes(spec.sizes)
+        extensions, weights = zip(*spec.mix.items())
+        kinds, kind_weights = zip(*spec.pdf_kinds.items())
+        planned = []
+        for index in range(spec.files):
+            ext = rng.choices(extensions, weights)[0]
+            stem = rng.choice(("download", "IMG", "report", "setup", "track", "scan", "data"))
+            name = f"{stem}_{index:06d}{ext}"
+            duplicate_of = None
+            if planned and rng.random() < spec.duplicate_rate:
+                original = planned[rng.randrange(len(planned))]
+                duplicate_of = original.name
+                ext = _ext_of(original.name)
+                name = f"{original.name[:len(original.name) - len(ext)]}_copy_{index:06d}{ext}"
+            pdf_kind = rng.choices(kinds, kind_weights)[0] if ext == ".pdf" else None
+            planned.append(PlannedFile(
+                name, sample_size(rng), duplicate_of, pdf_kind, rng.random() < spec.partial_rate
+            ))
+        return planned
+
+    def collisions(self):
+        """
+        Return the names that should already exist in their destination
+        (pre-seed them with seed_collisions()).
+        """
+        rng = random.Random(self.spec.seed + 1)
+        return [f.name for f in self.plan if rng.random() < self.spec.collision_rate]
+
+    def seed_collisions(self, folder_for):
+        """
+        Create files with colliding names in their destination folders.
+
+        Args:
+            folder_for (callable): Maps a file name to its destination folder
+
+        Returns:
+            int: Number of pre-existing files created
+        """
+        names = self.collisions()
+        for name in names:
+            folder = os.fspath(folder_for(name))
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(b"pre-existing " + name.encode())
+        return len(names)
+
+    def content(self, planned):
+        """
+        Bytes of a planned file; duplicates repeat their original's bytes.
+        """
+        if planned.duplicate_of is not None:
+            return self.content(self._by_name[planned.duplicate_of])
+        if planned.pdf_kind is not None:
+            return make_pdf(PDF_TEXTS[planned.pdf_kind])
+        header = planned.name.encode() + b"\n"
+        return header + self._repeat(planned.size - len(header))
+
+    def _repeat(self, size):
+        if size <= 0:
+            return b""
+        block = self._block
+        return block * (size // len(block)) + block[:size % len(block)]
+
+    def run(self):
+        """
+        Write the storm, pacing it to spec.rate.
+
+        Returns:
+            dict: Final path -> time.perf_counter() when the file was complete
+        """
+        created = {}
+        interval = 1.0 / self.spec.rate if self.spec.rate > 0 else 0.0
+        started = time.perf_counter()
+        for index, planned in enumerate(self.plan):
+            if interval:
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            final_path = os.path.join(self.watch_folder, planned.name)
+            data = self.content(planned)
+            write_path = final_path + ".crdownload" if planned.partial else final_path
+            with open(write_path, "wb") as f:
+                f.write(data)
+            self.bytes_written += len(data)
+            if planned.partial:
+                os.rename(write_path, final_path)
+            created[final_path] = time.perf_counter()
+        return created
+
+
+def _ext_of(name):
+    lower = name.lower()
+    for ext in (".tar.gz", ".tar.bz2", ".tar.xz"):
+        if lower.endswith(ext):
+            return name[-len(ext):]
+    return os.path.splitext(name)[1]
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner for the watch -> classify -> move pipeline.
+
+Each scenario runs in a fresh subprocess with its own tmpfs watch folder,
+state folder and fake OpenAI server, drives the real FilesWatcher,
+FileClassifier and FileMover with a synthetic download storm, and reports
+throughput, end-to-end latency percentiles, peak RSS and syscall counts.
+
+Usage (from the repository root):
+    python -m benchmarks.run                     # all scenarios, compared with baseline.json
+    python -m benchmarks.run storm --files 5000  # one scenario, overriding its size
+    python -m benchmarks.run --save-baseline     # record this machine's baseline
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+SCENARIOS = {
+    # Mixed small downloads with collisions, duplicates and a few PDFs
+    "storm": {
+        "load": {"files": 2000, "sizes": "lognormal:16k,1.5"},
+        "api": {"latency": 0.05, "jitter": 0.02},
+    },
+    # PDFs only: keyword hits, API calls with a slow, flaky API, and uploads
+    "pdf": {
+        "load": {"files": 150, "mix": {".pdf": 1}, "collision_rate": 0.0, "duplicate_rate": 0.1},
+        "api": {"latency": 0.3, "jitter": 0.2, "error_rate": 0.05, "throttle_rate": 0.02},
+    },
+    # Few large files
+    "large": {
+        "load": {"files": 24, "sizes": "fixed:32m", "mix": {".mp4": 1, ".zip": 1}, "partial_rate": 0.0},
+        "api": {"latency": 0.05},
+    },
+    # Many re-downloads with hard-link deduplication
+    "dedup": {
+        "load": {"files": 1000, "duplicate_rate": 0.4, "mix": {".jpg": 3, ".zip": 1, ".mp3": 1}},
+        "api": {"latency": 0.05},
+        "env": {"DEDUP_MODE": "hardlink"},
+    },
+}
+
+# (result key, True if higher is better)
+COMPARED = (
+    ("throughput_files_s", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("peak_rss_mib", False),
+)
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))]
+
+
+def _proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+def _peak_rss_mib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(spec_dict, timeout):
+    """
+    Run one storm in this process and print the results as JSON.
+
+    Must run in a fresh interpreter: config.py reads the environment once.
+    """
+    from logger import setup_logging
+    from watchdog.observers import Observer
+    from file_watcher import FilesWatcher
+    from metrics import registry
+    from benchmarks.loadgen import LoadSpec, LoadGenerator
+
+    logger = setup_logging()
+    watch_folder = Path(os.environ["WATCH_FOLDER"])
+    watch_folder.mkdir(parents=True, exist_ok=True)
+    generator = LoadGenerator(LoadSpec(**spec_dict), watch_folder)
+    watcher = FilesWatcher(watch_folder, logger)
+
+    def folder_for(name):
+        ctx = watcher.context_for(watch_folder / name)
+        category = ctx.classifier.classify_name(name)
+        return ctx.root.category_folders.get(category, ctx.root.category_folders["Misc"])
+
+    seeded = generator.seed_collisions(folder_for)
+
+    done = {}
+    process_file = watcher.process_file
+
+    def recording_process_file(file_path, classification=None):
+        process_file(file_path, classification)
+        if not os.path.lexists(file_path):
+            done[os.fspath(file_path)] = time.perf_counter()
+
+    watcher.process_file = recording_process_file
+    observer = Observer()
+    observer.schedule(watcher, str(watch_folder), recursive=False)
+    watcher.start()
+    observer.start()
+
+    io_before = _proc_io()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    created = generator.run()
+    deadline = time.monotonic() + timeout
+    while len(done) < len(created) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    finished = max(done.values(), default=time.perf_counter())
+    io_after = _proc_io()
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    observer.stop()
+    observer.join()
+    watcher.stop()
+
+    latencies = sorted((done[path] - at) * 1000 for path, at in created.items() if path in done)
+    elapsed = max(finished - started, 1e-9)
+    stages = {}
+    for stage in ("process", "classify", "read_and_classify", "api_call",
+                  "dedup", "name_reserve", "transfer"):
+        count, p50, p95, p99 = registry.stage_percentiles(stage)
+        if count:
+            stages[stage] = {"count": count, "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000}
+    results = {
+        "files": len(created),
+        "completed": len(latencies),
+        "collisions_seeded": seeded,
+        "bytes": generator.bytes_written,
+        "elapsed_s": elapsed,
+        "throughput_files_s": len(latencies) / elapsed,
+        "throughput_mib_s": generator.bytes_written / elapsed / (1024 * 1024),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "peak_rss_mib": _peak_rss_mib(),
+        "syscalls": {
+            "read": io_after.get("syscr", 0) - io_before.get("syscr", 0),
+            "write": io_after.get("syscw", 0) - io_before.get("syscw", 0),
+        },
+        "context_switches": (usage_after.ru_nvcsw + usage_after.ru_nivcsw)
+        - (usage_before.ru_nvcsw + usage_before.ru_nivcsw),
+        "stages": stages,
+        "counters": {f"{name}{'{' + '='.join(label) + '}' if label else ''}": value
+                     for (name, label), value in sorted(registry.counters().items(), key=lambda i: (i[0][0], i[0][1] or ()))},
+    }
+    print(json.dumps(results))
+
+
+def run_scenario(name, scenario, files=None, strace=False, tmp_dir=None, keep=False, timeout=300.0):
+    """
+    Run one scenario in a subprocess and return its results.
+
+    Raises:
+        RuntimeError: If the worker fails, or if the run did not exercise the
+            fake API (no OpenAI SDK, or no request reached the server)
+    """
+    from benchmarks.fake_openai import FakeOpenAI
+
+    # Without the SDK every API call fails instantly, which looks like a fast run
+    if importlib.util.find_spec("openai") is None:
+        raise RuntimeError("benchmarks need the openai package installed (pip install openai)")
+
+    load = dict(scenario["load"])
+    if files:
+        load["files"] = files
+    tmp_dir = tmp_dir or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+    root = Path(tempfile.mkdtemp(prefix=f"mk-bench-{name}-", dir=tmp_dir))
+    api = FakeOpenAI(**scenario.get("api", {}))
+    base_url = api.start()
+
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")])),
+        "WATCH_FOLDER": str(root / "watch"),
+        "STATE_FOLDER": str(root / "state"),
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "SETTLE_SECONDS": "0.2",
+        "CLASSIFY_RETRY_INTERVAL": "1",
+        "OPENAI_BREAKER_RESET": "2",
+        "QUEUE_REPORT_INTERVAL": "0",
+        "METRICS_SUMMARY_INTERVAL": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    env.pop("WATCH_ROOTS_FILE", None)
+    env.update(scenario.get("env", {}))
+
+    command = [sys.executable, "-m", "benchmarks.run", "--worker", json.dumps(load), "--timeout", str(timeout)]
+    strace_file = root / "strace.txt"
+    if strace:
+        command = ["strace", "-f", "-c", "-o", str(strace_file)] + command
+    try:
+        # The worker runs inside the scratch folder so its logs/ stay out of the repository
+        completed = subprocess.run(command, cwd=root, env=env, capture_output=True, text=True, timeout=timeout + 60)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{name} failed:\n{completed.stderr[-4000:]}")
+        results = json.loads(completed.stdout.strip().splitlines()[-1])
+        results["api"] = dict(api.stats)
+        results["load"] = load
+        received = sum(api.stats[key] for key in ("responses", "uploads", "errors", "throttled"))
+        if results["counters"].get("api_calls_total") and not received:
+            raise RuntimeError(
+                f"{name}: {results['counters']['api_calls_total']} API call(s) made but the fake API "
+                f"received no requests (check OPENAI_BASE_URL handling); not recording this run"
+            )
+        if strace:
+            results["syscalls"]["total"] = _strace_total(strace_file)
+        return results
+    finally:
+        api.stop()
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _strace_total(path):
+    try:
+        text = Path(path).read_text()
+    except OSError:
+        return None
+    match = re.search(r"^\s*100\.00\s+\S+\s+\S+\s+(\d+)", text, re.MULTILINE) or \
+        re.search(r"^\S*\s*\S+\s+\S+\s+\S+\s+(\d+)\s+(?:\d+\s+)?total$", text, re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+
+def _lookup(results, dotted):
+    value = results
+    for key in dotted.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+
+    Returns:
+        list: (scenario, metric, baseline value, current value, change, regressed)
+    """
+    rows = []
+    for name, current in results.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            continue
+        for key, higher_is_better in COMPARED:
+            old, new = _lookup(reference, key), _lookup(current, key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((name, key, old, new, change, regressed))
+    return rows
+
+
+def print_results(results):
+    for name, r in results.items():
+        latency = r["latency_ms"]
+        print(
+            f"{name:>6}: {r['completed']}/{r['files']} files in {r['elapsed_s']:.2f}s, "
+            f"{r['throughput_files_s']:.0f} files/s, {r['throughput_mib_s']:.1f} MiB/s, "
+            f"latency p50 {latency['p50']:.0f} ms p95 {latency['p95']:.0f} ms p99 {latency['p99']:.0f} ms, "
+            f"peak RSS {r['peak_rss_mib']:.0f} MiB, syscalls r/w {r['syscalls']['read']}/{r['syscalls']['write']}"
+            + (f" total {r['syscalls']['total']}" if r["syscalls"].get("total") else "")
+        )
+        if r["api"]["responses"] or r["api"]["errors"]:
+            print(f"        api: {r['api']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--files", type=int, help="override the number of files per scenario")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative change counted as a regression (default 0.2)")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    parser.add_argument("--strace", action="store_true", help="count all syscalls with strace -f -c")
+    parser.add_argument("--tmp-dir", help="where to create scratch folders (default /dev/shm)")
+    parser.add_argument("--keep", action="store_true", help="keep scratch folders for inspection")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for a storm to drain")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(json.loads(args.worker), args.timeout)
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    if args.strace and not shutil.which("strace"):
+        parser.error("--strace needs strace on PATH")
+
+    results = {}
+    for name in args.scenarios or list(SCENARIOS):
+        print(f"Running {name}...", flush=True)
+        try:
+            results[name] = run_scenario(
+                name, SCENARIOS[name], args.files, args.strace, args.tmp_dir, args.keep, args.timeout
+            )
+        except RuntimeError as error:
+            print(error, file=sys.stderr)
+            return 2
+    print_results(results)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baseline = {"machine": f"{platform.node()} {platform.platform()} python {platform.python_version()}",
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "scenarios": results}
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    rows = compare(results, baseline, args.tolerance)
+    print(f"\nCompared with baseline from {baseline.get('created', '?')} ({baseline.get('machine', '?')}):")
+    for name, key, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {name:>6} {key:<20} {old:>10.1f} -> {new:>10.1f} ({change:+.0%}){flag}")
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
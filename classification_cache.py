@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of PDF subcategory classifications keyed by content hash.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from logger import setup_logging
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS classifications (
+    content_hash TEXT PRIMARY KEY,
+    subcategory TEXT NOT NULL,
+    folders_fingerprint TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS classifications_last_used ON classifications (last_used);
+"""
+
+
+def folders_fingerprint(folder_names):
+    """
+    Fingerprint a set of Documents subfolder names.
+
+    Args:
+        folder_names (iterable): Folder names
+
+    Returns:
+        str: Stable digest of the sorted, de-duplicated names
+    """
+    joined = "\0".join(sorted(set(folder_names)))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    """
+    SQLite-backed map of content hash -> subcategory with TTL and LRU eviction.
+
+    Each entry remembers the Documents subfolder set it was classified
+    against; a lookup only hits when the current set matches, so adding,
+    removing or renaming subfolders invalidates earlier answers.
+    """
+
+    EVICT_EVERY = 64
+
+    def __init__(self, db_path, ttl_seconds, max_entries, logger=None):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path (str): Path to the SQLite file
+            ttl_seconds (float): Entries older than this are ignored and evicted
+            max_entries (int): Least recently used entries beyond this are evicted
+            logger: Logger instance to use for logging
+        """
+        self.logger = logger or setup_logging()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._evict()
+
+    def get(self, content_hash, fingerprint):
+        """
+        Look up a cached subcategory.
+
+        Args:
+            content_hash (str): Content digest of the file
+            fingerprint (str): Current Documents subfolder fingerprint
+
+        Returns:
+            str | None: Cached subcategory, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT subcategory FROM classifications "
+                "WHERE content_hash = ? AND folders_fingerprint = ? AND created_at >= ?",
+                (content_hash, fingerprint, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE classifications SET last_used = ? WHERE content_hash = ?",
+                (now, content_hash),
+            )
+        return row[0]
+
+    def put(self, content_hash, fingerprint, subcategory):
+        """
+        Store a classification.
+
+        Args:
+            content_hash (str): Content digest of the file
+            fingerprint (str): Documents subfolder fingerprint the answer is valid for
+            subcategory (str): Subcategory returned by the classifier
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO classifications "
+                "(content_hash, subcategory, folders_fingerprint, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, subcategory, fingerprint, now, now),
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict_locked()
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        self._conn.execute(
+            "DELETE FROM classifications WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        )
+        self._conn.execute(
+            "DELETE FROM classifications WHERE content_hash IN ("
+            "SELECT content_hash FROM classifications ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
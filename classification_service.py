@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Asyncio-based OpenAI request service with concurrency limits, rate limiting,
+retries and a circuit breaker.
+
+asyncio is imported inside the functions that use it: it pulls in ssl,
+socket and subprocess, and the event loop only starts with the first PDF
+that needs the API.
+"""
+
+import random
+import threading
+import time
+from logger import setup_logging
+from metrics import registry as metrics
+
+
+class ClassificationUnavailable(Exception):
+    """
+    Raised when the classification API cannot be reached right now
+    (retries exhausted or circuit open). The file should be retried later.
+    """
+
+
+def is_transient_error(error):
+    """
+    Return True if an API error is worth retrying.
+
+    Timeouts, connection errors, rate limits and 5xx responses are transient;
+    other 4xx responses and local configuration errors are not.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (RuntimeError, ValueError, TypeError, FileNotFoundError)):
+        return False
+    return True
+
+
+class TokenBucket:
+    """
+    Token bucket limiting the request rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second (0 disables limiting)
+            capacity (float): Maximum burst size; defaults to one second of tokens
+        """
+        import asyncio
+
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        import asyncio
+
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint after repeated failures.
+
+    closed -> open after failure_threshold consecutive failures;
+    open -> half-open after reset_timeout, letting a single probe through;
+    half-open -> closed on success, back to open on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, logger=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logger or setup_logging()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Return True if a request may be sent now.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                self.logger.info("Classification API recovered, circuit closed")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.logger.warning(
+                        "Classification API failing, circuit open for %.0fs", self.reset_timeout
+                    )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class ClassificationService:
+    """
+    Runs classification requests on a private asyncio loop.
+
+    Callers on worker threads submit blocking request functions; the loop
+    bounds in-flight requests, applies the token bucket, retries transient
+    errors with exponential backoff and jitter, and consults the circuit
+    breaker before every attempt.
+    """
+
+    def __init__(self, max_in_flight=4, rate_per_second=2.0, max_retries=4,
+                 base_delay=1.0, max_delay=30.0, failure_threshold=5,
+                 reset_timeout=60.0, logger=None):
+        """
+        Args:
+            max_in_flight (int): Maximum concurrent requests
+            rate_per_second (float): Token bucket refill rate (0 disables)
+            max_retries (int): Retries after the first attempt for transient errors
+            base_delay (float): First backoff delay in seconds
+            max_delay (float): Backoff cap in seconds
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds the circuit stays open before a probe
+            logger: Logger instance to use for logging
+        """
+        self.logger = logger or setup_logging()
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.rate_per_second = rate_per_second
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, self.logger)
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._bucket = None
+        self._start_lock = threading.Lock()
+
+    def call(self, request, *args):
+        """
+        Run a blocking request function through the service and wait for it.
+
+        Args:
+            request (callable): Function performing one API request
+            *args: Arguments for the request function
+
+        Returns:
+            The request function's return value
+
+        Raises:
+            ClassificationUnavailable: The circuit is open or retries are exhausted
+            Exception: Non-transient errors from the request are re-raised as is
+        """
+        import asyncio
+
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._call(request, *args), self._loop)
+        return future.result()
+
+    def stop(self):
+        """
+        Stop the event loop thread.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+    def _ensure_started(self):
+        import asyncio
+
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(self._loop)
+                self._semaphore = asyncio.Semaphore(self.max_in_flight)
+                self._bucket = TokenBucket(self.rate_per_second)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="mk-openai", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    async def _call(self, request, *args):
+        import asyncio
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                metrics.inc("api_rejected_total")
+                raise ClassificationUnavailable("circuit open")
+            try:
+                async with self._semaphore:
+                    await self._bucket.acquire()
+                    metrics.inc("api_calls_total")
+                    with metrics.timer("api_call"):
+                        result = await asyncio.to_thread(request, *args)
+            except Exception as e:
+                metrics.inc("api_failures_total")
+                if not is_transient_error(e):
+                    # The endpoint answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise ClassificationUnavailable(f"{type(e).__name__}: {str(e)}") from e
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                delay = random.uniform(0, delay)  # full jitter
+                self.logger.warning(
+                    "Classification request failed (%s), retry %d/%d in %.1fs",
+                    type(e).__name__, attempt + 1, self.max_retries, delay,
+                )
+                attempt += 1
+                metrics.inc("api_retries_total")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+
+class RetryQueue:
+    """
+    Holds files whose classification is unavailable and re-submits them
+    periodically until the API recovers.
+    """
+
+    def __init__(self, resubmit, interval=60.0, logger=None):
+        """
+        Args:
+            resubmit (callable): Called with each parked path when it is retried
+            interval (float): Seconds between retry rounds
+            logger: Logger instance to use for logging
+        """
+        self.resubmit = resubmit
+        self.interval = interval
+        self.logger = logger or setup_logging()
+        self._parked = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def park(self, file_path):
+        """
+        Park a file for a later retry.
+        """
+        with self._lock:
+            self._parked[file_path] = time.monotonic()
+            count = len(self._parked)
+        self.logger.warning("Parked %s for retry (%d waiting)", file_path.name, count)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._parked)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mk-retry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                parked, self._parked = list(self._parked), {}
+            if not parked:
+                continue
+            self.logger.info("Retrying classification for %d parked file(s)", len(parked))
+            for file_path in parked:
+                if file_path.exists():
+                    self.resubmit(file_path)
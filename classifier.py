@@ -1,173 +1,531 @@
 import os
+import re
 from typing import Optional
 
-from config import ORGANIZE_RULES, DOCUMENTS_FOLDER
+from config import (
+    ORGANIZE_RULES, NAME_RULES, SIZE_RULES, DOCUMENTS_FOLDER, CLASSIFICATION_CACHE_PATH,
+    CLASSIFICATION_CACHE_TTL_DAYS, CLASSIFICATION_CACHE_MAX_ENTRIES,
+    PDF_TEXT_MAX_PAGES, PDF_TEXT_MAX_CHARS, PDF_TEXT_MAX_BYTES, OPENAI_MAX_IN_FLIGHT,
+    OPENAI_RATE_LIMIT, OPENAI_MAX_RETRIES, OPENAI_TIMEOUT, OPENAI_BREAKER_THRESHOLD,
+    OPENAI_BREAKER_RESET,
+    SNIFF_ENABLED, SNIFF_BYTES, SNIFF_EXTENSIONS, SHARD_LAYOUT
+)
 from logger import setup_logging
+from hashing import file_digest
+from rules import compile_rules
+from sniff import ContentSniffer
+from folder_index import SubfolderIndex
+from layout import ShardLayout
+from classification_cache import ClassificationCache, folders_fingerprint
+from classification_service import ClassificationService, ClassificationUnavailable
+from metrics import registry as metrics
 
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None  # Defer import errors until method use
+# pypdf and the OpenAI SDK are imported on first use: together they add
+# hundreds of milliseconds to every start, and most runs never see a PDF.
+# None = not tried yet, False = not installed.
+_pdf_reader_class = None
+_openai_class = None
+
+
+def _pdf_reader():
+    """
+    Return pypdf's PdfReader, or False without pypdf (local text extraction is skipped).
+    """
+    global _pdf_reader_class
+    if _pdf_reader_class is None:
+        try:
+            from pypdf import PdfReader
+        except Exception:
+            PdfReader = False
+        _pdf_reader_class = PdfReader
+    return _pdf_reader_class
+
+
+def _openai():
+    """
+    Return the OpenAI client class, or False without the SDK.
+    """
+    global _openai_class
+    if _openai_class is None:
+        try:
+            from openai import OpenAI
+        except Exception:
+            OpenAI = False  # Defer import errors until method use
+        _openai_class = OpenAI
+    return _openai_class
+
+
+# Keywords that identify common document subcategories. Existing Documents
+# subfolder names are added as keywords for themselves at classification time.
+SUBCATEGORY_KEYWORDS = {
+    "finance": ["bank", "statement", "account", "balance", "transaction", "credit", "loan", "mortgage"],
+    "tax": ["tax", "irs", "w-2", "1099", "return", "deduction", "withholding", "hmrc"],
+    "legal": ["agreement", "contract", "hereby", "party", "parties", "clause", "court", "attorney"],
+    "invoice": ["invoice", "bill to", "due date", "amount due", "invoice number", "remit"],
+    "receipt": ["receipt", "paid", "order number", "thank you for your purchase", "subtotal"],
+    "insurance": ["insurance", "policy", "premium", "coverage", "insured", "claim"],
+    "education": ["course", "university", "transcript", "syllabus", "student", "lecture"],
+    "medical": ["patient", "diagnosis", "clinic", "prescription", "doctor", "hospital"],
+    "travel": ["boarding pass", "itinerary", "flight", "booking", "reservation", "hotel"],
+}
+
+
+def normalize_subcategory(name: str) -> str:
+    """
+    Normalize a subcategory name the way folder names are sanitized.
+    """
+    name = name.strip().lower()
+    name = re.sub(r"[^a-z0-9]+", "-", name)
+    name = re.sub(r"-+", "-", name).strip('-')
+    return name
+
+
+class _ReadBudget:
+    """
+    File wrapper that fails every read once max_bytes have been read, so a
+    parser that seeks around a large file stops instead of reading all of it.
+    """
+
+    def __init__(self, f, max_bytes):
+        self._file = f
+        self.remaining = max_bytes if max_bytes > 0 else None  # None = no limit
+        self.exhausted = False
+
+    def read(self, size=-1):
+        if self.remaining is None:
+            return self._file.read(size)
+        if size is None or size < 0 or size > self.remaining:
+            size = max(self.remaining + 1, 0)  # Never past the budget, even for read() to the end
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            self.exhausted = True
+            raise OSError("PDF read budget exhausted")
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+
+def extract_pdf_text(file_path, max_pages, max_chars, max_bytes=0):
+    """
+    Extract text from the first pages of a PDF without reading the whole file.
+
+    The reader gets an open file and seeks to the objects it needs, so only
+    the cross-reference data and the first pages are read, and never more
+    than max_bytes of them however large the file is.
+
+    Args:
+        file_path (str or Path): Path to the PDF file
+        max_pages (int): Maximum number of pages to read
+        max_chars (int): Stop once this much text has been collected
+        max_bytes (int): Bytes the reader may read in total (0 = no limit)
+
+    Returns:
+        str | None: Extracted text (empty when unavailable, encrypted or
+            scanned); None when max_bytes ran out before any text was found,
+            which says nothing about whether the PDF has a text layer
+    """
+    PdfReader = _pdf_reader()
+    if not PdfReader:
+        return ""
+    stream = None
+    parts = []
+    try:
+        with open(file_path, "rb") as f:
+            stream = _ReadBudget(f, max_bytes)
+            reader = PdfReader(stream)
+            if reader.is_encrypted:
+                return ""
+            collected = 0
+            for index, page in enumerate(reader.pages):
+                if index >= max_pages or collected >= max_chars:
+                    break
+                text = page.extract_text() or ""
+                parts.append(text)
+                collected += len(text)
+    except Exception:
+        pass  # Keep the text of the pages read before the failure
+    text = " ".join(" ".join(parts).split())[:max_chars]
+    if not text and stream is not None and stream.exhausted:
+        return None
+    return text
+
+
+class KeywordClassifier:
+    """
+    Cheap local subcategory model: counts keyword hits in extracted text.
+    """
+
+    def __init__(self, keywords=None, min_score=3, min_margin=2):
+        """
+        Args:
+            keywords (dict): subcategory -> list of lowercase keywords
+            min_score (int): Hits the best subcategory needs to be trusted
+            min_margin (int): Hits the best subcategory must lead the runner-up by
+        """
+        self.keywords = keywords if keywords is not None else SUBCATEGORY_KEYWORDS
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+    def classify(self, text, existing_folders=()):
+        """
+        Score text against the keyword sets and existing folder names.
+
+        Args:
+            text (str): Extracted document text
+            existing_folders (iterable): Existing Documents subfolder names
+
+        Returns:
+            tuple: (subcategory or None when not confident, best score)
+        """
+        haystack = f" {text.lower()} "
+        rules = {name: list(words) for name, words in self.keywords.items()}
+        for folder in existing_folders:
+            words = rules.setdefault(normalize_subcategory(folder), [])
+            word = folder.lower().replace("-", " ").replace("_", " ")
+            if word not in words:
+                words.append(word)
+
+        scores = {}
+        for name, words in rules.items():
+            score = sum(haystack.count(f" {word}") for word in words if word)
+            if score:
+                scores[name] = score
+        if not scores:
+            return None, 0
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        best, best_score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        if best_score >= self.min_score and best_score - runner_up >= self.min_margin:
+            return best, best_score
+        return None, best_score
 
- 
 
 
 class FileClassifier:
     """
-    File classifier that uses ORGANIZE_RULES from config.py to classify files.
+    File classifier that uses the rules from config.py to classify files.
     """
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, cache=None, service=None, rules=None, documents_folder=None,
+                 subfolders=None):
         self.logger = logger or setup_logging()
+        # Subcategory folders for PDFs are looked up here
+        self.documents_folder = documents_folder or DOCUMENTS_FOLDER
+        # Listed once; FileMover and directory events keep it current
+        self.subfolders = subfolders or SubfolderIndex(
+            self.documents_folder, normalize_subcategory, ignore=ShardLayout(SHARD_LAYOUT).is_shard
+        )
+        # Rules are compiled once; classify() never scans ORGANIZE_RULES
+        self.rules = rules or compile_rules(ORGANIZE_RULES, NAME_RULES, SIZE_RULES, self.logger)
+        # Only consulted for extension-less names no rule matches, or generic extensions like ".bin"
+        self.sniffer = ContentSniffer(self.rules, SNIFF_BYTES, SNIFF_EXTENSIONS) if SNIFF_ENABLED else None
         self.logger.info("FileClassifier initialized")
         # Initialize OpenAI client lazily when needed
         self._openai_client = None
+        self._keywords = KeywordClassifier()
+        self._service = service or ClassificationService(
+            max_in_flight=OPENAI_MAX_IN_FLIGHT,
+            rate_per_second=OPENAI_RATE_LIMIT,
+            max_retries=OPENAI_MAX_RETRIES,
+            failure_threshold=OPENAI_BREAKER_THRESHOLD,
+            reset_timeout=OPENAI_BREAKER_RESET,
+            logger=self.logger,
+        )
+        self._cache = cache
+        if self._cache is None:
+            try:
+                self._cache = ClassificationCache(
+                    CLASSIFICATION_CACHE_PATH,
+                    ttl_seconds=CLASSIFICATION_CACHE_TTL_DAYS * 86400,
+                    max_entries=CLASSIFICATION_CACHE_MAX_ENTRIES,
+                    logger=self.logger,
+                )
+            except Exception as e:
+                self.logger.warning("Classification cache unavailable: %s: %s", type(e).__name__, e)
 
     def classify(self, file_path):
         """
-        Classify the file based on ORGANIZE_RULES from config.py.
+        Classify the file based on the compiled ORGANIZE_RULES, NAME_RULES and
+        SIZE_RULES from config.py. Files without an extension that no rule
+        matches, and generic extensions like ".bin", are classified by their
+        first bytes instead.
         Args:
             file_path (str or Path): Path to the file
         Returns:
             str: Classification label
         """
         from pathlib import Path
-        self.logger.debug(f"Starting classification for file: {file_path}")
+        self.logger.debug("Starting classification for file: %s", file_path)
         
         try:
             file_path = Path(file_path)
-            if not file_path.exists():
-                self.logger.error(f"File does not exist: {file_path}")
+            try:
+                st = file_path.stat()
+            except FileNotFoundError:
+                self.logger.error("File does not exist: %s", file_path)
                 return 'Misc'
-            
-            ext = file_path.suffix.lower()
-            self.logger.debug(f"File extension detected: {ext}")
-            
-            for category, extensions in ORGANIZE_RULES.items():
-                if ext in extensions:
-                    self.logger.info(f"File {file_path.name} classified as {category} (extension: {ext})")
-                    return category
-            
-            self.logger.info(f"File {file_path.name} classified as Misc (no matching extension: {ext})")
+
+            category = self.rules.lookup(file_path.name, st.st_size)
+            if self.sniffer is not None and self.sniffer.wants(file_path.name, category):
+                # Only content reads are timed: a rule lookup costs less than its timer
+                with metrics.timer("classify"):
+                    sniffed = self.sniffer.category(file_path, st)
+                if sniffed:
+                    self.logger.debug("File %s classified as %s by content", file_path.name, sniffed)
+                    return sniffed
+            if category:
+                self.logger.debug("File %s classified as %s", file_path.name, category)
+                return category
+            self.logger.debug("File %s classified as Misc (no matching rule)", file_path.name)
             return 'Misc'
             
         except Exception as e:
-            self.logger.error(f"Error during classification of {file_path}: {str(e)}")
+            self.logger.error("Error during classification of %s: %s", file_path, e)
             return 'Misc'
 
+    def classify_name(self, name, size=None):
+        """
+        Classify by file name and (optionally) size without touching the file,
+        e.g. from cached os.DirEntry stat data.
+        Args:
+            name (str): File name
+            size (int | None): File size in bytes
+        Returns:
+            str: Classification label
+        """
+        category = self.rules.lookup(name, size)
+        if category:
+            self.logger.debug("File %s classified as %s", name, category)
+            return category
+        self.logger.debug("File %s classified as Misc (no matching rule)", name)
+        return 'Misc'
+
+    def with_rules(self, rules):
+        """
+        Return a classifier using new compiled rules that shares this one's
+        cache, classification service, subfolder index and sniffer memo.
+        """
+        import copy
+
+        classifier = copy.copy(self)
+        classifier.rules = rules
+        if self.sniffer is not None:
+            classifier.sniffer = self.sniffer.with_rules(rules)
+        return classifier
+
+    def needs_content(self, name, size=None):
+        """
+        Return True if classify() would look at the file's content, i.e. the
+        category cannot be decided from the name (and size) alone.
+        """
+        return self.sniffer is not None and self.sniffer.wants(name, self.rules.lookup(name, size))
+
+    def is_pdf(self, file_path):
+        """
+        Return True for files named .pdf, and for PDFs with a missing or
+        generic extension (detected by content).
+        """
+        from pathlib import Path
+
+        file_path = Path(file_path)
+        if file_path.suffix.lower() == ".pdf":
+            return True
+        if self.sniffer is None or not self.sniffer.wants(
+            file_path.name, self.rules.lookup_extension(file_path.name)
+        ):
+            return False
+        return self.sniffer.sniff(file_path) == ".pdf"
 
     def _ensure_openai_client(self):
         """
         Ensure an OpenAI client is available when needed.
         """
         if self._openai_client is None:
-            if OpenAI is None:
-                raise RuntimeError("OpenAI SDK not installed. Please install 'openai' package.")
+            # Checked first so that without a key the SDK is never imported
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise RuntimeError("OPENAI_API_KEY is not set in the environment.")
-            self._openai_client = OpenAI()
+            OpenAI = _openai()
+            if not OpenAI:
+                raise RuntimeError("OpenAI SDK not installed. Please install 'openai' package.")
+            # Retries are handled by the classification service
+            self._openai_client = OpenAI(timeout=OPENAI_TIMEOUT, max_retries=0)
         return self._openai_client
 
     def read_and_classify(self, file_path) -> Optional[str]:
         """
-        If the file is a PDF, upload it to OpenAI Files API and request a subcategory
-        suitable for organizing the document. The model is instructed to choose one of
-        the existing folders in the Downloads directory if it is a good match; only
-        if none of them match should it propose a new one-word subcategory.
+        If the file is a PDF, pick a subcategory suitable for organizing the document.
+
+        The text of the first pages is extracted locally and scored against the
+        existing Documents subfolders and a small keyword model. Only when that
+        is not confident is OpenAI asked, with a short text excerpt rather than
+        the whole file. PDFs without extractable text (e.g. scans) are uploaded
+        to the Files API as before, and the upload is deleted afterwards.
+        The model is instructed to choose one of the existing folders if it is a
+        good match; only if none of them match should it propose a new one-word
+        subcategory.
+
+        Answers are cached by content hash, so a re-downloaded PDF is filed
+        without another upload or model call. Requests go through the
+        classification service (concurrency limit, rate limit, retries,
+        circuit breaker).
 
         Args:
             file_path (str or Path): Path to the PDF file
 
         Returns:
             Optional[str]: one-word subcategory or None
+
+        Raises:
+            ClassificationUnavailable: The API is unreachable; retry the file later
         """
         from pathlib import Path
-        import re
-        import json
 
         try:
             file_path = Path(file_path)
-            if not file_path.exists() or file_path.suffix.lower() != ".pdf":
+            if not file_path.exists() or not self.is_pdf(file_path):
                 return None
 
-            client = self._ensure_openai_client()
+            # Existing folder names in the Downloads/Documents directory
+            names, normalized_map = self.subfolders.snapshot()
+            existing_folders = list(names)
 
-            # Gather existing folder names in the Downloads/Documents directory
-            try:
-                existing_folders = [
-                    entry.name for entry in os.scandir(DOCUMENTS_FOLDER) if entry.is_dir()
-                ]
-            except Exception:
-                existing_folders = []
+            self.logger.debug("Existing folders: %s", existing_folders)
 
-            self.logger.info(f"Existing folders: {existing_folders}")
-            
-            # Upload the PDF to Files API
-            with open(file_path, "rb") as f:
-                uploaded = client.files.create(file=f, purpose="assistants")
-
-            existing_folders_json = json.dumps(existing_folders)
-            prompt = (
-                "You are organizing a PDF into a document subcategory. "
-                "First, consider the existing folders in the user's Downloads/Documents directory. "
-                f"existing_folders = {existing_folders_json}. "
-                "If one of these existing folder names is a good fit, return EXACTLY that folder name. "
-                "If none of them is appropriate, return a NEW one-word lowercase subcategory such as "
-                "'finance', 'tax', 'legal', 'invoice', 'receipt', 'insurance', 'education', 'medical', 'travel'. "
-                "Respond with ONLY the chosen subcategory string (no quotes, no punctuation, no explanation)."
-            )
+            content_hash = None
+            if self._cache is not None:
+                content_hash = file_digest(file_path)
+                cached = self._cache.get(content_hash, folders_fingerprint(existing_folders))
+                if cached:
+                    self.logger.debug("Classification cache hit for %s: %s", file_path.name, cached)
+                    metrics.inc("cache_hits_total")
+                    return cached
+                metrics.inc("cache_misses_total")
 
-            # Ask the model to classify using the uploaded file
-            response = client.responses.create(
-                model="gpt-4o-mini",
-                input=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "input_text", "text": prompt},
-                            {"type": "input_file", "file_id": uploaded.id},
-                        ],
-                    }
-                ],
-            )
+            excerpt = extract_pdf_text(file_path, PDF_TEXT_MAX_PAGES, PDF_TEXT_MAX_CHARS, PDF_TEXT_MAX_BYTES)
+            if excerpt is None:
+                # Not necessarily a scan, so uploading the whole (large) file is no answer
+                self.logger.info(
+                    "No text within the first %d bytes read of %s; filing it without a subcategory",
+                    PDF_TEXT_MAX_BYTES, file_path.name,
+                )
+                return None
+            candidate_raw = None
+            if excerpt:
+                candidate_raw, score = self._keywords.classify(excerpt, existing_folders)
+                if candidate_raw:
+                    metrics.inc("keyword_hits_total")
+                    self.logger.debug(
+                        "Keyword model classified %s as %s (score %.2f)", file_path.name, candidate_raw, score
+                    )
+            if not candidate_raw:
+                candidate_raw = self._service.call(
+                    self._request_subcategory, file_path, existing_folders, excerpt
+                )
 
-            # Extract plain text output
-            try:
-                text = response.output_text  # available in newer SDKs
-            except Exception:
-                # Fallback extraction for SDKs without output_text helper
-                text = ""
-                try:
-                    outputs = getattr(response, "output", []) or getattr(response, "outputs", [])
-                    if outputs:
-                        first = outputs[0]
-                        content = getattr(first, "content", [])
-                        if content and getattr(content[0], "type", "") in ("output_text", "text"):
-                            text = getattr(content[0], "text", "")
-                except Exception:
-                    text = ""
-
-            candidate_raw = (text or "").strip()
-            # Build a normalizer that matches our sanitization rules for comparison
-            def normalize(name: str) -> str:
-                name = name.strip().lower()
-                name = re.sub(r"[^a-z0-9]+", "-", name)
-                name = re.sub(r"-+", "-", name).strip('-')
-                return name
-
-            candidate_norm = normalize(candidate_raw)
+            candidate_norm = normalize_subcategory(candidate_raw or "")
             if not candidate_norm:
                 return None
 
             # Prefer an exact match to an existing folder (case-insensitive / normalized)
-            normalized_map = {normalize(x): x for x in existing_folders}
             if candidate_norm in normalized_map:
-                return normalized_map[candidate_norm]
+                subcategory = normalized_map[candidate_norm]
+            else:
+                # Otherwise, treat as a new (sanitized) one-word/phrase (hyphenated) subcategory
+                subcategory = candidate_norm
 
-            # Otherwise, treat as a new (sanitized) one-word/phrase (hyphenated) subcategory
-            return candidate_norm or None
+            if content_hash is not None:
+                # Key on the folder set as it will be after the move creates the
+                # subcategory, so the next identical download still hits
+                self._cache.put(
+                    content_hash,
+                    folders_fingerprint(existing_folders + [subcategory.lower()]),
+                    subcategory,
+                )
+            return subcategory
 
+        except ClassificationUnavailable:
+            # The API is down; let the caller park the file instead of filing it
+            raise
         except Exception as e:
             # Likely password-protected or unreadable, or API error
-            self.logger.warning(f"PDF classify failed for {file_path}: {type(e).__name__}: {str(e)}")
+            self.logger.warning("PDF classify failed for %s: %s: %s", file_path, type(e).__name__, e)
             return None
+
+    def _request_subcategory(self, file_path, existing_folders, excerpt=None) -> str:
+        """
+        Ask the model for a subcategory, sending the text excerpt when there is
+        one and uploading the file otherwise.
+
+        Args:
+            file_path (Path): Path to the PDF file
+            existing_folders (list): Existing Documents subfolder names
+            excerpt (str | None): Locally extracted text of the first pages
+
+        Returns:
+            str: Raw model answer (may be empty)
+        """
+        import json
+
+        client = self._ensure_openai_client()
+
+        existing_folders_json = json.dumps(existing_folders)
+        prompt = (
+            "You are organizing a PDF into a document subcategory. "
+            "First, consider the existing folders in the user's Downloads/Documents directory. "
+            f"existing_folders = {existing_folders_json}. "
+            "If one of these existing folder names is a good fit, return EXACTLY that folder name. "
+            "If none of them is appropriate, return a NEW one-word lowercase subcategory such as "
+            "'finance', 'tax', 'legal', 'invoice', 'receipt', 'insurance', 'education', 'medical', 'travel'. "
+            "Respond with ONLY the chosen subcategory string (no quotes, no punctuation, no explanation)."
+        )
+
+        uploaded = None
+        try:
+            if excerpt:
+                content = [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_text", "text": f"Text of the first pages of {file_path.name}:\n{excerpt}"},
+                ]
+            else:
+                # No extractable text (scanned or encrypted PDF): fall back to the Files API
+                with open(file_path, "rb") as f:
+                    uploaded = client.files.create(file=f, purpose="assistants")
+                content = [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_file", "file_id": uploaded.id},
+                ]
+
+            response = client.responses.create(
+                model="gpt-4o-mini",
+                input=[{"role": "user", "content": content}],
+            )
+        finally:
+            if uploaded is not None:
+                try:
+                    client.files.delete(uploaded.id)
+                except Exception as e:
+                    self.logger.warning("Could not delete uploaded file %s: %s", uploaded.id, e)
+
+        # Extract plain text output
+        try:
+            text = response.output_text  # available in newer SDKs
+        except Exception:
+            # Fallback extraction for SDKs without output_text helper
+            text = ""
+            try:
+                outputs = getattr(response, "output", []) or getattr(response, "outputs", [])
+                if outputs:
+                    first = outputs[0]
+                    content = getattr(first, "content", [])
+                    if content and getattr(content[0], "type", "") in ("output_text", "text"):
+                        text = getattr(content[0], "text", "")
+            except Exception:
+                text = ""
+
+        return (text or "").strip()
@@ -6,17 +6,159 @@ def _expand(path: str) -> str:
 # Base folder to watch (env var: WATCH_FOLDER)
 WATCH_FOLDER = _expand(os.getenv("WATCH_FOLDER", "~/Downloads"))
 
-# Derived folders from WATCH_FOLDER
-IMAGES_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Images"))
-DOCUMENTS_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Documents"))
-INSTALLERS_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Installers"))
-ARCHIVES_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Archives"))
-MEDIA_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Media"))
-MISC_FOLDER = _expand(os.path.join(WATCH_FOLDER, "Misc"))
+# Derived folders from WATCH_FOLDER; each can be pointed elsewhere, e.g. a NAS
+# mount (env vars: IMAGES_FOLDER, DOCUMENTS_FOLDER, ...)
+IMAGES_FOLDER = _expand(os.getenv("IMAGES_FOLDER", os.path.join(WATCH_FOLDER, "Images")))
+DOCUMENTS_FOLDER = _expand(os.getenv("DOCUMENTS_FOLDER", os.path.join(WATCH_FOLDER, "Documents")))
+INSTALLERS_FOLDER = _expand(os.getenv("INSTALLERS_FOLDER", os.path.join(WATCH_FOLDER, "Installers")))
+ARCHIVES_FOLDER = _expand(os.getenv("ARCHIVES_FOLDER", os.path.join(WATCH_FOLDER, "Archives")))
+MEDIA_FOLDER = _expand(os.getenv("MEDIA_FOLDER", os.path.join(WATCH_FOLDER, "Media")))
+MISC_FOLDER = _expand(os.getenv("MISC_FOLDER", os.path.join(WATCH_FOLDER, "Misc")))
+
+# Cross-device moves (category folder on another mount) are streamed, fsynced
+# and verified before the source is removed
+# (env vars: TRANSFER_MAX_BYTES_PER_SEC, 0 = unthrottled; TRANSFER_VERIFY, "hash" or "size")
+TRANSFER_MAX_BYTES_PER_SEC = int(os.getenv("TRANSFER_MAX_BYTES_PER_SEC", "0"))
+TRANSFER_VERIFY = os.getenv("TRANSFER_VERIFY", "hash")
+
+# Logging (env vars: LOG_LEVEL; LOG_FORMAT, "text" or "json"; LOG_ROTATION,
+# "size" or "time" (daily); LOG_MAX_BYTES and LOG_BACKUP_COUNT)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+# Internal state (caches, journals) lives in a hidden folder inside WATCH_FOLDER
+# so it travels with the organized tree (env var: STATE_FOLDER)
+STATE_FOLDER = _expand(os.getenv("STATE_FOLDER", os.path.join(WATCH_FOLDER, ".marie-kondo")))
+
+# PDF classification cache (env vars: CLASSIFICATION_CACHE_TTL_DAYS, CLASSIFICATION_CACHE_MAX_ENTRIES)
+CLASSIFICATION_CACHE_PATH = os.path.join(STATE_FOLDER, "classification_cache.sqlite")
+CLASSIFICATION_CACHE_TTL_DAYS = float(os.getenv("CLASSIFICATION_CACHE_TTL_DAYS", "90"))
+CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "50000"))
+
+# Journal of every move, used for crash recovery and `marie-kondo undo`
+# (env vars: JOURNAL_ENABLED, set to 0 to disable; JOURNAL_FLUSH_INTERVAL, seconds per group commit)
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "1") != "0"
+JOURNAL_PATH = os.path.join(STATE_FOLDER, "journal.sqlite")
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05"))
+
+# Deduplication of byte-identical files per destination folder
+# (env var: DEDUP_MODE; "off", "hardlink", "remove" or "quarantine" into DUPLICATES_FOLDER)
+DEDUP_MODE = os.getenv("DEDUP_MODE", "off")
+DEDUP_INDEX_PATH = os.path.join(STATE_FOLDER, "dedup_index.sqlite")
+DUPLICATES_FOLDER = _expand(os.getenv("DUPLICATES_FOLDER", os.path.join(WATCH_FOLDER, "Duplicates")))
+
+# Layout inside each category folder (env vars: SHARD_LAYOUT, "flat" puts every
+# file directly in the category folder, "date" uses <category>/YYYY/MM by
+# modification time, "hash" 256 folders by a hash of the file name;
+# SHARD_MAX_ENTRIES, entries per leaf folder before it spills into <leaf>-2, 0 = no cap)
+SHARD_LAYOUT = os.getenv("SHARD_LAYOUT", "flat")
+SHARD_MAX_ENTRIES = int(os.getenv("SHARD_MAX_ENTRIES", "10000"))
+# With a sharded layout the watcher moves files still lying directly in category
+# folders into it in the background, at most this many per second
+# (env var: REBALANCE_MAX_FILES_PER_SEC, 0 disables)
+REBALANCE_MAX_FILES_PER_SEC = float(os.getenv("REBALANCE_MAX_FILES_PER_SEC", "50"))
+
+# Local PDF text extraction before asking OpenAI
+# (env vars: PDF_TEXT_MAX_PAGES, PDF_TEXT_MAX_CHARS, PDF_TEXT_MAX_BYTES).
+# The reader stops after PDF_TEXT_MAX_BYTES bytes read, however large the
+# PDF (0 = no limit); a PDF whose first pages are not within it is filed
+# without a subcategory rather than uploaded.
+PDF_TEXT_MAX_PAGES = int(os.getenv("PDF_TEXT_MAX_PAGES", "3"))
+PDF_TEXT_MAX_CHARS = int(os.getenv("PDF_TEXT_MAX_CHARS", "6000"))
+PDF_TEXT_MAX_BYTES = int(os.getenv("PDF_TEXT_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# OpenAI request limits (env vars: OPENAI_MAX_IN_FLIGHT, OPENAI_RATE_LIMIT,
+# OPENAI_MAX_RETRIES, OPENAI_TIMEOUT, OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_RESET).
+# Set OPENAI_BASE_URL to point the SDK at a local fake server for testing.
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "4"))
+OPENAI_RATE_LIMIT = float(os.getenv("OPENAI_RATE_LIMIT", "2"))  # requests per second, 0 = unlimited
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))
+OPENAI_BREAKER_RESET = float(os.getenv("OPENAI_BREAKER_RESET", "60"))
+# Seconds between retries of PDFs parked while the API was unavailable
+# (env var: CLASSIFY_RETRY_INTERVAL)
+CLASSIFY_RETRY_INTERVAL = float(os.getenv("CLASSIFY_RETRY_INTERVAL", "120"))
+
+# Worker pool sizing (env vars: FAST_WORKERS, SLOW_WORKERS, QUEUE_MAXSIZE)
+# The fast lane handles extension-based moves, the slow lane PDF classification.
+FAST_WORKERS = int(os.getenv("FAST_WORKERS", "4"))
+SLOW_WORKERS = int(os.getenv("SLOW_WORKERS", "4"))
+QUEUE_MAXSIZE = int(os.getenv("QUEUE_MAXSIZE", "10000"))
+# Seconds between queue depth log lines (env var: QUEUE_REPORT_INTERVAL, 0 disables)
+QUEUE_REPORT_INTERVAL = float(os.getenv("QUEUE_REPORT_INTERVAL", "30"))
+
+# Seconds a file's size and mtime must stay unchanged before it is processed
+# (env var: SETTLE_SECONDS)
+SETTLE_SECONDS = float(os.getenv("SETTLE_SECONDS", "2"))
+# Files waiting to settle before new events are held back; while the lanes are
+# full the settler cannot hand files on, so this is where backpressure reaches
+# the observer (env var: SETTLE_MAX_PENDING, 0 = no limit)
+SETTLE_MAX_PENDING = int(os.getenv("SETTLE_MAX_PENDING", "50000"))
+# In-progress download suffixes; such files are held until renamed to their final name
+TEMP_DOWNLOAD_SUFFIXES = (".crdownload", ".part", ".partial", ".download", ".opdownload", ".tmp")
+
+# File whatever is already in WATCH_FOLDER when the watcher starts
+# (env var: RECONCILE_ON_STARTUP, set to 0 to disable)
+RECONCILE_ON_STARTUP = os.getenv("RECONCILE_ON_STARTUP", "1") != "0"
+
+# Optional JSON file listing several folders to watch, each with its own rules and
+# destination root (env var: WATCH_ROOTS_FILE). When unset only WATCH_FOLDER is
+# watched. Example:
+# [{"path": "~/Downloads"},
+#  {"path": "/srv/drop", "recursive": true, "dest_root": "/srv/sorted",
+#   "organize_rules": {"Images": [".jpg"]}, "name_rules": [["glob:scan*", "Documents"]]}]
+WATCH_ROOTS_FILE = os.getenv("WATCH_ROOTS_FILE", "")
+
+# How changes are detected (env var: WATCH_BACKEND): "native" uses inotify/FSEvents/...,
+# "polling" rescans folders whose mtime changed, for NFS/SMB mounts without native
+# events. Roots in WATCH_ROOTS_FILE can set "backend" individually.
+WATCH_BACKEND = os.getenv("WATCH_BACKEND", "native")
+# Poll interval bounds in seconds; it backs off while nothing changes
+# (env vars: POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "30"))
+# Folder snapshot kept by the polling backend so restarts do not re-diff everything
+POLL_SNAPSHOT_PATH = os.path.join(STATE_FOLDER, "poll_snapshot.json")
+
+# Prometheus text metrics on http://METRICS_HOST:METRICS_PORT/metrics (env vars:
+# METRICS_PORT, 0 disables; METRICS_HOST) and a summary log line every
+# METRICS_SUMMARY_INTERVAL seconds (0 disables)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", "300"))
+
 ORGANIZE_RULES = {
     "Images": [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".ico", ".webp"],
     "Documents": [".pdf", ".doc", ".docx", ".txt", ".xls", ".xlsx", ".ppt", ".pptx"],
     "Installers": [".exe", ".dmg", ".pkg", ".deb", ".rpm", ".msi", ".app"],
-    "Archives": [".zip", ".tar", ".gz", ".bz2", ".rar", ".7z"],
-    "Media": [".mp3",".mp4",".wav", ".m4a", ".aac", ".ogg", ".flac", ".wma", ".aiff", ".m4b", ".m4p", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b", ".m4r", ".m4v", ".m4p", ".m4b"]
+    "Archives": [".zip", ".tar", ".gz", ".bz2", ".rar", ".7z", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz"],
+    "Media": [".mp3", ".mp4", ".wav", ".m4a", ".aac", ".ogg", ".flac", ".wma", ".aiff", ".m4b", ".m4p", ".m4r", ".m4v"]
 }
+
+# Name rules checked before extensions: (pattern, category), where pattern is
+# "glob:<glob>" or "re:<regex>" matched case-insensitively against the file name.
+# Example: ("glob:Screenshot*", "Images")
+NAME_RULES = []
+
+# Size rules checked before extensions: (min_bytes, max_bytes or None, category).
+# Example: (4 * 1024 ** 3, None, "Media") to send files of 4 GiB and more to Media
+SIZE_RULES = []
+
+# Optional rules file (.toml, .yaml or .json) with "organize_rules", "name_rules"
+# and "size_rules"; keys it sets replace the defaults above. The watcher reloads it
+# when it changes, without a restart (env vars: RULES_FILE; RULES_RELOAD_INTERVAL,
+# seconds between checks, 0 loads it once)
+RULES_FILE = os.getenv("RULES_FILE", "")
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "2"))
+
+# Content sniffing: files without an extension that no rule matches are
+# identified by their first bytes. Extensions in SNIFF_EXTENSIONS say nothing
+# about the content and are sniffed too, even when a rule lists them; files
+# with any other unlisted extension go to Misc unread.
+SNIFF_ENABLED = os.getenv("SNIFF_ENABLED", "1") != "0"
+SNIFF_BYTES = int(os.getenv("SNIFF_BYTES", "4096"))
+SNIFF_EXTENSIONS = [".bin", ".dat", ".file", ".data"]
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Content-hash index for detecting byte-identical files in destination folders.
+"""
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from hashing import file_digest
+from logger import setup_logging
+
+PARTIAL_HASH_BYTES = 64 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    partial_hash TEXT,
+    full_hash TEXT,
+    mtime_ns INTEGER,
+    ino INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_folder_size ON files (folder, size);
+CREATE TABLE IF NOT EXISTS seeded_folders (
+    folder TEXT PRIMARY KEY
+);
+"""
+
+
+class DuplicateIndex:
+    """
+    Persistent index of file sizes and content hashes per destination folder.
+
+    Lookups are staged so most files pay nothing: a file whose size is unique
+    in the folder is never hashed; same-size candidates are compared by a
+    hash of the first 64 KiB, and only partial matches get a full hash.
+    Hashes of indexed files are computed lazily, once, and stored.
+
+    Each row also keeps the file's mtime and inode. Candidates are stat()ed
+    before their stored hashes are trusted, and rehashed when the file was
+    changed in place; unchanged() repeats that check right before a
+    duplicate is acted on.
+    """
+
+    def __init__(self, db_path, logger=None):
+        """
+        Args:
+            db_path (str): Path to the SQLite file
+            logger: Logger instance to use for logging
+        """
+        self.logger = logger or setup_logging()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column in ("mtime_ns", "ino"):
+            if column not in columns:
+                # Index from an older version; its rows are re-validated on use
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+        self._lock = threading.Lock()
+
+    def find_duplicate(self, file_path, dest_folder, size, hashes=None, descend=None):
+        """
+        Find an indexed file in dest_folder with the same content as file_path.
+
+        Args:
+            file_path (Path): Incoming file
+            dest_folder (Path): Destination folder to search
+            size (int): Size of the incoming file
+            hashes (dict | None): Hashes of the incoming file computed earlier
+                (e.g. by a batch worker process); missing ones are computed
+            descend (callable | None): Subfolder names for which descend(name)
+                is true belong to dest_folder too (shard folders of a sharded
+                layout); record() such files with folder=dest_folder
+
+        Returns:
+            tuple: (duplicate Path or None, hashes dict to pass to record())
+        """
+        folder = str(dest_folder)
+        self._seed(folder, descend)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, partial_hash, full_hash, mtime_ns, ino FROM files "
+                "WHERE folder = ? AND size = ?",
+                (folder, size),
+            ).fetchall()
+        hashes = dict(hashes or {})
+        rows = [row for row in (self._validate(size, *row) for row in rows) if row is not None]
+        if not rows:
+            return None, hashes
+
+        if hashes.get("partial_hash") is None:
+            hashes["partial_hash"] = file_digest(file_path, limit=PARTIAL_HASH_BYTES)
+        partial_matches = []
+        for path, partial, full in rows:
+            if partial is None:
+                partial = self._hash_indexed(path, "partial_hash")
+                if partial is None:
+                    continue
+            if partial == hashes["partial_hash"]:
+                partial_matches.append((path, full))
+        if not partial_matches:
+            return None, hashes
+
+        if hashes.get("full_hash") is None:
+            hashes["full_hash"] = file_digest(file_path)
+        for path, full in partial_matches:
+            if full is None:
+                full = self._hash_indexed(path, "full_hash")
+            if full == hashes["full_hash"]:
+                return Path(path), hashes
+        return None, hashes
+
+    def record(self, dest_path, size, partial_hash=None, full_hash=None, folder=None):
+        """
+        Add a placed file to the index.
+
+        Args:
+            dest_path (Path): Final path of the file
+            size (int): File size
+            partial_hash (str | None): Already computed partial hash
+            full_hash (str | None): Already computed full hash
+            folder (Path | None): Folder it is looked up under; defaults to
+                its parent folder
+        """
+        try:
+            st = os.stat(dest_path)
+            mtime_ns, ino = st.st_mtime_ns, st.st_ino
+        except OSError:
+            mtime_ns = ino = None  # Validated (and dropped) on first use
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, folder, size, partial_hash, full_hash, mtime_ns, ino) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(dest_path), str(folder or Path(dest_path).parent), size,
+                    partial_hash, full_hash, mtime_ns, ino,
+                ),
+            )
+
+    def unchanged(self, path):
+        """
+        Return True if an indexed file still has the size, mtime and inode
+        recorded when its hashes were computed. Checked right before a
+        duplicate is removed or linked to.
+        """
+        path = str(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, ino FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return row is not None and row == (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def moved(self, old_path, new_path):
+        """
+        Follow an indexed file that was moved within its folder's tree.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE files SET path = ? WHERE path = ?", (str(new_path), str(old_path)))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _validate(self, size, path, partial, full, mtime_ns, ino):
+        """
+        Check an indexed file against the disk before its hashes are used.
+
+        Returns:
+            tuple | None: (path, partial_hash, full_hash), with the hashes
+            cleared if the file changed in place; None if it is gone or no
+            longer has the wanted size (its row is updated or dropped)
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            return None
+        if (st.st_mtime_ns, st.st_ino) == (mtime_ns, ino) and st.st_size == size:
+            return path, partial, full
+        # Edited or replaced since it was indexed: the stored hashes are stale
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, ino = ?, partial_hash = NULL, full_hash = NULL "
+                "WHERE path = ?",
+                (st.st_size, st.st_mtime_ns, st.st_ino, path),
+            )
+        if st.st_size != size:
+            return None
+        return path, None, None
+
+    def _hash_indexed(self, path, column):
+        """
+        Compute and store a hash for an indexed file; drop the row if it is gone.
+        """
+        try:
+            if column == "partial_hash":
+                digest = file_digest(path, limit=PARTIAL_HASH_BYTES)
+            else:
+                digest = file_digest(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            return None
+        with self._lock:
+            self._conn.execute(f"UPDATE files SET {column} = ? WHERE path = ?", (digest, path))
+        return digest
+
+    def _seed(self, folder, descend=None):
+        """
+        Index the sizes of a folder's existing files the first time it is used,
+        including those in subfolders accepted by descend.
+        """
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM seeded_folders WHERE folder = ?", (folder,)
+            ).fetchone():
+                return
+            rows = []
+            pending = [folder]
+            while pending:
+                try:
+                    with os.scandir(pending.pop()) as entries:
+                        for entry in entries:
+                            if entry.is_file(follow_symlinks=False):
+                                st = entry.stat(follow_symlinks=False)
+                                rows.append((entry.path, folder, st.st_size, st.st_mtime_ns, st.st_ino))
+                            elif descend is not None and descend(entry.name) and entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                except FileNotFoundError:
+                    pass
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO files (path, folder, size, mtime_ns, ino) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("INSERT INTO seeded_folders (folder) VALUES (?)", (folder,))
+            self._conn.execute("COMMIT")
+        self.logger.debug("Indexed %d existing file(s) in %s for deduplication", len(rows), folder)
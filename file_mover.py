@@ -3,28 +3,54 @@
 File mover for organizing files into category folders.
 """
 
-import shutil
+import os
 from pathlib import Path
+from time import perf_counter, time
 from config import (
     IMAGES_FOLDER, DOCUMENTS_FOLDER, INSTALLERS_FOLDER, 
-    ARCHIVES_FOLDER, MEDIA_FOLDER, MISC_FOLDER
+    ARCHIVES_FOLDER, MEDIA_FOLDER, MISC_FOLDER,
+    TRANSFER_MAX_BYTES_PER_SEC, TRANSFER_VERIFY,
+    DEDUP_MODE, DEDUP_INDEX_PATH, DUPLICATES_FOLDER,
+    SHARD_LAYOUT, SHARD_MAX_ENTRIES
 )
 from logger import setup_logging
+from layout import ShardLayout
+from name_index import DestinationNameIndex
+from transfer import Transfer
+from dedup import DuplicateIndex
+from journal import get_journal, DONE, FAILED
+from metrics import registry as metrics
+
+# Counter labels by category, built once instead of per moved file
+_CATEGORY_LABELS = {}
+_MOVED_COUNTERS = ("files_moved_total", "bytes_moved_total")
+_TRANSFER_STAGES = ("name_reserve", "transfer")
 
 class FileMover:
     """
     Handles moving files to their appropriate category folders.
     """
     
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, dedup_mode=None, journal=None, category_folders=None,
+                 subfolders=None, layout=None):
         """
         Initialize the file mover.
         
         Args:
             logger: Logger instance to use for logging
+            dedup_mode (str): "off", "hardlink", "remove" or "quarantine";
+                defaults to DEDUP_MODE from config.py
+            journal (MoveJournal): Journal to record moves in; defaults to the
+                shared journal (None when JOURNAL_ENABLED is off)
+            category_folders (dict): Category -> destination folder; defaults to
+                the *_FOLDER settings from config.py
+            subfolders (SubfolderIndex): Index of Documents subfolders to tell
+                about the subcategory folders this mover creates
+            layout (ShardLayout): Layout inside each destination folder;
+                defaults to SHARD_LAYOUT and SHARD_MAX_ENTRIES from config.py
         """
         self.logger = logger or setup_logging()
-        self.category_folders = {
+        self.category_folders = category_folders or {
             "Images": IMAGES_FOLDER,
             "Documents": DOCUMENTS_FOLDER,
             "Installers": INSTALLERS_FOLDER,
@@ -32,6 +58,24 @@ class FileMover:
             "Media": MEDIA_FOLDER,
             "Misc": MISC_FOLDER
         }
+        self.documents_folder = Path(self.category_folders.get("Documents", DOCUMENTS_FOLDER))
+        self.subfolders = subfolders
+        self.layout = layout or ShardLayout(SHARD_LAYOUT, SHARD_MAX_ENTRIES)
+        self.names = DestinationNameIndex(self.logger)
+        self.transfer = Transfer(
+            max_bytes_per_sec=TRANSFER_MAX_BYTES_PER_SEC,
+            verify=TRANSFER_VERIFY,
+            logger=self.logger,
+        )
+        self.journal = journal or get_journal()
+        self.dedup_mode = dedup_mode or DEDUP_MODE
+        self._dedup_label = ("mode", self.dedup_mode)
+        self.duplicates_folder = Path(DUPLICATES_FOLDER)
+        self.dedup = None
+        if self.dedup_mode != "off":
+            self.dedup = DuplicateIndex(DEDUP_INDEX_PATH, self.logger)
+            if self.dedup_mode == "quarantine":
+                self.duplicates_folder.mkdir(parents=True, exist_ok=True)
         self._ensure_folders_exist()
     
     def _ensure_folders_exist(self):
@@ -40,8 +84,21 @@ class FileMover:
         """
         for folder_path in self.category_folders.values():
             Path(folder_path).mkdir(parents=True, exist_ok=True)
-            self.logger.debug(f"Ensured folder exists: {folder_path}")
+            self.logger.debug("Ensured folder exists: %s", folder_path)
     
+    def with_folders(self, category_folders):
+        """
+        Return a mover for new category folders (e.g. after a rules reload)
+        that shares this one's journal, name index and duplicate index.
+        """
+        import copy
+
+        mover = copy.copy(self)
+        mover.category_folders = category_folders
+        mover.documents_folder = Path(category_folders.get("Documents", DOCUMENTS_FOLDER))
+        mover._ensure_folders_exist()
+        return mover
+
     def move_file(self, file_path, classification):
         """
         Move a file to its appropriate category folder.
@@ -53,39 +110,35 @@ class FileMover:
         Returns:
             bool: True if move was successful, False otherwise
         """
-        self.logger.info(f"Moving file: {file_path} to {classification}")
+        self.logger.debug("Moving file: %s to %s", file_path, classification)
         try:
             file_path = Path(file_path)
             
             if not file_path.exists():
-                self.logger.error(f"File does not exist: {file_path}")
+                self.logger.error("File does not exist: %s", file_path)
                 return False
             
             # Get destination folder
             dest_folder = self.category_folders.get(classification)
             if not dest_folder:
-                self.logger.error(f"Unknown classification: {classification}")
+                self.logger.error("Unknown classification: %s", classification)
                 return False
             
-            dest_path = Path(dest_folder) / file_path.name
-            
-            # Handle filename conflicts
-            dest_path = self._get_unique_filename(dest_path)
+            # Move the file under a collision-free name
+            dest_path = self._place(file_path, Path(dest_folder), classification)
             
-            # Move the file
-            shutil.move(str(file_path), str(dest_path))
-            
-            self.logger.info(f"Moved {file_path.name} to {dest_path}")
+            self.logger.info("Moved %s to %s", file_path.name, dest_path)
             return True
             
         except Exception as e:
-            self.logger.error(f"Error moving file {file_path}: {str(e)}")
+            self.logger.error("Error moving file %s: %s", file_path, e)
+            metrics.inc("move_failures_total")
             return False
 
     def move_document_to_subcategory(self, file_path, subcategory: str | None) -> bool:
         """
-        Move a document to a subcategory under DOCUMENTS_FOLDER when provided.
-        If subcategory is None, move directly into DOCUMENTS_FOLDER.
+        Move a document to a subcategory under the Documents folder when provided.
+        If subcategory is None, move directly into the Documents folder.
 
         Args:
             file_path (str or Path): Path to the file
@@ -97,45 +150,259 @@ class FileMover:
         try:
             file_path = Path(file_path)
             if not file_path.exists():
-                self.logger.error(f"File does not exist: {file_path}")
+                self.logger.error("File does not exist: %s", file_path)
                 return False
 
             if subcategory:
-                dest_folder = Path(DOCUMENTS_FOLDER) / subcategory.lower()
+                dest_folder = self.documents_folder / subcategory.lower()
             else:
-                dest_folder = Path(DOCUMENTS_FOLDER)
+                dest_folder = self.documents_folder
 
             dest_folder.mkdir(parents=True, exist_ok=True)
-            dest_path = dest_folder / file_path.name
-            dest_path = self._get_unique_filename(dest_path)
-            shutil.move(str(file_path), str(dest_path))
-            self.logger.info(f"Moved {file_path.name} to {dest_path}")
+            if subcategory and self.subfolders is not None:
+                self.subfolders.add(dest_folder.name)
+            category = f"Documents/{subcategory.lower()}" if subcategory else "Documents"
+            dest_path = self._place(file_path, dest_folder, category)
+            self.logger.info("Moved %s to %s", file_path.name, dest_path)
             return True
         except Exception as e:
-            self.logger.error(f"Error moving document {file_path}: {str(e)}")
+            self.logger.error("Error moving document %s: %s", file_path, e)
+            metrics.inc("move_failures_total")
             return False
     
-    def _get_unique_filename(self, dest_path):
+    def move_to(self, file_path, dest_folder, category=None, hashes=None):
         """
-        Generate a unique filename if the destination already exists.
-        
+        Move a file into an explicit destination folder, e.g. one chosen by a
+        batch plan.
+
         Args:
-            dest_path (Path): Original destination path
-            
+            file_path (str or Path): Path to the file to move
+            dest_folder (str or Path): Destination folder (created if missing)
+            category (str | None): Category recorded in the journal and metrics
+            hashes (dict | None): Content hashes computed earlier, reused by
+                the duplicate check
+
         Returns:
-            Path: Unique destination path
+            Path | None: Final destination path, or None if the move failed
         """
-        if not dest_path.exists():
+        try:
+            file_path = Path(file_path)
+            dest_folder = Path(dest_folder)
+            dest_folder.mkdir(parents=True, exist_ok=True)
+            dest_path = self._place(file_path, dest_folder, category, hashes)
+            self.logger.info("Moved %s to %s", file_path.name, dest_path)
             return dest_path
-        
-        counter = 1
+        except Exception as e:
+            self.logger.error("Error moving file %s: %s", file_path, e)
+            metrics.inc("move_failures_total")
+            return None
+
+    def _place(self, file_path, dest_folder, category=None, hashes=None):
+        """
+        Move a file into a folder under a unique name without ever overwriting.
+
+        The file goes into the leaf folder the shard layout picks inside
+        dest_folder (dest_folder itself when flat). The name is claimed
+        through the destination name index (O(1), no exists() probing) and
+        the file is renamed (or, across devices, copied) over the claimed
+        placeholder. With deduplication enabled, files whose content already
+        exists anywhere in dest_folder's tree are handled first. Every
+        placement is recorded in the move journal.
+
+        Args:
+            file_path (Path): File to move
+            dest_folder (Path): Destination folder
+            category (str | None): Category recorded in the journal
+            hashes (dict | None): Content hashes computed earlier
+
+        Returns:
+            Path: Final destination path (or the existing duplicate when removed)
+        """
+        src_stat = os.stat(file_path)
+        hashes = hashes or {}
+        leaf = self.layout.folder_for(dest_folder, file_path.name, src_stat.st_mtime, self.names)
+        if leaf != dest_folder:
+            leaf.mkdir(parents=True, exist_ok=True)
+        if self.dedup is not None:
+            with metrics.timer("dedup"):
+                duplicate, hashes = self.dedup.find_duplicate(
+                    file_path, dest_folder, src_stat.st_size, hashes, self.layout.is_shard
+                )
+            if duplicate is not None and not self.dedup.unchanged(duplicate):
+                # Edited between hashing and now; never remove or link against it
+                self.logger.warning("%s changed while checking for duplicates; filing normally", duplicate)
+                duplicate = None
+            if duplicate is not None:
+                metrics.inc("duplicates_total", label=self._dedup_label)
+                return self._place_duplicate(
+                    file_path, duplicate, leaf, src_stat, hashes, category, dest_folder
+                )
+
+        dest_path = self._transfer(file_path, leaf, src_stat, category, hashes.get("full_hash"))
+        if self.dedup is not None:
+            self.dedup.record(dest_path, src_stat.st_size, folder=dest_folder, **hashes)
+        label = _CATEGORY_LABELS.get(category)
+        if label is None:
+            # Subcategories would make the label set unbounded
+            label = _CATEGORY_LABELS[category] = ("category", (category or "").split("/", 1)[0])
+        metrics.inc_pair(_MOVED_COUNTERS, src_stat.st_size, label)
+        return dest_path
+
+    def _transfer(self, file_path, dest_folder, src_stat, category, content_hash, action="move"):
+        """
+        Claim a name in dest_folder and move the file there, journaled.
+        """
+        dest_path, entry, reserved = self._reserve(
+            file_path, dest_folder, action, category, content_hash
+        )
+        try:
+            # A rename on the same device, a verified streaming copy otherwise
+            started = perf_counter()
+            copied = self.transfer.move(file_path, dest_path, src_stat)
+            # Both stages in one update; failed moves are not timed
+            metrics.observe_pair(_TRANSFER_STAGES, reserved, perf_counter() - started)
+            if copied:
+                metrics.inc("bytes_copied_total", copied)
+        except Exception:
+            self.names.release(dest_path)
+            self._journal_finish(entry, FAILED)
+            raise
+        self._journal_finish(entry, DONE)
+        return dest_path
+
+    def _place_duplicate(self, file_path, duplicate, dest_folder, src_stat, hashes, category=None,
+                         index_folder=None):
+        """
+        Handle a file whose content already exists in the destination folder,
+        according to DEDUP_MODE.
+
+        Args:
+            file_path (Path): Incoming file
+            duplicate (Path): Existing file with identical content
+            dest_folder (Path): Destination (leaf) folder
+            src_stat (os.stat_result): Stat of the incoming file
+            hashes (dict): Hashes computed while looking for the duplicate
+            category (str | None): Category recorded in the journal
+            index_folder (Path | None): Folder the duplicate index files it
+                under; defaults to dest_folder
+
+        Returns:
+            Path: Where the content now lives for this file
+        """
+        self.logger.info("%s is a duplicate of %s", file_path.name, duplicate)
+        content_hash = hashes.get("full_hash")
+        if self.dedup_mode == "remove":
+            entry = self._journal_begin(file_path, duplicate, "remove", category, content_hash)
+            file_path.unlink()
+            self._journal_finish(entry, DONE)
+            return duplicate
+
+        if self.dedup_mode == "quarantine":
+            return self._transfer(
+                file_path, self.duplicates_folder, src_stat, category, content_hash, "quarantine"
+            )
+
+        # hardlink: keep the name in the destination, share the existing data
+        dest_path, entry, _ = self._reserve(file_path, dest_folder, "link", category, content_hash)
+        link_path = dest_path.with_name(f".{dest_path.name}.mk-link")
+        try:
+            os.link(duplicate, link_path)
+            os.replace(link_path, dest_path)
+        except OSError as e:
+            self.logger.warning("Could not hard-link %s (%s), moving instead", file_path.name, e)
+            try:
+                link_path.unlink()
+            except FileNotFoundError:
+                pass
+            try:
+                self.transfer.move(file_path, dest_path, src_stat)
+            except Exception:
+                self.names.release(dest_path)
+                self._journal_finish(entry, FAILED)
+                raise
+        else:
+            file_path.unlink()
+        self._journal_finish(entry, DONE)
+        self.dedup.record(dest_path, src_stat.st_size, folder=index_folder, **hashes)
+        return dest_path
+
+    def rebalance(self, file_path, base_folder, settle_seconds=0.0):
+        """
+        Move a file lying directly in a destination folder into the leaf
+        folder the shard layout picks for it.
+
+        Args:
+            file_path (Path): File directly inside base_folder
+            base_folder (Path): Category or Documents subcategory folder
+            settle_seconds (float): Leave files modified this recently alone
+
+        Returns:
+            Path | None: New path, or None if the file stays where it is
+        """
+        try:
+            src_stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        if time() - src_stat.st_mtime < settle_seconds:
+            return None
+        leaf = self.layout.folder_for(base_folder, file_path.name, src_stat.st_mtime, self.names)
+        if leaf == base_folder:
+            return None
+        try:
+            leaf.mkdir(parents=True, exist_ok=True)
+            dest_path, entry, _ = self._reserve(file_path, leaf, "rebalance", None, None)
+        except OSError as e:
+            self.logger.error("Cannot rebalance %s: %s", file_path, e)
+            return None
+        try:
+            # Same tree, so a rename over the placeholder; never a copy
+            os.replace(file_path, dest_path)
+        except OSError as e:
+            self.names.release(dest_path)
+            self._journal_finish(entry, FAILED)
+            self.logger.warning("Cannot rebalance %s: %s", file_path, e)
+            return None
+        self._journal_finish(entry, DONE)
+        self.names.discard(file_path)
+        if self.dedup is not None:
+            self.dedup.moved(file_path, dest_path)
+        metrics.inc("rebalanced_total")
+        self.logger.debug("Rebalanced %s to %s", file_path.name, dest_path)
+        return dest_path
+
+    def _reserve(self, file_path, dest_folder, action, category, content_hash):
+        """
+        Claim a name in dest_folder, journaling it before the placeholder is
+        created so recovery after a crash can always remove the placeholder.
+
+        Returns:
+            tuple: (claimed path, journal entry, seconds spent on the name index)
+        """
+        elapsed = 0.0
         while True:
-            stem = dest_path.stem
-            suffix = dest_path.suffix
-            new_name = f"{stem}_{counter}{suffix}"
-            new_path = dest_path.parent / new_name
-            
-            if not new_path.exists():
-                return new_path
-            
-            counter += 1 
\ No newline at end of file
+            started = perf_counter()
+            dest_path = self.names.pick(dest_folder, file_path.name)
+            elapsed += perf_counter() - started
+            entry = self._journal_begin(file_path, dest_path, action, category, content_hash)
+            started = perf_counter()
+            try:
+                self.names.claim(dest_path)
+            except FileExistsError:
+                # Created behind our back; pick() keeps it taken, try the next name
+                self._journal_finish(entry, FAILED)
+                elapsed += perf_counter() - started
+                continue
+            except OSError:
+                self.names.release(dest_path)
+                self._journal_finish(entry, FAILED)
+                raise
+            return dest_path, entry, elapsed + perf_counter() - started
+
+    def _journal_begin(self, src, dest, action, category, content_hash):
+        if self.journal is None:
+            return None
+        return self.journal.begin(src, dest, action, category, content_hash)
+
+    def _journal_finish(self, entry, status):
+        if entry is not None:
+            self.journal.finish(entry, status)
@@ -1,115 +1,482 @@
 #!/usr/bin/env python3
 """
-File watcher for monitoring a folder.
+File watcher for monitoring one or more inbox folders.
 """
 
+import os
+import threading
 import time
 from pathlib import Path
-from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from logger import setup_logging
 from classifier import FileClassifier
 from file_mover import FileMover
+from pipeline import EventPipeline
+from settle import SettleScheduler
+from classification_service import ClassificationUnavailable, RetryQueue
+from reconcile import iter_backlog
+from metrics import registry as metrics, start_metrics_server, SummaryReporter
+from roots import as_roots, load_watch_roots, excluded_folders
+from rules import compile_rules, RulesFile
+from layout import Rebalancer
+from config import (
+    FAST_WORKERS, SLOW_WORKERS, QUEUE_MAXSIZE, QUEUE_REPORT_INTERVAL,
+    SETTLE_SECONDS, SETTLE_MAX_PENDING, TEMP_DOWNLOAD_SUFFIXES, CLASSIFY_RETRY_INTERVAL,
+    RECONCILE_ON_STARTUP,
+    POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_SNAPSHOT_PATH,
+    METRICS_PORT, METRICS_HOST, METRICS_SUMMARY_INTERVAL, RULES_FILE, RULES_RELOAD_INTERVAL,
+    SHARD_LAYOUT, REBALANCE_MAX_FILES_PER_SEC
+)
+
+_CREATED, _MODIFIED, _MOVED = ("type", "created"), ("type", "modified"), ("type", "moved")
+
+
+class _RootContext:
+    """
+    Classifier and mover bound to one watch root's rules and destinations.
+    """
+    __slots__ = ("root", "classifier", "file_mover")
+
+    def __init__(self, root, classifier, file_mover):
+        self.root = root
+        self.classifier = classifier
+        self.file_mover = file_mover
+
 
 class FilesWatcher(FileSystemEventHandler):
     """
-    File system event handler for monitoring a folder.
+    File system event handler for monitoring one or more watch roots.
+
+    One instance is scheduled on every root of a shared observer; events are
+    routed to the root that owns the path, while the settle scheduler, worker
+    pipeline and classification service are shared by all roots.
     """
     
-    def __init__(self, folder_path, logger=None):
+    def __init__(self, roots, logger=None, pipeline=None):
         """
-        Initialize the watcher with the folder path.
+        Initialize the watcher with its watch roots.
         
         Args:
-            folder_path (str): Path to the folder
+            roots (str, Path, WatchRoot or list): Folder(s) to watch
             logger: Logger instance to use for logging
+            pipeline (EventPipeline): Worker pipeline to queue files on; one is
+                created from config when omitted
         """
-        self.folder_path = Path(folder_path)
+        self.roots = as_roots(roots)
         self.logger = logger or setup_logging()
-        self.classifier = FileClassifier()
-        self.file_mover = FileMover()
-        self.logger.info(f"Initialized Folder watcher for: {self.folder_path}")
+        contexts = []
+        shared = None
+        for root in self.roots:
+            classifier = FileClassifier(
+                self.logger,
+                cache=shared._cache if shared else None,
+                service=shared._service if shared else None,
+                rules=compile_rules(root.organize_rules, root.name_rules, root.size_rules, self.logger),
+                documents_folder=root.category_folders["Documents"],
+            )
+            shared = shared or classifier
+            mover = FileMover(
+                self.logger, category_folders=root.category_folders, subfolders=classifier.subfolders
+            )
+            contexts.append(_RootContext(root, classifier, mover))
+        self._route(contexts)
+        self._rules_lock = threading.Lock()
+        self._inflight = set()
+        self._inflight_lock = threading.Lock()
+        self.pipeline = pipeline or EventPipeline(
+            self._process_item,
+            fast_workers=FAST_WORKERS,
+            slow_workers=SLOW_WORKERS,
+            maxsize=QUEUE_MAXSIZE,
+            report_interval=QUEUE_REPORT_INTERVAL,
+            logger=self.logger,
+        )
+        self.settler = SettleScheduler(
+            self.enqueue,
+            settle_seconds=SETTLE_SECONDS,
+            temp_suffixes=TEMP_DOWNLOAD_SUFFIXES,
+            max_pending=SETTLE_MAX_PENDING,
+            logger=self.logger,
+        )
+        self.retry_queue = RetryQueue(self.enqueue, CLASSIFY_RETRY_INTERVAL, self.logger)
+        # Migrates flat category folders into the shard layout whenever the lanes are idle
+        self.rebalancer = Rebalancer(
+            lambda: [ctx.file_mover for ctx in self._contexts],
+            max_per_second=REBALANCE_MAX_FILES_PER_SEC if SHARD_LAYOUT != "flat" else 0,
+            busy=lambda: any(self.pipeline.depths().values()),
+            settle_seconds=SETTLE_SECONDS,
+            logger=self.logger,
+        )
+        metrics.register_gauge("queue_depth", self.pipeline.depths, label="lane")
+        metrics.register_gauge("settle_pending", self.settler.pending_count)
+        metrics.register_gauge("retry_parked", lambda: len(self.retry_queue))
+        for root in self.roots:
+            self.logger.info("Initialized Folder watcher for: %s%s", root.path, " (recursive)" if root.recursive else "")
+
+    def _route(self, contexts):
+        # Most specific root first, so nested roots win over their parents
+        contexts.sort(key=lambda ctx: len(ctx.root.path.parts), reverse=True)
+        excluded = excluded_folders([ctx.root for ctx in contexts])
+        prefixes = tuple(os.path.join(str(folder), "") for folder in excluded)
+        # One reference swap publishes contexts and exclusions together; readers take no lock
+        self._routing = (contexts, excluded, prefixes)
+
+    @property
+    def _contexts(self):
+        return self._routing[0]
+
+    @property
+    def _excluded(self):
+        return self._routing[1]
+
+    def apply_rules(self, defaults):
+        """
+        Switch every root to rules loaded from the rules file.
+
+        The new rules are compiled first and then published in one step.
+        Files being processed finish with the rules they started with.
+
+        Args:
+            defaults (dict): Rule settings (see rules.load_rules_file())
+        """
+        with self._rules_lock:
+            contexts = []
+            for ctx in self._contexts:
+                root = ctx.root.with_defaults(defaults)
+                rules = compile_rules(root.organize_rules, root.name_rules, root.size_rules, self.logger)
+                contexts.append(_RootContext(
+                    root, ctx.classifier.with_rules(rules), ctx.file_mover.with_folders(root.category_folders)
+                ))
+            self._route(contexts)
+            self.roots = [ctx.root for ctx in contexts]
+        self.logger.info("Rules applied to %d watch root(s)", len(contexts))
+
+    def context_for(self, path):
+        """
+        Return the root context owning a file path, or None when the path is
+        outside every root, hidden, or inside an excluded folder (category
+        folders, state, duplicates) where our own moves land.
+        """
+        path = Path(path)
+        path_str = str(path)
+        contexts, _, excluded_prefixes = self._routing
+        if path_str.startswith(excluded_prefixes):
+            return None
+        for ctx in contexts:
+            if ctx.root.owns(path):
+                relative = path.relative_to(ctx.root.path).parts
+                if any(part.startswith(".") for part in relative):
+                    return None
+                return ctx
+        return None
+
+    def start(self):
+        """
+        Start the worker pipeline, settle scheduler and rebalancer.
+        """
+        self.pipeline.start()
+        self.settler.start()
+        self.retry_queue.start()
+        self.rebalancer.start()
+
+    def stop(self):
+        """
+        Stop the rebalancer and settle scheduler, then drain the worker pipeline.
+        """
+        self.rebalancer.stop()
+        self.retry_queue.stop()
+        self.settler.stop()
+        self.pipeline.stop()
     
     def on_created(self, event):
         """
         Called when a file or directory is created.
+
+        Only hands the file to the settle scheduler; classification and moving
+        happen on the pipeline's worker threads once the file stops changing.
         """
         self.logger.debug("Created event detected")
-        if not event.is_directory:
-            file_path = Path(event.src_path)
-            self.logger.info(f"New file created: {file_path.name}")
-            self.logger.info(f"Full path: {file_path}")
-            self.logger.info(f"File size: {file_path.stat().st_size} bytes")
-            classification = self.classifier.classify(file_path)
-            self.logger.info(f"File classification: {classification}")
-            if classification == 'Documents' and file_path.suffix.lower() == '.pdf':
-                subcategory = self.classifier.read_and_classify(file_path)
-                moved = self.file_mover.move_document_to_subcategory(file_path, subcategory)
-                if moved:
-                    if subcategory:
-                        self.logger.info(f"Moved PDF to Documents/{subcategory}")
-                    else:
-                        self.logger.info("Moved PDF to Documents (no subcategory)")
+        metrics.inc("events_total", 1, _CREATED)
+        if event.is_directory:
+            self._folder_changed(event.src_path, created=True)
+        elif self.context_for(event.src_path) is not None:
+            self.settler.touch(event.src_path)
+
+    def enqueue(self, file_path, classification=None):
+        """
+        Queue a settled file on the lane matching its expected cost.
+        Files already queued or being processed are skipped, so the startup
+        sweep and live events never handle the same file twice.
+
+        PDFs go to the slow lane, including ones with a missing or generic
+        extension: those are sniffed here (one short read, remembered for
+        the classification on the worker), so text extraction and API calls
+        never hold a fast worker.
+
+        Args:
+            file_path (Path): Path to the file
+            classification (str | None): Category if already known
+        """
+        with self._inflight_lock:
+            if file_path in self._inflight:
+                self.logger.debug("Already queued, skipping: %s", file_path.name)
+                return
+            self._inflight.add(file_path)
+        lane = "slow" if self._is_slow(file_path, classification) else "fast"
+        self.logger.debug("Queueing %s on %s lane", file_path.name, lane)
+        self.pipeline.submit((file_path, classification), lane)
+
+    def _is_slow(self, file_path, classification):
+        if classification not in (None, 'Documents'):
+            return False
+        ctx = self.context_for(file_path)
+        return ctx is not None and ctx.classifier.is_pdf(file_path)
+
+    def _process_item(self, item):
+        file_path, classification = item
+        timed = metrics.enabled
+        if timed:
+            started = time.perf_counter()
+        try:
+            self.process_file(file_path, classification)
+        finally:
+            if timed:
+                metrics.observe("process", time.perf_counter() - started)
+            with self._inflight_lock:
+                self._inflight.discard(file_path)
+
+    def reconcile(self):
+        """
+        File everything already sitting in the watch roots (startup backlog).
+
+        Streams each root with os.scandir and classifies from the cached
+        DirEntry stat data. Files modified within the settle window may still
+        be downloading and go through the settle scheduler instead.
+
+        Returns:
+            int: Number of files queued or handed to the settle scheduler
+        """
+        started = time.monotonic()
+        count = 0
+        for ctx in self._contexts:
+            count += self._sweep(ctx, ctx.root.path, ctx.root.recursive)
+        self.logger.info(
+            "Startup sweep queued %d existing file(s) in %.2fs", count, time.monotonic() - started
+        )
+        return count
+
+    def _sweep(self, ctx, folder, recursive):
+        count = 0
+        for entry in iter_backlog(folder, self.settler.is_temporary, recursive, self._excluded):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            file_path = Path(entry.path)
+            owner = self.context_for(file_path)
+            if owner is None or owner.root.path != ctx.root.path:
+                continue  # Belongs to a nested root; its own sweep files it
+            ctx = owner  # The current rules, should they have been reloaded meanwhile
+            if time.time() - st.st_mtime < SETTLE_SECONDS:
+                self.settler.touch(file_path)
+            elif ctx.classifier.needs_content(entry.name, st.st_size):
+                self.enqueue(file_path)  # Classified by content on a worker
+            else:
+                self.enqueue(file_path, ctx.classifier.classify_name(entry.name, st.st_size))
+            count += 1
+        return count
+
+    def process_file(self, file_path, classification=None):
+        """
+        Classify a file and move it into its category folder.
+        Runs on a pipeline worker thread.
+
+        Args:
+            file_path (Path): Path to the file
+            classification (str | None): Category if already known
+        """
+        file_path = Path(file_path)
+        if not file_path.exists():
+            self.logger.debug("File vanished before processing: %s", file_path)
+            return
+        ctx = self.context_for(file_path)
+        if ctx is None:
+            self.logger.debug("No watch root owns %s, skipping", file_path)
+            return
+        self.logger.debug("Processing file: %s", file_path)
+        if classification is None:
+            classification = ctx.classifier.classify(file_path)
+        self.logger.debug("File classification: %s", classification)
+        if classification == 'Documents' and ctx.classifier.is_pdf(file_path):
+            try:
+                with metrics.timer("read_and_classify"):
+                    subcategory = ctx.classifier.read_and_classify(file_path)
+            except ClassificationUnavailable as e:
+                self.logger.warning("Classification unavailable for %s: %s", file_path.name, e)
+                metrics.inc("classify_parked_total")
+                self.retry_queue.park(file_path)
+                return
+            moved = ctx.file_mover.move_document_to_subcategory(file_path, subcategory)
+            if moved:
+                if subcategory:
+                    self.logger.debug("Moved PDF to Documents/%s", subcategory)
                 else:
-                    self.logger.warning("Move failed for PDF document")
+                    self.logger.debug("Moved PDF to Documents (no subcategory)")
             else:
-                if classification:
-                    moved = self.file_mover.move_file(file_path, classification)
-                    if moved:
-                        self.logger.info(f"Moved new file to {classification}")
-                    else:
-                        self.logger.warning("Move failed for new file")
-            
+                self.logger.warning("Move failed for PDF document %s", file_path.name)
+        else:
+            if classification:
+                moved = ctx.file_mover.move_file(file_path, classification)
+                if moved:
+                    self.logger.debug("Moved new file to %s", classification)
+                else:
+                    self.logger.warning("Move failed for new file %s", file_path.name)
 
-    
     def on_modified(self, event):
         """
         Called when a file or directory is modified.
         """
         self.logger.debug("Modified event detected")
-        if not event.is_directory:
-            file_path = Path(event.src_path)
-            self.logger.info(f"File modified: {file_path.name}")
-            
+        metrics.inc("events_total", 1, _MODIFIED)
+        if not event.is_directory and self.context_for(event.src_path) is not None:
+            self.settler.touch(event.src_path)
 
-    
     def on_moved(self, event):
         """
         Called when a file or directory is moved or renamed.
         """
         self.logger.debug("Moved event detected")
-        if not event.is_directory:
-            old_path = Path(event.src_path)
-            new_path = Path(event.dest_path)
-            self.logger.info(f"File moved/renamed: {old_path.name} -> {new_path.name}")
+        metrics.inc("events_total", 1, _MOVED)
+        old_path = Path(event.src_path)
+        new_path = Path(event.dest_path)
+        if event.is_directory:
+            self._folder_changed(old_path, created=False)
+            self._folder_changed(new_path, created=True)
+            # A folder moved into a recursive root brings files that raise no events
+            ctx = self.context_for(new_path / "_")
+            if ctx is not None and ctx.root.recursive:
+                self._sweep(ctx, new_path, recursive=True)
+            return
+        self.logger.debug("File moved/renamed: %s -> %s", old_path.name, new_path.name)
+        if self.context_for(new_path) is not None:
+            # Typically a finished download: "report.pdf.crdownload" -> "report.pdf"
+            self.settler.rename(old_path, new_path)
+        else:
+            self.settler.discard(old_path)
+
+    def on_deleted(self, event):
+        """
+        Called when a file or directory is deleted.
+        """
+        if event.is_directory:
+            self._folder_changed(event.src_path, created=False)
+
+    def _folder_changed(self, path, created):
+        # Keep the Documents subfolder indexes in step with the disk
+        for ctx in self._contexts:
+            index = ctx.classifier.subfolders
+            name = index.handles(path)
+            if name is not None:
+                if created:
+                    index.add(name)
+                else:
+                    index.discard(name)
 
-def start_watching(folder_path, logger=None):
+def start_watching(folder_path=None, logger=None, backend=None):
     """
-    Start watching the folder for changes.
+    Start watching for changes.
+
+    All watch roots share one settle scheduler and one worker pipeline, and
+    one observer per backend: native events, or the polling snapshot
+    observer for network mounts. With RULES_FILE set, rule changes are
+    applied while running.
 
     Args:
-        folder_path (str): Path to the folder
+        folder_path (str, WatchRoot or list): Folder(s) to watch; defaults to
+            the roots from WATCH_ROOTS_FILE, or WATCH_FOLDER when that is unset
         logger: Logger instance to use for logging
+        backend (str | None): "native" or "polling" for every root, overriding
+            WATCH_BACKEND and per-root settings
     """
     if logger is None:
         logger = setup_logging()
+
+    roots = as_roots(folder_path) if folder_path is not None else load_watch_roots()
+    rules_file = None
+    if RULES_FILE:
+        rules_file = RulesFile(RULES_FILE, RULES_RELOAD_INTERVAL, logger)
+        roots = [root.with_defaults(rules_file.values) for root in roots]
+        logger.info("Rules loaded from %s", rules_file.path)
     
-    logger.info(f"Folder path: {folder_path}")
-    
-    # Create event handler and observer
-    event_handler = FilesWatcher(folder_path, logger)
-    observer = Observer()
-    observer.schedule(event_handler, folder_path, recursive=False)
+    # Create event handler and observers
+    event_handler = FilesWatcher(roots, logger)
+    observers = {}
+    for ctx in event_handler._contexts:
+        root = ctx.root
+        root_backend = backend or root.backend
+        observer = observers.get(root_backend)
+        if observer is None:
+            observer = observers[root_backend] = _create_observer(root_backend, roots, logger)
+        logger.info("Folder path: %s (%s)", root.path, root_backend)
+        observer.schedule(event_handler, str(root.path), recursive=root.recursive)
+        subfolders = ctx.classifier.subfolders
+        if root_backend == "polling":
+            # The polling observer skips category folders: list Documents again now and then
+            subfolders.max_age = POLL_MAX_INTERVAL
+        elif not (root.recursive and root.owns(subfolders.folder)):
+            # Directory events keep the Documents subfolder index current
+            observer.schedule(event_handler, str(subfolders.folder), recursive=False)
     
-    # Start the observer
-    observer.start()
+    # The per-file processing timing only matters when something reads it
+    metrics.enabled = bool(METRICS_PORT or METRICS_SUMMARY_INTERVAL)
+    start_metrics_server(METRICS_PORT, METRICS_HOST, logger)
+    reporter = SummaryReporter(METRICS_SUMMARY_INTERVAL, logger)
+    reporter.start()
+
+    # Start the workers before the observers so no event is queued without a consumer
+    event_handler.start()
+    if rules_file is not None:
+        rules_file.subscribe(event_handler.apply_rules)
+        rules_file.start()
+    for observer in observers.values():
+        observer.start()
     logger.info("File watcher started. Press Ctrl+C to stop.")
+
+    if RECONCILE_ON_STARTUP:
+        # The observer is already running, so nothing created during the sweep is missed
+        threading.Thread(target=event_handler.reconcile, name="mk-reconcile", daemon=True).start()
     
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        observer.stop()
+        for observer in observers.values():
+            observer.stop()
         logger.info("File watcher stopped.")
     
-    observer.join()
\ No newline at end of file
+    for observer in observers.values():
+        observer.join()
+    if rules_file is not None:
+        rules_file.stop()
+    # Let already queued files finish before returning
+    event_handler.stop()
+    reporter.stop()
+
+
+def _create_observer(backend, roots, logger):
+    # Backends are imported on first use; the native one loads inotify/FSEvents bindings
+    if backend == "polling":
+        from polling import SnapshotObserver
+
+        return SnapshotObserver(
+            min_interval=POLL_MIN_INTERVAL,
+            max_interval=POLL_MAX_INTERVAL,
+            snapshot_path=POLL_SNAPSHOT_PATH,
+            excluded=excluded_folders(roots),
+            logger=logger,
+        )
+    if backend != "native":
+        raise ValueError(f"Unknown watch backend: {backend!r}")
+    from watchdog.observers import Observer
+
+    return Observer()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+In-memory index of the subfolders of a folder (the Documents subcategories),
+kept current from our own mkdirs and directory events instead of a listing
+per classified file.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class SubfolderIndex:
+    """
+    Names of the subfolders of one folder.
+
+    The folder is listed once, on first use; after that add() and discard()
+    keep the index current. Readers get an immutable snapshot that is
+    replaced as a whole on every change, so reads take no lock.
+    """
+
+    def __init__(self, folder, key=str.lower, max_age=None, ignore=None):
+        """
+        Args:
+            folder (str or Path): Folder whose subfolders are indexed
+            key (callable): Normalizes names for the lookup map in snapshot()
+            max_age (float | None): Seconds after which the folder is listed
+                again on the next read; None trusts the updates indefinitely.
+                Set it where no directory events arrive (polled mounts).
+            ignore (callable | None): Subfolder names for which ignore(name)
+                is true are left out (shard folders of the destination layout)
+        """
+        self.folder = Path(folder)
+        self.key = key
+        self.max_age = max_age
+        self.ignore = ignore or (lambda name: False)
+        self._snapshot = None  # (names tuple, normalized name -> name), or None to rescan
+        self._listed_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        Return the current subfolders.
+
+        Returns:
+            tuple: (names tuple, dict of key(name) -> name); never mutated
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and (self.max_age is None or time.monotonic() - self._listed_at < self.max_age):
+            return snapshot
+        with self._lock:
+            try:
+                names = tuple(
+                    entry.name for entry in os.scandir(self.folder)
+                    if entry.is_dir() and not self.ignore(entry.name)
+                )
+            except OSError:
+                names = ()
+            self._listed_at = time.monotonic()
+            return self._publish(names)
+
+    def names(self):
+        """
+        Return the subfolder names as a tuple.
+        """
+        return self.snapshot()[0]
+
+    def add(self, name):
+        """
+        Record a subfolder created by us or reported by a directory event.
+        """
+        if self.ignore(name):
+            return
+        with self._lock:
+            if self._snapshot is not None and name not in self._snapshot[0]:
+                self._publish(self._snapshot[0] + (name,))
+
+    def discard(self, name):
+        """
+        Forget a subfolder that was removed or renamed away.
+        """
+        with self._lock:
+            if self._snapshot is not None and name in self._snapshot[0]:
+                self._publish(tuple(n for n in self._snapshot[0] if n != name))
+
+    def invalidate(self):
+        """
+        List the folder again on the next read.
+        """
+        self._snapshot = None
+
+    def handles(self, path):
+        """
+        Return the subfolder name if path is a direct child of the indexed folder.
+        """
+        path = Path(path)
+        return path.name if path.parent == self.folder else None
+
+    def _publish(self, names):
+        snapshot = (names, {self.key(name): name for name in names})
+        self._snapshot = snapshot
+        return snapshot
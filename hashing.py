@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Streaming content hashing helpers.
+"""
+
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(file_path, algorithm="sha256", limit=None):
+    """
+    Hash a file's content without loading it into memory.
+
+    Args:
+        file_path (str or Path): Path to the file
+        algorithm (str): hashlib algorithm name
+        limit (int | None): Hash at most this many leading bytes
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.new(algorithm)
+    remaining = limit
+    with open(file_path, "rb") as f:
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
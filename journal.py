@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Persistent journal of file moves with crash recovery and undo.
+"""
+
+import errno
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from config import JOURNAL_ENABLED, JOURNAL_PATH, JOURNAL_FLUSH_INTERVAL
+from logger import setup_logging
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS moves (
+    id INTEGER PRIMARY KEY,
+    src TEXT NOT NULL,
+    dest TEXT NOT NULL,
+    action TEXT NOT NULL,
+    category TEXT,
+    content_hash TEXT,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS moves_status ON moves (status);
+CREATE INDEX IF NOT EXISTS moves_created_at ON moves (created_at);
+"""
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+ROLLED_BACK = "rolled-back"
+UNDONE = "undone"
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+class MoveJournal:
+    """
+    Append-only record of every placement FileMover performs.
+
+    Entries are queued and a writer thread commits them in groups (one
+    transaction per flush interval or batch), so sustained bursts are not
+    limited by commit/fsync latency. An entry is written as "pending" before
+    the move and updated to "done" or "failed" after it; recover() settles
+    entries left pending by a crash. begin() returns only once its pending
+    row is committed, so no move starts without one: the rows queued while
+    a batch is open share one Event, set when that batch commits, and a
+    batch with a caller blocked on it commits as soon as nothing else is
+    queued instead of waiting out the flush interval. finish() never waits.
+
+    Actions: "move" (renamed/copied), "link" (hard-linked to an identical
+    file), "remove" (deleted as a duplicate of dest), "quarantine",
+    "rebalance" (moved into a shard folder of the same category folder).
+    """
+
+    def __init__(self, db_path, flush_interval=0.05, batch_size=1000, logger=None):
+        """
+        Args:
+            db_path (str): Path to the SQLite file
+            flush_interval (float): Maximum seconds an entry waits for its group commit
+            batch_size (int): Maximum entries per transaction
+            logger: Logger instance to use for logging
+        """
+        self.logger = logger or setup_logging()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+        row = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM moves").fetchone()
+        self._next_id = row[0] + 1
+        self._id_lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        # Set when the batch the next begin() joins is committed
+        self._batch_done = threading.Event()
+        self._batch_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="mk-journal", daemon=True)
+        self._writer.start()
+
+    def begin(self, src, dest, action, category=None, content_hash=None):
+        """
+        Record an intended placement as pending and wait until it is committed.
+
+        Returns:
+            int: Entry id to pass to finish()
+        """
+        with self._id_lock:
+            entry_id = self._next_id
+            self._next_id += 1
+        with self._batch_lock:
+            committed = self._batch_done
+            self._queue.put((
+                "INSERT INTO moves (id, src, dest, action, category, content_hash, created_at, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, str(src), str(dest), action, category, content_hash, time.time(), PENDING),
+                committed,
+            ))
+        committed.wait()
+        return entry_id
+
+    def finish(self, entry_id, status=DONE):
+        """
+        Mark an entry done or failed.
+        """
+        self._queue.put(("UPDATE moves SET status = ? WHERE id = ?", (status, entry_id), None))
+
+    def flush(self):
+        """
+        Block until everything queued so far is committed.
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        Flush and stop the writer thread.
+        """
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        with self._db_lock:
+            self._conn.close()
+
+    def recover(self):
+        """
+        Settle entries left pending by a crash.
+
+        If the source is gone and the destination exists, the move completed
+        and the entry is marked done. Otherwise the destination placeholder or
+        partial copy is removed and the entry is marked rolled back, leaving
+        the source to be filed again.
+
+        Returns:
+            tuple: (entries rolled forward, entries rolled back)
+        """
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT id, src, dest, action FROM moves WHERE status = ?", (PENDING,)
+            ).fetchall()
+        forward, back = [], []
+        for entry_id, src, dest, action in rows:
+            src_exists = os.path.lexists(src)
+            dest_exists = os.path.lexists(dest)
+            if action == "remove":
+                (forward if not src_exists else back).append(entry_id)
+            elif not src_exists and dest_exists:
+                forward.append(entry_id)
+            else:
+                if src_exists and dest_exists:
+                    try:
+                        os.unlink(dest)
+                    except OSError as e:
+                        self.logger.warning("Could not remove partial %s: %s", dest, e)
+                back.append(entry_id)
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE moves SET status = ? WHERE id = ?", [(DONE, i) for i in forward]
+            )
+            self._conn.executemany(
+                "UPDATE moves SET status = ? WHERE id = ?", [(ROLLED_BACK, i) for i in back]
+            )
+            self._conn.execute("COMMIT")
+        if rows:
+            self.logger.info(
+                "Journal recovery: %d move(s) rolled forward, %d rolled back", len(forward), len(back)
+            )
+        return len(forward), len(back)
+
+    def select_done(self, last=None, since=None):
+        """
+        Return completed entries, newest first.
+
+        Args:
+            last (int | None): At most this many entries
+            since (float | None): Only entries created at or after this timestamp
+
+        Returns:
+            list: (id, src, dest, action) rows
+        """
+        self.flush()
+        query = "SELECT id, src, dest, action FROM moves WHERE status = ?"
+        params = [DONE]
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        query += " ORDER BY id DESC"
+        if last is not None:
+            query += " LIMIT ?"
+            params.append(last)
+        with self._db_lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def undo(self, last=None, since=None, dry_run=False):
+        """
+        Put files back where they came from, newest first.
+
+        Args:
+            last (int | None): Undo at most this many moves
+            since (float | None): Undo moves made at or after this timestamp
+            dry_run (bool): Only report what would be undone
+
+        Returns:
+            tuple: (files restored, entries skipped)
+        """
+        restored, skipped, undone = 0, 0, []
+        for entry_id, src, dest, action in self.select_done(last, since):
+            src_path, dest_path = Path(src), Path(dest)
+            if os.path.lexists(src_path):
+                self.logger.warning("Cannot undo %s: %s exists again", dest_path.name, src_path)
+                skipped += 1
+                continue
+            if not dest_path.exists():
+                self.logger.warning("Cannot undo %s: it no longer exists", dest_path)
+                skipped += 1
+                continue
+            self.logger.info("Undo: %s -> %s", dest_path, src_path)
+            if dry_run:
+                restored += 1
+                continue
+            try:
+                src_path.parent.mkdir(parents=True, exist_ok=True)
+                if action == "remove":
+                    # The incoming copy was deleted; restore it from the identical file
+                    shutil.copy2(dest_path, src_path)
+                else:
+                    _move_back(dest_path, src_path)
+            except OSError as e:
+                self.logger.error("Undo failed for %s: %s", dest_path, e)
+                skipped += 1
+                continue
+            undone.append(entry_id)
+            restored += 1
+        for entry_id in undone:
+            self.finish(entry_id, UNDONE)
+        self.flush()
+        return restored, skipped
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, blocking = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                stop = _take(item, batch, waiters)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                # A begin() is blocked on this batch: commit once the queue is drained
+                blocking = blocking or batch[-1][2] is not None
+                if blocking and self._queue.empty():
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            with self._batch_lock:
+                committed, self._batch_done = self._batch_done, threading.Event()
+                # Rows queued before the swap belong to this batch's Event
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    stop = _take(item, batch, waiters) or stop
+            if batch:
+                self._commit(batch)
+            committed.set()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _commit(self, batch):
+        try:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                for sql, params, _ in batch:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.logger.error("Journal write failed for %d entries: %s", len(batch), e)
+            try:
+                with self._db_lock:
+                    self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+
+def _take(item, batch, waiters):
+    """
+    Sort a queued item into the batch or the flush waiters.
+
+    Returns:
+        bool: True for the stop marker
+    """
+    if item is None:
+        return True
+    if isinstance(item, threading.Event):
+        waiters.append(item)
+    else:
+        batch.append(item)
+    return False
+
+
+def _move_back(dest_path, src_path):
+    try:
+        os.rename(dest_path, src_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(str(dest_path), str(src_path))
+
+
+def get_journal():
+    """
+    Return the shared move journal, opening it on first use (None when disabled).
+    """
+    global _journal
+    if not JOURNAL_ENABLED:
+        return None
+    with _journal_lock:
+        if _journal is None:
+            _journal = MoveJournal(JOURNAL_PATH, flush_interval=JOURNAL_FLUSH_INTERVAL)
+        return _journal
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Sharded destination layout: where a file goes inside its category folder,
+and a background rebalancer that migrates flat category folders into it.
+"""
+
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from logger import setup_logging
+
+SCHEMES = ("flat", "date", "hash")
+
+# Names of shard folders at any level; "-N" marks an overflow leaf
+_SHARD_NAMES = {
+    "flat": None,
+    "date": re.compile(r"^(\d{4}|\d{2}(-\d+)?)$"),
+    "hash": re.compile(r"^[0-9a-f]{2}(-\d+)?$"),
+}
+
+
+class ShardLayout:
+    """
+    Maps a category folder and a file to the leaf folder the file goes in.
+
+    "flat" keeps every file directly in the category folder, "date" uses
+    <category>/YYYY/MM by modification time and "hash" a fan-out of 256
+    folders by a hash of the file name. A leaf holding max_entries names
+    spills over into <leaf>-2, <leaf>-3, ... The cap is checked against the
+    destination name index, so it costs no directory listing once a leaf
+    is known; concurrent movers may overshoot it by a few files.
+    """
+
+    def __init__(self, scheme="flat", max_entries=10000):
+        """
+        Args:
+            scheme (str): "flat", "date" or "hash"
+            max_entries (int): Entries per leaf before it spills over (0 = no cap)
+        """
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown shard layout {scheme!r} (use one of {', '.join(SCHEMES)})")
+        self.scheme = scheme
+        self.max_entries = max_entries
+        self._shard_names = _SHARD_NAMES[scheme]
+
+    @property
+    def sharded(self):
+        return self.scheme != "flat"
+
+    def is_shard(self, name):
+        """
+        Return True if a folder name is one of this layout's shard folders.
+        """
+        return self._shard_names is not None and self._shard_names.match(name) is not None
+
+    def folder_for(self, base, name, mtime, names=None):
+        """
+        Pick the leaf folder for a file.
+
+        Args:
+            base (Path): Category (or Documents subcategory) folder
+            name (str): File name
+            mtime (float): File modification time
+            names (DestinationNameIndex): Name index used to count leaf entries;
+                without it the cap is not applied
+
+        Returns:
+            Path: Leaf folder (base itself for the flat layout)
+        """
+        if self.scheme == "flat":
+            return base
+        if self.scheme == "date":
+            year, month = time.strftime("%Y %m", time.localtime(mtime)).split()
+            parent, leaf = base / year, month
+        else:
+            digest = zlib.crc32(name.encode("utf-8", "surrogateescape")) & 0xff
+            parent, leaf = base, f"{digest:02x}"
+        folder = parent / leaf
+        if names is None or self.max_entries <= 0:
+            return folder
+        spill = 1
+        while names.count(folder) >= self.max_entries:
+            spill += 1
+            folder = parent / f"{leaf}-{spill}"
+        return folder
+
+
+class Rebalancer:
+    """
+    Moves files lying directly in category folders into the sharded layout.
+
+    Runs on its own thread at a bounded rate and yields while the watcher's
+    queues are busy, so live moves never wait on it. Every move is a rename
+    within the category folder, goes through the destination name index and
+    the move journal (action "rebalance", undone like any move), and updates
+    the duplicate index. Each pass streams the folders with os.scandir.
+    """
+
+    def __init__(self, movers, max_per_second=50.0, interval=3600.0, busy=None, settle_seconds=2.0,
+                 logger=None):
+        """
+        Args:
+            movers (callable): Returns the current FileMover instances
+            max_per_second (float): Upper bound on files moved per second
+            interval (float): Seconds between passes once a pass is done
+            busy (callable): Returns True while live work should go first
+            settle_seconds (float): Files modified this recently are left alone
+            logger: Logger instance to use for logging
+        """
+        self.movers = movers
+        self.max_per_second = max_per_second
+        self.interval = interval
+        self.busy = busy or (lambda: False)
+        self.settle_seconds = settle_seconds
+        self.logger = logger or setup_logging()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the rebalancer thread.
+        """
+        if self.max_per_second > 0:
+            self._thread = threading.Thread(target=self._run, name="mk-rebalance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop after the file being moved, if any.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_pass(self):
+        """
+        Migrate everything currently out of place.
+
+        Returns:
+            int: Files moved
+        """
+        moved = 0
+        for mover in self.movers():
+            if not mover.layout.sharded:
+                continue
+            for folder in _flat_folders(mover):
+                moved += self._rebalance_folder(mover, folder)
+                if self._stop_event.is_set():
+                    return moved
+        return moved
+
+    def _rebalance_folder(self, mover, folder):
+        moved = 0
+        delay = 1.0 / self.max_per_second
+        try:
+            entries = os.scandir(folder)
+        except FileNotFoundError:
+            return 0
+        with entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                    continue
+                while self.busy() and not self._stop_event.is_set():
+                    self._stop_event.wait(0.5)
+                if self._stop_event.wait(delay):
+                    break
+                if mover.rebalance(Path(entry.path), folder, self.settle_seconds):
+                    moved += 1
+        if moved:
+            self.logger.info("Rebalanced %d file(s) out of %s", moved, folder)
+        return moved
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                started = time.monotonic()
+                moved = self.run_pass()
+                if moved:
+                    self.logger.info(
+                        "Rebalance pass moved %d file(s) in %.1fs", moved, time.monotonic() - started
+                    )
+            except Exception:
+                self.logger.exception("Rebalance pass failed")
+            self._stop_event.wait(self.interval)
+
+
+def _flat_folders(mover):
+    """
+    Folders a mover places files in directly: its category folders and the
+    Documents subcategory folders.
+    """
+    folders = list(dict.fromkeys(Path(folder) for folder in mover.category_folders.values()))
+    try:
+        with os.scandir(mover.documents_folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or mover.layout.is_shard(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    folders.append(Path(entry.path))
+    except FileNotFoundError:
+        pass
+    return folders
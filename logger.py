@@ -1,41 +1,216 @@
 #!/usr/bin/env python3
 """
 Logging configuration for the marie-kondo application.
+
+Records are handed to a QueueHandler on the calling thread; a single
+QueueListener thread formats them and writes to the rotating log file and
+the console, so file I/O never happens on the watcher or worker threads.
 """
 
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 
+from config import LOG_LEVEL, LOG_FORMAT, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+
+_listener = None
+_setup_lock = threading.Lock()
+
+LOG_FORMAT_TEXT = '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, for log shippers.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler(log_filename):
+    if LOG_ROTATION == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            log_filename, when="midnight", backupCount=LOG_BACKUP_COUNT, delay=True
+        )
+    return logging.handlers.RotatingFileHandler(
+        log_filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+    )
+
+
 def setup_logging():
     """
-    Configure logging with both file and console handlers.
+    Configure logging once with a queue-backed file and console writer.
+
+    Safe to call from every component: only the first call installs handlers;
+    later calls just return the application logger.
     """
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok=True)
-    
-    # Create a unique log filename with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    log_filename = f'logs/mk_{timestamp}.log'
-    
-    # Configure logging format to include file, function and line number
-    log_format = '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s'
+    global _listener
+    if _listener is not None:
+        # Already configured: components call this freely, keep it lock-free
+        return logging.getLogger(__name__)
+    with _setup_lock:
+        root_logger = logging.getLogger()
+        if _listener is None and not root_logger.handlers:
+            # Create logs directory if it doesn't exist
+            os.makedirs('logs', exist_ok=True)
 
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-
-    formatter = logging.Formatter(log_format)
-
-    if not root_logger.handlers:
-        file_handler = logging.FileHandler(log_filename)
-        stream_handler = logging.StreamHandler()
-        file_handler.setFormatter(formatter)
-        stream_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
-        root_logger.addHandler(stream_handler)
-    else:
-        # Ensure existing handlers use the new formatter
-        for handler in root_logger.handlers:
-            handler.setFormatter(formatter)
+            # Create a unique log filename with timestamp
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            log_filename = f'logs/mk_{timestamp}.log'
+
+            if LOG_FORMAT == "json":
+                formatter = JsonFormatter()
+            else:
+                # Include file, function and line number
+                formatter = logging.Formatter(LOG_FORMAT_TEXT)
+
+            file_handler = _file_handler(log_filename)
+            stream_handler = logging.StreamHandler()
+            file_handler.setFormatter(formatter)
+            stream_handler.setFormatter(formatter)
+
+            log_queue = queue.SimpleQueue()
+            root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            root_logger.setLevel(LOG_LEVEL)
+            _listener = logging.handlers.QueueListener(
+                log_queue, file_handler, stream_handler, respect_handler_level=True
+            )
+            _listener.start()
+            atexit.register(shutdown_logging)
 
     return logging.getLogger(__name__)
+
+
+def shutdown_logging():
+    """
+    Flush queued records and stop the writer thread.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+class _RelayHandler(logging.Handler):
+    """
+    Re-emits records received from worker processes through this process's loggers.
+    """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def relay_worker_logs(mp_context):
+    """
+    Collect log records from worker processes into this process's log file.
+
+    Args:
+        mp_context: multiprocessing context the workers are started with
+
+    Returns:
+        tuple: (queue to pass to setup_worker_logging() in each worker,
+        listener to stop() once the workers are done)
+    """
+    setup_logging()
+    log_queue = mp_context.Queue()
+    listener = logging.handlers.QueueListener(log_queue, _RelayHandler())
+    listener.start()
+    return log_queue, listener
+
+
+def setup_worker_logging(log_queue):
+    """
+    Send a worker process's records to the parent instead of opening another
+    log file. Call from the process pool initializer, before setup_logging().
+    """
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(LOG_LEVEL)
+    return logging.getLogger(__name__)
+
+
+def benchmark_overhead(files=20000, lines_per_file=8):
+    """
+    Measure the logging cost each processed file adds to the calling thread.
+
+    "before" mimics the old hot path: every per-file line is an f-string at
+    INFO written synchronously. "after" is the current one: per-file lines
+    are %-style DEBUG calls dropped by the level check, plus one INFO line
+    handed to the queue. Both write to os.devnull so disk speed is excluded.
+
+    Args:
+        files (int): Number of simulated files
+        lines_per_file (int): Per-file log lines
+
+    Returns:
+        dict: Microseconds of logging per file for "before" and "after"
+    """
+    name, size, category = "invoice.pdf", 123456, "Documents"
+    formatter = logging.Formatter(LOG_FORMAT_TEXT)
+
+    def make_logger(label):
+        log = logging.getLogger(f"mk.benchmark.{label}")
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        log.handlers.clear()
+        return log
+
+    sink = open(os.devnull, "w")
+    sync_handler = logging.StreamHandler(sink)
+    sync_handler.setFormatter(formatter)
+    before_log = make_logger("before")
+    before_log.addHandler(sync_handler)
+
+    queue_sink = logging.StreamHandler(sink)
+    queue_sink.setFormatter(formatter)
+    bench_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(bench_queue, queue_sink)
+    after_log = make_logger("after")
+    after_log.addHandler(logging.handlers.QueueHandler(bench_queue))
+
+    def before():
+        for _ in range(lines_per_file):
+            before_log.info(f"File {name} ({size} bytes) classified as {category}")
+
+    def after():
+        for _ in range(lines_per_file - 1):
+            after_log.debug("File %s (%d bytes) classified as %s", name, size, category)
+        after_log.info("Moved %s to %s", name, category)
+
+    results = {}
+    listener.start()
+    try:
+        for label, func in (("before", before), ("after", after)):
+            started = time.perf_counter()
+            for _ in range(files):
+                func()
+            results[label] = (time.perf_counter() - started) * 1e6 / files
+    finally:
+        listener.stop()
+        sink.close()
+    return results
+
+
+if __name__ == "__main__":
+    for label, us in benchmark_overhead().items():
+        print(f"{label:>6}: {us:6.2f} us of logging per file")
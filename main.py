@@ -3,34 +3,193 @@
 Main entry point for the marie-kondo application.
 """
 
- 
+import argparse
+from datetime import datetime
+
 from logger import setup_logging
-from config import WATCH_FOLDER
-from file_watcher import start_watching
 
-def main():
+
+def build_parser():
+    """
+    Build the command line parser.
+    """
+    parser = argparse.ArgumentParser(
+        prog="marie-kondo", description="Organize a Downloads folder into category folders."
+    )
+    subcommands = parser.add_subparsers(dest="command")
+
+    watch = subcommands.add_parser(
+        "watch", help="watch WATCH_FOLDER (or WATCH_ROOTS_FILE) and organize new files (default)"
+    )
+    watch.add_argument(
+        "--profile", type=float, metavar="SECONDS",
+        help="sample all threads for SECONDS and write a collapsed-stack profile",
+    )
+    watch.add_argument(
+        "--profile-output", metavar="PATH",
+        help="profile file (default: STATE_FOLDER/profile-<time>.folded)",
+    )
+
+    organize = subcommands.add_parser(
+        "organize", help="organize an existing folder tree once and exit (stop the watcher first)"
+    )
+    organize.add_argument("path", nargs="?", help="folder to organize (not needed with --apply-plan)")
+    organize.add_argument(
+        "--dest", help="folder to create the category folders in (default: inside PATH; "
+        "WATCH_FOLDER uses the *_FOLDER settings)",
+    )
+    organize.add_argument("--top-only", action="store_true", help="do not descend into subfolders")
+    organize.add_argument(
+        "--dry-run", action="store_true", help="write the planned moves as JSONL instead of moving"
+    )
+    organize.add_argument(
+        "--plan", default="-", metavar="PATH", help="where --dry-run writes the plan (default: stdout)"
+    )
+    organize.add_argument("--apply-plan", metavar="PATH", help="execute a plan written by --dry-run")
+    organize.add_argument(
+        "--max-workers", type=int, metavar="N",
+        help="processes for PDF classification and hashing (default: CPU count; 1 = none)",
+    )
+
+    undo = subcommands.add_parser(
+        "undo", help="move files back to where they were (stop the watcher first)"
+    )
+    undo.add_argument("--last", type=int, help="undo the last N moves")
+    undo.add_argument(
+        "--since", type=datetime.fromisoformat,
+        help="undo moves made at or after this time (ISO format, e.g. 2024-05-01T09:00)",
+    )
+    undo.add_argument("--dry-run", action="store_true", help="only print what would be undone")
+    return parser
+
+
+def run_watch(args, logger):
+    """
+    Recover the journal, then watch the configured folders until Ctrl+C.
+    """
+    from file_watcher import start_watching
+    from journal import get_journal
+
+    journal = get_journal()
+    if journal is not None:
+        journal.recover()
+
+    profiler = None
+    if getattr(args, "profile", None):
+        import os
+        from config import STATE_FOLDER
+        from profiling import SamplingProfiler
+
+        profile_path = args.profile_output or os.path.join(
+            STATE_FOLDER, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+        )
+        profiler = SamplingProfiler(logger=logger)
+        profiler.run_for(args.profile, profile_path)
+
+    print("Application started successfully.")
+    print("Marie Kondo is working...")
+    try:
+        start_watching(logger=logger)
+    finally:
+        if profiler is not None:
+            profiler.finish(profile_path)
+    return 0
+
+
+def run_organize(args, logger):
+    """
+    Organize a folder tree (or apply a saved plan) once, then print a summary.
+    """
+    import sys
+    from organize import BatchOrganizer, batch_root, read_plan
+
+    if args.apply_plan:
+        if args.dry_run or args.path:
+            logger.error("--apply-plan takes no PATH and cannot be combined with --dry-run")
+            return 2
+    elif not args.path:
+        logger.error("organize needs a PATH (or --apply-plan PLAN)")
+        return 2
+    if not args.dry_run:
+        from journal import get_journal
+
+        journal = get_journal()
+        if journal is not None:
+            journal.recover()
+
+    out = sys.stdout
+    try:
+        if args.apply_plan:
+            with open(args.apply_plan, encoding="utf-8") as plan_file:
+                root, entries = read_plan(plan_file)
+                organizer = BatchOrganizer(root, max_workers=args.max_workers, logger=logger)
+                summary = organizer.apply(entries)
+        else:
+            root = batch_root(args.path, args.dest, recursive=not args.top_only)
+            plan_file = None
+            if args.dry_run:
+                # Keep stdout for the plan itself
+                plan_file = sys.stdout if args.plan == "-" else open(args.plan, "w", encoding="utf-8")
+                out = sys.stderr if args.plan == "-" else sys.stdout
+            try:
+                organizer = BatchOrganizer(
+                    root, args.dry_run, plan_file, args.max_workers, logger
+                )
+                summary = organizer.run()
+            finally:
+                if plan_file is not None and plan_file is not sys.stdout:
+                    plan_file.close()
+    except KeyboardInterrupt:
+        print("Interrupted.", file=out)
+        return 130
+    print(summary.format(args.dry_run), file=out)
+    if args.dry_run and args.plan != "-":
+        print(f"Plan written to {args.plan}; run with --apply-plan {args.plan} to execute it.", file=out)
+    return summary.exit_code
+
+
+def run_undo(args, logger):
+    """
+    Reverse journaled moves in bulk.
+    """
+    from journal import get_journal
+
+    if args.last is None and args.since is None:
+        logger.error("undo needs --last N and/or --since TIME")
+        return 2
+    journal = get_journal()
+    if journal is None:
+        logger.error("The move journal is disabled (JOURNAL_ENABLED=0); nothing to undo")
+        return 1
+    journal.recover()
+    since = args.since.timestamp() if args.since else None
+    restored, skipped = journal.undo(last=args.last, since=since, dry_run=args.dry_run)
+    verb = "Would restore" if args.dry_run else "Restored"
+    print(f"{verb} {restored} file(s), skipped {skipped}.")
+    return 0 if not skipped else 1
+
+
+def main(argv=None):
     """
     Main function that serves as the entry point for the application.
     """
+    args = build_parser().parse_args(argv)
+
     # Setup logging
     logger = setup_logging()
-    
+
     logger.info("Starting marie-kondo application...")
-    print("Application started successfully.")
-    print("Marie Kondo is working...")
 
-    start_watching(WATCH_FOLDER, logger)
-    
     try:
-        # TODO: Add your application logic here
-        logger.info("Application logic completed successfully")
-        
+        if args.command == "undo":
+            return run_undo(args, logger)
+        if args.command == "organize":
+            return run_organize(args, logger)
+        return run_watch(args, logger)
+
     except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
+        logger.error("An error occurred: %s", e)
         return 1
-    
-    logger.info("Application finished successfully")
-    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+In-memory index of taken file names per destination folder.
+"""
+
+import os
+import re
+import threading
+from pathlib import Path
+from logger import setup_logging
+
+_COUNTER_RE = re.compile(r"^(.*)_(\d+)$")
+
+
+class _FolderNames:
+    """
+    Taken names and the highest "_N" counter per (stem, suffix) in one folder.
+    """
+    __slots__ = ("taken", "counters", "lock")
+
+    def __init__(self):
+        self.taken = set()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add(self, name):
+        self.taken.add(name)
+        path = Path(name)
+        match = _COUNTER_RE.match(path.stem)
+        if match:
+            key = (match.group(1), path.suffix)
+            counter = int(match.group(2))
+            if counter > self.counters.get(key, 0):
+                self.counters[key] = counter
+
+
+class DestinationNameIndex:
+    """
+    Picks collision-free destination names in O(1) and claims them atomically.
+
+    Each folder is scanned once with os.scandir; afterwards the index is kept
+    current from our own placements. A chosen name is claimed on disk with an
+    O_CREAT | O_EXCL placeholder, so concurrent movers (or other programs)
+    can never be handed the same name, and the file is then renamed over the
+    placeholder, so an existing file is never overwritten.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger or setup_logging()
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, dest_folder, name):
+        """
+        Claim a unique path for a file in a folder.
+
+        The returned path exists as an empty placeholder owned by the caller,
+        who must either replace it (os.replace) or call release().
+
+        Args:
+            dest_folder (str or Path): Destination folder
+            name (str): Desired file name
+
+        Returns:
+            Path: Claimed destination path ("name", else "stem_N.suffix")
+        """
+        while True:
+            target = self.pick(dest_folder, name)
+            try:
+                self.claim(target)
+            except FileExistsError:
+                # Created behind our back; pick() already remembers it as taken
+                continue
+            return target
+
+    def pick(self, dest_folder, name):
+        """
+        Choose a name that is free in the index and mark it taken, without
+        touching the disk.
+
+        Lets a caller journal the path before claim() creates its placeholder.
+        The name stays taken until release() or discard(), also if claim()
+        finds it already exists.
+
+        Args:
+            dest_folder (str or Path): Destination folder
+            name (str): Desired file name
+
+        Returns:
+            Path: Chosen destination path ("name", else "stem_N.suffix")
+        """
+        dest_folder = Path(dest_folder)
+        names = self._folder(dest_folder)
+        path = Path(name)
+        stem, suffix = path.stem, path.suffix
+        key = (stem, suffix)
+        with names.lock:
+            candidate = name
+            while candidate in names.taken:
+                counter = names.counters.get(key, 0) + 1
+                names.counters[key] = counter
+                candidate = f"{stem}_{counter}{suffix}"
+            names.add(candidate)
+        return dest_folder / candidate
+
+    def claim(self, target):
+        """
+        Create the O_EXCL placeholder for a path returned by pick().
+
+        Args:
+            target (Path): Path returned by pick()
+
+        Raises:
+            FileExistsError: Another program created the path first
+        """
+        fd = os.open(target, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        os.close(fd)
+
+    def release(self, dest_path):
+        """
+        Give back a claimed name whose placement failed, removing the placeholder.
+
+        Args:
+            dest_path (Path): Path returned by reserve() or pick()
+        """
+        dest_path = Path(dest_path)
+        try:
+            if dest_path.stat().st_size == 0:
+                dest_path.unlink()
+        except FileNotFoundError:
+            pass
+        names = self._folder(dest_path.parent)
+        with names.lock:
+            names.taken.discard(dest_path.name)
+
+    def discard(self, path):
+        """
+        Forget the name of a file that was moved out of its folder.
+        """
+        path = Path(path)
+        names = self._folder(path.parent)
+        with names.lock:
+            names.taken.discard(path.name)
+
+    def count(self, dest_folder):
+        """
+        Return the number of names taken in a folder.
+        """
+        return len(self._folder(Path(dest_folder)).taken)
+
+    def forget(self, dest_folder):
+        """
+        Drop a folder from the index so it is rescanned on next use.
+        """
+        with self._lock:
+            self._folders.pop(Path(dest_folder), None)
+
+    def _folder(self, dest_folder):
+        with self._lock:
+            names = self._folders.get(dest_folder)
+        if names is not None:
+            return names
+        # Scan without the index-wide lock so a large or slow (network) folder
+        # does not hold up reservations in every other folder
+        scanned = _FolderNames()
+        try:
+            with os.scandir(dest_folder) as entries:
+                for entry in entries:
+                    scanned.add(entry.name)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            names = self._folders.setdefault(dest_folder, scanned)
+        if names is scanned:
+            self.logger.debug("Indexed %d name(s) in %s", len(names.taken), dest_folder)
+        return names
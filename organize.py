@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+One-shot batch organizing of an existing folder tree (cron jobs, archive migrations).
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+from config import (
+    DEDUP_MODE, SETTLE_SECONDS, TEMP_DOWNLOAD_SUFFIXES,
+    OPENAI_MAX_IN_FLIGHT, OPENAI_RATE_LIMIT, OPENAI_MAX_RETRIES,
+    OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_RESET,
+    SNIFF_ENABLED, SNIFF_BYTES, SNIFF_EXTENSIONS, RULES_FILE
+)
+from logger import setup_logging, relay_worker_logs, setup_worker_logging
+from reconcile import iter_backlog
+from roots import WatchRoot, as_roots, excluded_folders
+from rules import compile_rules, load_rules_file
+from sniff import ContentSniffer
+
+PLAN_VERSION = 1
+# Files per pool task: large enough to amortize pickling, small enough to keep all workers busy
+CHUNK_SIZE = 32
+# Planned moves for one destination are handed over together once this many have gathered
+GROUP_SIZE = 1000
+# Upper bound on planned moves held in memory across all destinations
+MAX_BUFFERED = 20000
+
+
+class BatchSummary:
+    """
+    Counts for the end-of-run report.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.planned = 0
+        self.moved = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.failed = 0
+        self.bytes = 0
+        self.folders = set()
+        self.started = time.monotonic()
+
+    @property
+    def exit_code(self):
+        """
+        0 when every file was handled, 1 when some failed or must be retried.
+        """
+        return 1 if self.failed or self.deferred else 0
+
+    def format(self, dry_run=False):
+        elapsed = time.monotonic() - self.started
+        done = self.planned if dry_run else self.moved
+        verb = "Planned" if dry_run else "Organized"
+        return (
+            f"{verb} {done} of {self.scanned} file(s) ({self.bytes / (1024 * 1024):.1f} MiB) "
+            f"into {len(self.folders)} folder(s) in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f} files/s): "
+            f"{self.duplicates} duplicate(s), {self.skipped} skipped, "
+            f"{self.deferred} deferred, {self.failed} failed."
+        )
+
+
+class _DestinationGroups:
+    """
+    Buffers planned moves per destination folder and hands over whole groups,
+    so each folder's name index, duplicate index and directory blocks are
+    loaded once per group instead of once per file.
+    """
+
+    def __init__(self, handle_group, group_size=GROUP_SIZE, max_buffered=MAX_BUFFERED):
+        self.handle_group = handle_group
+        self.group_size = group_size
+        self.max_buffered = max_buffered
+        self._groups = {}
+        self._buffered = 0
+
+    def add(self, entry):
+        folder = entry["dest_folder"]
+        group = self._groups.setdefault(folder, [])
+        group.append(entry)
+        self._buffered += 1
+        if len(group) >= self.group_size:
+            self._flush(folder)
+        elif self._buffered >= self.max_buffered:
+            self._flush(max(self._groups, key=lambda key: len(self._groups[key])))
+
+    def flush_all(self):
+        for folder in sorted(self._groups):
+            self._flush(folder)
+
+    def _flush(self, folder):
+        group = self._groups.pop(folder)
+        self._buffered -= len(group)
+        group.sort(key=lambda entry: entry["src"])
+        self.handle_group(folder, group)
+
+
+class _Analyzer:
+    """
+    The expensive per-file work: content sniffing, PDF text extraction and
+    subcategory classification, and the partial content hash used by the
+    duplicate check.
+    One instance lives in each pool worker process.
+    """
+
+    def __init__(self, root, hash_files, workers, logger):
+        from classifier import FileClassifier
+        from classification_service import ClassificationService
+
+        self.hash_files = hash_files
+        self.logger = logger
+        # The OpenAI budget from config is for the whole run, not per process
+        service = ClassificationService(
+            max_in_flight=max(1, OPENAI_MAX_IN_FLIGHT // workers),
+            rate_per_second=OPENAI_RATE_LIMIT / workers,
+            max_retries=OPENAI_MAX_RETRIES,
+            failure_threshold=OPENAI_BREAKER_THRESHOLD,
+            reset_timeout=OPENAI_BREAKER_RESET,
+            logger=logger,
+        )
+        self.classifier = FileClassifier(
+            logger,
+            service=service,
+            rules=compile_rules(root.organize_rules, root.name_rules, root.size_rules, logger),
+            documents_folder=root.category_folders["Documents"],
+        )
+
+    def analyze(self, entries):
+        """
+        Fill in categories, subcategories and hashes for a chunk of planned
+        entries. Entries without a category are classified by content.
+        """
+        from classification_service import ClassificationUnavailable
+        from dedup import PARTIAL_HASH_BYTES
+        from hashing import file_digest
+
+        for entry in entries:
+            try:
+                if entry["category"] is None:
+                    entry["category"] = self.classifier.classify(entry["src"])
+                if entry["category"] == "Documents" and self.classifier.is_pdf(entry["src"]):
+                    subcategory = self.classifier.read_and_classify(entry["src"])
+                    if subcategory:
+                        entry["category"] = f"Documents/{subcategory.lower()}"
+                        # The move creates it; later PDFs should see it as existing
+                        self.classifier.subfolders.add(subcategory.lower())
+                if self.hash_files:
+                    entry["partial_hash"] = file_digest(entry["src"], limit=PARTIAL_HASH_BYTES)
+            except ClassificationUnavailable as e:
+                entry["error"] = f"classification unavailable: {e}"
+            except OSError as e:
+                entry["error"] = f"{type(e).__name__}: {e}"
+        return entries
+
+
+_analyzer = None
+
+
+def _init_worker(root, hash_files, workers, log_queue):
+    global _analyzer
+    _analyzer = _Analyzer(root, hash_files, workers, setup_worker_logging(log_queue))
+
+
+def _analyze_chunk(entries):
+    return _analyzer.analyze(entries)
+
+
+class BatchOrganizer:
+    """
+    Organizes an existing folder tree once and returns.
+
+    The tree is streamed with os.scandir, so memory does not grow with its
+    size. Files are classified by name from the cached DirEntry data in this
+    process; only the expensive work (PDF subcategories, content hashes for
+    deduplication) is sharded across a process pool. Planned moves are
+    grouped per destination folder and then either executed through the
+    regular FileMover (journaled, collision-free, deduplicated) or written
+    as a JSONL plan for a later --apply-plan.
+    """
+
+    def __init__(self, root, dry_run=False, plan_file=None, max_workers=None, logger=None):
+        """
+        Args:
+            root (WatchRoot): Folder to organize and where its files go
+            dry_run (bool): Write the plan instead of moving anything
+            plan_file: Text file the plan is written to when dry_run is set
+            max_workers (int | None): Analyzer processes; defaults to the CPU
+                count, 1 analyzes in this process
+            logger: Logger instance to use for logging
+        """
+        self.root = root
+        self.dry_run = dry_run
+        self.plan_file = plan_file
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.logger = logger or setup_logging()
+        self.summary = BatchSummary()
+        self.hash_files = DEDUP_MODE != "off"
+        self.mover = None
+        if not dry_run:
+            from file_mover import FileMover
+            self.mover = FileMover(self.logger, category_folders=root.category_folders)
+        self._groups = _DestinationGroups(self._write_group if dry_run else self._move_group)
+        self._pool = None  # Worker processes, with max_workers > 1
+        self._pending = set()  # Chunks submitted to the pool and not yet filed
+        self._analyzer = None  # In-process analyzer, without a pool
+
+    def run(self):
+        """
+        Walk the tree and organize (or plan) every file in it.
+
+        Returns:
+            BatchSummary: What was done
+        """
+        root = self.root
+        rules = compile_rules(root.organize_rules, root.name_rules, root.size_rules, self.logger)
+        # Only decides which files need sniffing; the reads happen in the analyzer
+        sniffer = ContentSniffer(rules, SNIFF_BYTES, SNIFF_EXTENSIONS) if SNIFF_ENABLED else None
+        documents_folder = root.category_folders["Documents"]
+        if self.dry_run:
+            self._write_header()
+        self.logger.info("Organizing %s with %d worker process(es)", root.path, self.max_workers)
+
+        log_listener = None
+        if self.max_workers > 1:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawn rather than fork: this process already runs logging and journal threads
+            context = multiprocessing.get_context("spawn")
+            log_queue, log_listener = relay_worker_logs(context)
+            self._pool = ProcessPoolExecutor(
+                self.max_workers, context, _init_worker,
+                (root, self.hash_files, self.max_workers, log_queue),
+            )
+
+        chunk = []
+        now = time.time()
+        try:
+            for dir_entry in iter_backlog(root.path, _is_temporary, root.recursive, excluded_folders([root])):
+                try:
+                    st = dir_entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                self.summary.scanned += 1
+                if now - st.st_mtime < SETTLE_SECONDS:
+                    self.logger.debug("Skipping %s, still being written", dir_entry.path)
+                    self.summary.skipped += 1
+                    continue
+                category = rules.lookup(dir_entry.name, st.st_size)
+                if sniffer is not None and sniffer.wants(dir_entry.name, category):
+                    category = None  # Decided by content in the analyzer
+                elif category is None:
+                    category = "Misc"
+                entry = {
+                    "src": dir_entry.path,
+                    "category": category,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                }
+                if not self.hash_files and category is not None and not (
+                    entry["category"] == "Documents" and dir_entry.name.lower().endswith(".pdf")
+                ):
+                    self._planned(entry, documents_folder)
+                    continue
+                chunk.append(entry)
+                if len(chunk) < CHUNK_SIZE:
+                    continue
+                self._dispatch(chunk, documents_folder)
+                chunk = []
+
+            if chunk:
+                self._dispatch(chunk, documents_folder)
+            self._collect(documents_folder, 1)
+            self._groups.flush_all()
+        finally:
+            for future in self._pending:
+                future.cancel()
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+                log_listener.stop()
+            self.close()
+        return self.summary
+
+    def _dispatch(self, chunk, documents_folder):
+        """
+        Analyze a chunk of entries that need content reads or hashes: on the
+        worker pool if there is one, in this process otherwise.
+        """
+        if self._pool is None:
+            if self._analyzer is None:
+                # Built on first use: most trees need no PDF or hash work at all
+                self._analyzer = _Analyzer(self.root, self.hash_files, 1, self.logger)
+            self._analyzed(self._analyzer.analyze(chunk), documents_folder)
+            return
+        self._pending.add(self._pool.submit(_analyze_chunk, chunk))
+        # Backpressure: never read much further ahead than the workers
+        self._collect(documents_folder, self.max_workers * 4)
+
+    def _collect(self, documents_folder, limit):
+        """
+        File the results of submitted chunks until fewer than limit are pending.
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        while len(self._pending) >= limit:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._analyzed(future.result(), documents_folder)
+
+    def apply(self, entries):
+        """
+        Execute planned moves, e.g. read from a plan file.
+
+        Args:
+            entries (iterable): Plan entries (dicts with src, dest_folder,
+                category, size and mtime_ns)
+
+        Returns:
+            BatchSummary: What was done
+        """
+        try:
+            for entry in entries:
+                self.summary.scanned += 1
+                self.summary.planned += 1
+                self._groups.add(entry)
+            self._groups.flush_all()
+        finally:
+            self.close()
+        return self.summary
+
+    def close(self):
+        """
+        Make sure every journal entry is on disk before the process exits.
+        """
+        if self.mover is not None and self.mover.journal is not None:
+            self.mover.journal.flush()
+
+    def _analyzed(self, entries, documents_folder):
+        for entry in entries:
+            error = entry.pop("error", None)
+            if error is not None:
+                # Left in place; the next run (or the watcher) picks it up again
+                self.logger.warning("Leaving %s in place: %s", entry["src"], error)
+                self.summary.deferred += 1
+                continue
+            self._planned(entry, documents_folder)
+
+    def _planned(self, entry, documents_folder):
+        category = entry["category"]
+        if category.startswith("Documents/"):
+            folder = Path(documents_folder) / category.split("/", 1)[1]
+        else:
+            folder = self.root.category_folders.get(category, self.root.category_folders["Misc"])
+        entry["dest_folder"] = str(folder)
+        self.summary.planned += 1
+        self._groups.add(entry)
+
+    def _write_header(self):
+        header = {
+            "plan": PLAN_VERSION,
+            "root": str(self.root.path),
+            "category_folders": {name: str(folder) for name, folder in self.root.category_folders.items()},
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.plan_file.write(json.dumps(header) + "\n")
+
+    def _write_group(self, folder, group):
+        self.summary.folders.add(folder)
+        for entry in group:
+            self.summary.bytes += entry["size"]
+            self.plan_file.write(json.dumps(entry) + "\n")
+
+    def _move_group(self, folder, group):
+        from metrics import registry as metrics
+
+        duplicates_before = metrics.counter("duplicates_total", ("mode", self.mover.dedup_mode))
+        for entry in group:
+            src = entry["src"]
+            try:
+                st = os.stat(src)
+            except FileNotFoundError:
+                self.logger.debug("Skipping %s, no longer exists", src)
+                self.summary.skipped += 1
+                continue
+            if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+                self.logger.info("Skipping %s, changed since it was planned", src)
+                self.summary.skipped += 1
+                continue
+            hashes = {"partial_hash": entry["partial_hash"]} if entry.get("partial_hash") else None
+            if self.mover.move_to(src, folder, entry["category"], hashes) is None:
+                self.summary.failed += 1
+                continue
+            self.summary.moved += 1
+            self.summary.bytes += st.st_size
+            self.summary.folders.add(folder)
+        self.summary.duplicates += (
+            metrics.counter("duplicates_total", ("mode", self.mover.dedup_mode)) - duplicates_before
+        )
+
+
+def _is_temporary(name):
+    return name.lower().endswith(TEMP_DOWNLOAD_SUFFIXES)
+
+
+def batch_root(path, dest=None, recursive=True):
+    """
+    Build the root for a batch run. WATCH_FOLDER keeps its configured
+    *_FOLDER destinations unless dest is given. Rules come from RULES_FILE
+    when it is set.
+    """
+    if dest is None:
+        root = as_roots(path)[0]
+        root.recursive = recursive
+    else:
+        root = WatchRoot(path, recursive=recursive, dest_root=dest)
+    if RULES_FILE:
+        root = root.with_defaults(load_rules_file(RULES_FILE))
+    return root
+
+
+def read_plan(plan_file):
+    """
+    Read a plan written by a dry run.
+
+    Returns:
+        tuple: (root rebuilt from the plan header, iterator over the entries)
+
+    Raises:
+        ValueError: The file is not a plan this version understands
+    """
+    first = plan_file.readline()
+    try:
+        header = json.loads(first)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("plan") != PLAN_VERSION:
+        raise ValueError("not a marie-kondo plan (missing or unsupported header line)")
+    root = WatchRoot(header["root"], recursive=True, category_folders=header["category_folders"])
+    entries = (json.loads(line) for line in plan_file if line.strip())
+    return root, entries
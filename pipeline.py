@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Worker-pool pipeline that keeps file processing off the watchdog observer thread.
+"""
+
+import queue
+import threading
+import time
+from logger import setup_logging
+
+_STOP = object()
+
+
+class WorkLane:
+    """
+    A bounded work queue drained by a fixed pool of worker threads.
+    """
+
+    def __init__(self, name, handler, workers, maxsize, logger=None):
+        """
+        Initialize the lane.
+
+        Args:
+            name (str): Lane name used in log lines and thread names
+            handler (callable): Called with each queued item on a worker thread
+            workers (int): Number of worker threads
+            maxsize (int): Maximum number of queued items before submit blocks
+            logger: Logger instance to use for logging
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.logger = logger or setup_logging()
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._threads = []
+        self.blocked_submits = 0
+
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"mk-{self.name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info("Started %s lane with %d worker(s)", self.name, self.workers)
+
+    def submit(self, item):
+        """
+        Queue an item, blocking the caller while the lane is full.
+
+        Callers are the settle scheduler's timer thread, the startup sweep and
+        the retry queue, never the observer thread. A full lane stalls the
+        settle timer wheel, so files pile up in the settler; once it holds
+        its max_pending files, touch() blocks and the observer thread stops
+        pulling events until the workers catch up.
+
+        Args:
+            item: Work item passed to the handler
+        """
+        try:
+            self._queue.put_nowait(item)
+            return
+        except queue.Full:
+            pass
+
+        self.blocked_submits += 1
+        self.logger.warning(
+            "%s lane full (%d queued), applying backpressure", self.name, self._queue.qsize()
+        )
+        started = time.monotonic()
+        self._queue.put(item)
+        self.logger.warning(
+            "%s lane accepted work after %.2fs of backpressure", self.name, time.monotonic() - started
+        )
+
+    def depth(self):
+        """
+        Return the number of queued items.
+        """
+        return self._queue.qsize()
+
+    def stop(self):
+        """
+        Let queued work drain, then stop the worker threads.
+        """
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item)
+            except Exception as e:
+                self.logger.error("Unhandled error in %s lane for %s: %s", self.name, item, e)
+            finally:
+                self._queue.task_done()
+
+
+class EventPipeline:
+    """
+    Routes file work into a fast lane (extension moves) and a slow lane
+    (PDF classification) so slow network calls never stall cheap moves.
+    """
+
+    def __init__(self, handler, fast_workers, slow_workers, maxsize,
+                 report_interval=30.0, logger=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            handler (callable): Called with each file path on a worker thread
+            fast_workers (int): Worker threads for the fast lane
+            slow_workers (int): Worker threads for the slow lane
+            maxsize (int): Queue bound per lane
+            report_interval (float): Seconds between queue depth log lines (0 disables)
+            logger: Logger instance to use for logging
+        """
+        self.logger = logger or setup_logging()
+        self.lanes = {
+            "fast": WorkLane("fast", handler, fast_workers, maxsize, self.logger),
+            "slow": WorkLane("slow", handler, slow_workers, maxsize, self.logger),
+        }
+        self.report_interval = report_interval
+        self._stop_event = threading.Event()
+        self._reporter = None
+
+    def start(self):
+        """
+        Start all lanes and the queue depth reporter.
+        """
+        for lane in self.lanes.values():
+            lane.start()
+        if self.report_interval > 0:
+            self._reporter = threading.Thread(
+                target=self._report_loop, name="mk-queue-report", daemon=True
+            )
+            self._reporter.start()
+
+    def submit(self, item, lane="fast"):
+        """
+        Queue an item on the given lane.
+
+        Args:
+            item: Work item passed to the handler
+            lane (str): "fast" or "slow"
+        """
+        self.lanes[lane].submit(item)
+
+    def depths(self):
+        """
+        Return the current queue depth per lane.
+        """
+        return {name: lane.depth() for name, lane in self.lanes.items()}
+
+    def stop(self):
+        """
+        Drain and stop all lanes.
+        """
+        self._stop_event.set()
+        for lane in self.lanes.values():
+            lane.stop()
+        if self._reporter is not None:
+            self._reporter.join()
+            self._reporter = None
+
+    def _report_loop(self):
+        while not self._stop_event.wait(self.report_interval):
+            depths = self.depths()
+            if any(depths.values()):
+                blocked = {name: lane.blocked_submits for name, lane in self.lanes.items()}
+                self.logger.info("Queue depth: %s (backpressure events: %s)", depths, blocked)
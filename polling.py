@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Polling observer for folders where native file system events are not
+available (NFS/SMB mounts).
+"""
+
+import json
+import os
+import threading
+import time
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileMovedEvent
+from logger import setup_logging
+
+_SNAPSHOT_VERSION = 2
+# Directory mtimes this close to the scan time may still change within the same
+# timestamp tick (coarse NFS/SMB mtimes), so such directories are rescanned again
+_RACY_NS = 2 * 1_000_000_000
+
+
+class _Entry:
+    """
+    Snapshot of one directory entry.
+    """
+    __slots__ = ("inode", "size", "mtime", "is_dir")
+
+    def __init__(self, inode, size, mtime, is_dir):
+        self.inode = inode
+        self.size = size
+        self.mtime = mtime
+        self.is_dir = is_dir
+
+
+class _DirState:
+    """
+    Snapshot of one directory: its mtime and entries by name.
+    """
+    __slots__ = ("mtime", "entries")
+
+    def __init__(self, mtime, entries):
+        self.mtime = mtime
+        self.entries = entries
+
+
+class _Watch:
+    """
+    One scheduled folder and the snapshot of every directory under it.
+    """
+    __slots__ = ("handler", "path", "recursive", "dirs")
+
+    def __init__(self, handler, path, recursive):
+        self.handler = handler
+        self.path = path
+        self.recursive = recursive
+        self.dirs = {}
+
+
+class SnapshotObserver:
+    """
+    Drop-in replacement for watchdog's Observer that polls.
+
+    Unlike watchdog's PollingObserver, a tick does not re-stat the whole
+    tree: only the directories are stat'ed, and only directories whose mtime
+    changed are listed again. Entries whose inode is unchanged reuse their
+    snapshot instead of being stat'ed. Renames are paired by inode and
+    reported as moves.
+
+    File content changes do not touch the directory mtime and are therefore
+    not reported; the settle scheduler already re-stats new files until they
+    stop changing, so a created event is all the watcher needs.
+
+    The poll interval drops to min_interval while changes are seen and backs
+    off towards max_interval while the tree is quiet. The snapshot is saved
+    to snapshot_path as JSON, so a restart only diffs directories changed
+    meanwhile. The file lives in a folder other users may be able to write
+    to, so it is only ever parsed as plain data and checked field by field;
+    anything malformed means a fresh baseline scan.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=30.0, snapshot_path=None,
+                 excluded=(), save_interval=60.0, logger=None):
+        """
+        Args:
+            min_interval (float): Seconds between scans while changes are seen
+            max_interval (float): Upper bound for the interval while quiet
+            snapshot_path (str): File to persist the snapshot in (None disables)
+            excluded (iterable): Folders never descended into
+            save_interval (float): Minimum seconds between snapshot saves
+            logger: Logger instance to use for logging
+        """
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.interval = min_interval
+        self.snapshot_path = snapshot_path
+        self.excluded = {os.fspath(folder) for folder in excluded}
+        self.save_interval = save_interval
+        self.logger = logger or setup_logging()
+        self._watches = []
+        self._saved = self._load()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def schedule(self, event_handler, path, recursive=False):
+        """
+        Watch a folder, dispatching watchdog events to event_handler.
+        """
+        watch = _Watch(event_handler, os.path.abspath(os.fspath(path)), recursive)
+        saved = self._saved.pop((watch.path, recursive), None)
+        if saved:
+            for dir_path, (mtime, entries) in saved.items():
+                watch.dirs[dir_path] = _DirState(
+                    mtime, {name: _Entry(*values) for name, values in entries.items()}
+                )
+            self.logger.info("Restored poll snapshot of %d folder(s) under %s", len(watch.dirs), watch.path)
+        self._watches.append(watch)
+        return watch
+
+    def start(self):
+        """
+        Start the polling thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="mk-poll", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Ask the polling thread to stop.
+        """
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        """
+        Wait for the polling thread and save the snapshot.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.save()
+
+    def scan_once(self):
+        """
+        Scan every watch once and dispatch the resulting events.
+
+        Returns:
+            int: Number of events dispatched
+        """
+        count = 0
+        for watch in self._watches:
+            baseline = not watch.dirs
+            events = self._scan_watch(watch, emit=not baseline)
+            if baseline:
+                self._dirty = True
+                self.logger.info("Poll baseline for %s: %d folder(s)", watch.path, len(watch.dirs))
+            for event in events:
+                try:
+                    watch.handler.dispatch(event)
+                except Exception as e:
+                    self.logger.error("Event handler failed for %s: %s", event.src_path, e)
+            count += len(events)
+        if count:
+            self._dirty = True
+        return count
+
+    def save(self):
+        """
+        Write the snapshot to snapshot_path atomically.
+        """
+        if not self.snapshot_path or not self._dirty:
+            return
+        data = {"version": _SNAPSHOT_VERSION, "watches": [
+            {
+                "path": watch.path,
+                "recursive": watch.recursive,
+                "dirs": {
+                    dir_path: [state.mtime, {
+                        name: [e.inode, e.size, e.mtime, e.is_dir] for name, e in state.entries.items()
+                    }]
+                    for dir_path, state in watch.dirs.items()
+                },
+            }
+            for watch in self._watches
+        ]}
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="ascii") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.snapshot_path)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            self.logger.warning("Could not save poll snapshot %s: %s", self.snapshot_path, e)
+
+    def _load(self):
+        if not self.snapshot_path:
+            return {}
+        try:
+            with open(self.snapshot_path, encoding="ascii") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get("version") != _SNAPSHOT_VERSION:
+                return {}
+            return _parse_watches(data.get("watches"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning("Ignoring unreadable poll snapshot %s: %s", self.snapshot_path, e)
+            return {}
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                changes = self.scan_once()
+            except Exception as e:
+                self.logger.error("Poll scan failed: %s", e)
+                changes = 0
+            if changes:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 1.5, self.max_interval)
+            self.logger.debug(
+                "Poll scan: %d change(s) in %.3fs, next in %.1fs",
+                changes, time.monotonic() - started, self.interval,
+            )
+            if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+                self.save()
+            self._stop_event.wait(self.interval)
+
+    def _scan_watch(self, watch, emit):
+        created, deleted = [], []
+        if not watch.dirs:
+            self._scan_dir(watch, watch.path, created, deleted)
+        else:
+            for dir_path in list(watch.dirs):
+                state = watch.dirs.get(dir_path)
+                if state is None:
+                    continue  # Dropped with a removed parent during this tick
+                try:
+                    mtime = os.stat(dir_path).st_mtime_ns
+                except OSError:
+                    # Gone; the parent's rescan reports its files
+                    if dir_path == watch.path:
+                        self._drop_tree(watch, dir_path, deleted)
+                    continue
+                if mtime != state.mtime:
+                    self._scan_dir(watch, dir_path, created, deleted)
+        if not emit:
+            return []
+
+        events = []
+        removed_by_inode = {entry.inode: path for path, entry in deleted}
+        for path, entry in created:
+            old_path = removed_by_inode.pop(entry.inode, None)
+            if old_path is not None:
+                events.append(FileMovedEvent(old_path, path))
+            else:
+                events.append(FileCreatedEvent(path))
+        events.extend(FileDeletedEvent(path) for path in removed_by_inode.values())
+        return events
+
+    def _scan_dir(self, watch, dir_path, created, deleted):
+        """
+        List one directory and diff it against its snapshot, descending into
+        new subfolders of recursive watches.
+        """
+        old = watch.dirs.get(dir_path)
+        old_entries = old.entries if old is not None else {}
+        entries = {}
+        try:
+            mtime = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as it:
+                for dir_entry in it:
+                    name = dir_entry.name
+                    inode = dir_entry.inode()
+                    previous = old_entries.get(name)
+                    if previous is not None and previous.inode == inode:
+                        entries[name] = previous
+                        continue
+                    try:
+                        st = dir_entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    entries[name] = _Entry(
+                        inode, st.st_size, st.st_mtime_ns, dir_entry.is_dir(follow_symlinks=False)
+                    )
+        except OSError as e:
+            self.logger.warning("Could not scan %s: %s", dir_path, e)
+            return
+        if time.time_ns() - mtime < _RACY_NS:
+            mtime = None  # Look again next tick
+        watch.dirs[dir_path] = _DirState(mtime, entries)
+
+        for name, entry in old_entries.items():
+            current = entries.get(name)
+            if current is not None and current.inode == entry.inode:
+                continue
+            path = os.path.join(dir_path, name)
+            if entry.is_dir:
+                self._drop_tree(watch, path, deleted)
+            else:
+                deleted.append((path, entry))
+        for name, entry in entries.items():
+            previous = old_entries.get(name)
+            if previous is not None and previous.inode == entry.inode:
+                continue
+            path = os.path.join(dir_path, name)
+            if not entry.is_dir:
+                created.append((path, entry))
+            elif self._descend(watch, name, path):
+                self._scan_dir(watch, path, created, deleted)
+
+    def _descend(self, watch, name, path):
+        return watch.recursive and not name.startswith(".") and path not in self.excluded
+
+    def _drop_tree(self, watch, dir_path, deleted):
+        state = watch.dirs.pop(dir_path, None)
+        if state is None:
+            return
+        for name, entry in state.entries.items():
+            path = os.path.join(dir_path, name)
+            if entry.is_dir:
+                self._drop_tree(watch, path, deleted)
+            else:
+                deleted.append((path, entry))
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _parse_watches(watches):
+    """
+    Validate the "watches" list of a saved snapshot.
+
+    Returns:
+        dict: (path, recursive) -> {dir_path: (mtime, {name: entry tuple})}
+
+    Raises:
+        ValueError: If anything is not of the expected shape
+    """
+    if not isinstance(watches, list):
+        raise ValueError("watches is not a list")
+    parsed = {}
+    for watch in watches:
+        if not isinstance(watch, dict):
+            raise ValueError("watch is not an object")
+        path, recursive, dirs = watch.get("path"), watch.get("recursive"), watch.get("dirs")
+        if not isinstance(path, str) or not isinstance(recursive, bool) or not isinstance(dirs, dict):
+            raise ValueError("malformed watch")
+        parsed_dirs = {}
+        for dir_path, state in dirs.items():
+            if dir_path != path and not dir_path.startswith(os.path.join(path, "")):
+                raise ValueError(f"folder {dir_path!r} outside {path!r}")
+            if not isinstance(state, list) or len(state) != 2:
+                raise ValueError(f"malformed folder {dir_path!r}")
+            mtime, entries = state
+            if (mtime is not None and not _is_int(mtime)) or not isinstance(entries, dict):
+                raise ValueError(f"malformed folder {dir_path!r}")
+            for name, values in entries.items():
+                if (
+                    not name or "/" in name or os.sep in name
+                    or not isinstance(values, list) or len(values) != 4
+                    or not all(_is_int(value) for value in values[:3]) or not isinstance(values[3], bool)
+                ):
+                    raise ValueError(f"malformed entry {name!r} in {dir_path!r}")
+            parsed_dirs[dir_path] = (mtime, {name: tuple(values) for name, values in entries.items()})
+        parsed[(path, recursive)] = parsed_dirs
+    return parsed
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Sampling profiler covering every thread of the running watcher.
+"""
+
+import collections
+import os
+import sys
+import threading
+from logger import setup_logging
+
+# Without /proc, leaf frames in these files are taken to mean the thread was waiting
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py", "socketserver.py")
+_PROC_TASKS = f"/proc/{os.getpid()}/task"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval.
+
+    cProfile only sees the thread that enabled it, while the watcher's work
+    happens on worker, settle and OpenAI threads; sampling
+    sys._current_frames() covers all of them at a cost that does not depend
+    on how many calls the code makes.
+
+    Output is in the collapsed-stack format ("frame;frame;frame count") read
+    by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005, skip_main_thread=True, logger=None):
+        """
+        Args:
+            interval (float): Seconds between samples
+            skip_main_thread (bool): Ignore the main thread (the watch loop
+                only sleeps there)
+            logger: Logger instance to use for logging
+        """
+        self.interval = interval
+        self.skip_main_thread = skip_main_thread
+        self.logger = logger or setup_logging()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._finished = threading.Lock()
+
+    def run_for(self, seconds, path):
+        """
+        Sample for a window, then write the report to path. finish() may be
+        called earlier (e.g. on Ctrl+C) to cut the window short.
+        """
+        self.start()
+        self.logger.info("Profiling all threads for %.0fs", seconds)
+        timer = threading.Timer(seconds, self.finish, args=(path,))
+        timer.daemon = True
+        timer.start()
+
+    def finish(self, path):
+        """
+        Stop sampling and write the report, once.
+        """
+        if not self._finished.acquire(blocking=False):
+            return
+        self.stop()
+        self.report(path)
+
+    def start(self):
+        """
+        Start sampling on a background thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="mk-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, path):
+        """
+        Write the collapsed stacks to path.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, limit=15):
+        """
+        Return the functions seen most often at the top of busy stacks.
+
+        Returns:
+            list: (function, self samples, inclusive samples)
+        """
+        own = collections.Counter()
+        inclusive = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+        return [(frame, count, inclusive[frame]) for frame, count in own.most_common(limit)]
+
+    def report(self, path):
+        """
+        Write the profile to path and log the hottest functions.
+        """
+        self.write(path)
+        busy = self.samples - self.idle_samples
+        self.logger.info(
+            "Profile written to %s (%d samples, %d busy)", path, self.samples, busy
+        )
+        for frame, own, inclusive in self.top():
+            self.logger.info(
+                "  %5.1f%% self %5.1f%% total  %s",
+                own * 100 / max(busy, 1), inclusive * 100 / max(busy, 1), frame,
+            )
+
+    def _run(self):
+        skipped = {threading.get_ident()}
+        if self.skip_main_thread:
+            skipped.add(threading.main_thread().ident)
+        while not self._stop_event.wait(self.interval):
+            native_ids = {thread.ident: thread.native_id for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in skipped:
+                    continue
+                self.samples += 1
+                if self._is_idle(native_ids.get(thread_id), frame):
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+
+    @staticmethod
+    def _is_idle(native_id, frame):
+        """
+        Return True if the thread is blocked rather than running.
+
+        On Linux the kernel scheduler state is authoritative ("R" = running);
+        elsewhere fall back to guessing from the innermost Python frame.
+        """
+        if native_id is not None:
+            try:
+                with open(f"{_PROC_TASKS}/{native_id}/stat", "rb") as f:
+                    stat = f.read()
+                # Format: "tid (comm) S ..."; comm may contain spaces or parens
+                return stat[stat.rindex(b")") + 2:stat.rindex(b")") + 3] != b"R"
+            except OSError:
+                pass
+        return os.path.basename(frame.f_code.co_filename) in _IDLE_FILES
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Startup reconciliation: find files already sitting in the watch folder.
+"""
+
+import os
+
+
+def iter_backlog(folder_path, skip_name=None, recursive=False, excluded=()):
+    """
+    Stream regular files inside a folder without building a list.
+
+    Args:
+        folder_path (str or Path): Folder to scan
+        skip_name (callable): Optional predicate; names for which it returns
+            True are not yielded (e.g. in-progress downloads)
+        recursive (bool): Also descend into subfolders
+        excluded (iterable): Folders not to descend into (e.g. category folders
+            inside the watched tree)
+
+    Yields:
+        os.DirEntry: Entries for regular files; their cached stat data is
+        available via entry.stat()
+    """
+    excluded = {os.fspath(folder) for folder in excluded}
+    stack = [os.fspath(folder_path)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                # is_file()/is_dir() use the d_type from readdir, no extra syscall on Linux
+                if entry.is_file(follow_symlinks=False):
+                    if skip_name is not None and skip_name(entry.name):
+                        continue
+                    yield entry
+                elif recursive and entry.is_dir(follow_symlinks=False) and entry.path not in excluded:
+                    stack.append(entry.path)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Watch roots: the inbox folders being organized, each with its own rules
+and destination folders.
+"""
+
+import json
+import os
+from pathlib import Path
+from config import (
+    WATCH_FOLDER, WATCH_ROOTS_FILE, WATCH_BACKEND, STATE_FOLDER, DUPLICATES_FOLDER,
+    ORGANIZE_RULES, NAME_RULES, SIZE_RULES,
+    IMAGES_FOLDER, DOCUMENTS_FOLDER, INSTALLERS_FOLDER,
+    ARCHIVES_FOLDER, MEDIA_FOLDER, MISC_FOLDER
+)
+
+
+def _expand(path):
+    return Path(os.path.abspath(os.path.expanduser(str(path))))
+
+
+class WatchRoot:
+    """
+    One watched inbox folder and where its files go.
+    """
+
+    def __init__(self, path, recursive=False, dest_root=None, organize_rules=None,
+                 name_rules=None, size_rules=None, category_folders=None, backend=None,
+                 defaults=None):
+        """
+        Args:
+            path (str or Path): Folder to watch
+            recursive (bool): Also organize files in subfolders
+            dest_root (str or Path): Folder the category folders are created in;
+                defaults to the watched folder itself
+            organize_rules (dict): Extension rules; defaults to ORGANIZE_RULES
+            name_rules (list): Name rules; defaults to NAME_RULES
+            size_rules (list): Size rules; defaults to SIZE_RULES
+            category_folders (dict): Explicit category -> folder mapping; categories
+                it leaves out go to dest_root/<category>
+            backend (str): "native" or "polling"; defaults to WATCH_BACKEND
+            defaults (dict): Rules used instead of config.py for the rule
+                arguments left out, e.g. from a rules file
+        """
+        self.path = _expand(path)
+        self.recursive = bool(recursive)
+        self.backend = backend or WATCH_BACKEND
+        if self.backend not in ("native", "polling"):
+            raise ValueError(f"Unknown watch backend {self.backend!r} for {self.path}")
+        self.dest_root = _expand(dest_root) if dest_root else self.path
+        # Kept so with_defaults() can tell the root's own settings from inherited ones
+        self._own = (organize_rules, name_rules, size_rules, category_folders)
+        defaults = defaults or {}
+        if organize_rules is None:
+            organize_rules = defaults.get("organize_rules", ORGANIZE_RULES)
+        if name_rules is None:
+            name_rules = defaults.get("name_rules", NAME_RULES)
+        if size_rules is None:
+            size_rules = defaults.get("size_rules", SIZE_RULES)
+        self.organize_rules = organize_rules
+        self.name_rules = [tuple(rule) for rule in name_rules]
+        self.size_rules = [tuple(rule) for rule in size_rules]
+        categories = list(self.organize_rules) + ["Documents", "Misc"]
+        folders = {category: self.dest_root / category for category in categories}
+        folders.update(category_folders or {})
+        self.category_folders = {name: _expand(folder) for name, folder in folders.items()}
+
+    def __repr__(self):
+        return f"WatchRoot({str(self.path)!r}, recursive={self.recursive})"
+
+    def with_defaults(self, defaults):
+        """
+        Return a copy of this root whose rules not set on the root itself
+        come from `defaults` (see rules.load_rules_file()).
+        """
+        organize_rules, name_rules, size_rules, category_folders = self._own
+        return WatchRoot(
+            self.path, self.recursive, self.dest_root, organize_rules, name_rules, size_rules,
+            category_folders, self.backend, defaults,
+        )
+
+    def owns(self, path):
+        """
+        Return True if a file path falls under this root (ignoring exclusions).
+        """
+        path = Path(path)
+        if not self.recursive:
+            return path.parent == self.path
+        return self.path in path.parents
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a root from one entry of the WATCH_ROOTS_FILE JSON list.
+        """
+        return cls(
+            data["path"],
+            recursive=data.get("recursive", False),
+            dest_root=data.get("dest_root"),
+            organize_rules=data.get("organize_rules"),
+            name_rules=data.get("name_rules"),
+            size_rules=data.get("size_rules"),
+            category_folders=data.get("category_folders"),
+            backend=data.get("backend"),
+        )
+
+
+def default_root():
+    """
+    The single root configured by WATCH_FOLDER and the *_FOLDER settings.
+    """
+    return WatchRoot(WATCH_FOLDER, category_folders={
+        "Images": IMAGES_FOLDER,
+        "Documents": DOCUMENTS_FOLDER,
+        "Installers": INSTALLERS_FOLDER,
+        "Archives": ARCHIVES_FOLDER,
+        "Media": MEDIA_FOLDER,
+        "Misc": MISC_FOLDER,
+    })
+
+
+def load_watch_roots(roots_file=None):
+    """
+    Load the watch roots from WATCH_ROOTS_FILE, or the default root when unset.
+
+    Args:
+        roots_file (str | None): JSON file with a list of root objects; defaults
+            to WATCH_ROOTS_FILE from config.py
+
+    Returns:
+        list: WatchRoot instances
+    """
+    roots_file = roots_file or WATCH_ROOTS_FILE
+    if not roots_file:
+        return [default_root()]
+    with open(os.path.expanduser(roots_file), encoding="utf-8") as f:
+        entries = json.load(f)
+    roots = [WatchRoot.from_dict(entry) for entry in entries]
+    if not roots:
+        raise ValueError(f"No watch roots defined in {roots_file}")
+    return roots
+
+
+def excluded_folders(roots):
+    """
+    Folders whose contents must never be treated as new inbox files: every
+    root's category folders, the state folder and the duplicates quarantine.
+    Our own moves into these folders therefore never re-enter the pipeline.
+    """
+    folders = {_expand(STATE_FOLDER), _expand(DUPLICATES_FOLDER)}
+    for root in roots:
+        folders.update(root.category_folders.values())
+    return folders
+
+
+def as_roots(roots):
+    """
+    Normalize a folder path, a WatchRoot or a list of them to a list of roots.
+    WATCH_FOLDER itself maps to the default root so the *_FOLDER settings apply.
+    """
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+    normalized = []
+    for root in roots:
+        if not isinstance(root, WatchRoot):
+            root = default_root() if _expand(root) == _expand(WATCH_FOLDER) else WatchRoot(root)
+        normalized.append(root)
+    return normalized
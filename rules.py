@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Precompiled classification rules: ORGANIZE_RULES, name rules and size rules
+compiled once into a single lookup structure, optionally loaded from a rules
+file that is reloaded when it changes.
+"""
+
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+from types import MappingProxyType
+from logger import setup_logging
+from metrics import registry as metrics
+
+
+class CompiledRules:
+    """
+    Immutable dispatch structure built from the rule configuration.
+
+    Lookup order: name rules (one combined regex), then size rules, then the
+    extension index (longest multi-part suffix first, e.g. ".tar.gz" before ".gz").
+    """
+
+    __slots__ = (
+        "extensions", "max_suffix_parts", "_multi_tails",
+        "_name_regex", "_name_categories", "size_rules",
+    )
+
+    def __init__(self, extensions, name_rules=(), size_rules=()):
+        """
+        Args:
+            extensions (dict): Lowercase suffix (".pdf", ".tar.gz") -> category
+            name_rules (iterable): (pattern, category); pattern is "glob:<glob>" or
+                "re:<regex>", matched case-insensitively against the file name
+            size_rules (iterable): (min_bytes, max_bytes or None, category)
+        """
+        self.extensions = MappingProxyType(dict(extensions))
+        self.max_suffix_parts = max((ext.count(".") for ext in self.extensions), default=1)
+        # Last suffixes of multi-part entries (".gz" for ".tar.gz"); only names
+        # ending in one of these need the longer suffix search
+        self._multi_tails = frozenset(
+            ext[ext.rfind("."):] for ext in self.extensions if ext.count(".") > 1
+        )
+
+        branches = []
+        categories = {}
+        for index, (pattern, category) in enumerate(name_rules):
+            if pattern.startswith("glob:"):
+                regex = fnmatch.translate(pattern[len("glob:"):])
+            elif pattern.startswith("re:"):
+                regex = pattern[len("re:"):]
+            else:
+                raise ValueError(f"Name rule must start with 'glob:' or 're:': {pattern}")
+            group = f"r{index}"
+            branches.append(f"(?P<{group}>{regex})")
+            categories[group] = category
+        self._name_regex = re.compile("|".join(branches), re.IGNORECASE) if branches else None
+        self._name_categories = MappingProxyType(categories)
+        self.size_rules = tuple(size_rules)
+
+    def lookup(self, name, size=None):
+        """
+        Find the category for a file name.
+
+        Args:
+            name (str): File name (not a full path)
+            size (int | None): File size in bytes; size rules are skipped when None
+
+        Returns:
+            str | None: Category, or None when no rule matches
+        """
+        if self._name_regex is not None:
+            match = self._name_regex.match(name)
+            if match:
+                return self._name_categories[match.lastgroup]
+
+        if size is not None and self.size_rules:
+            for min_size, max_size, category in self.size_rules:
+                if size >= min_size and (max_size is None or size < max_size):
+                    return category
+
+        return self.lookup_extension(name)
+
+    def lookup_extension(self, name):
+        """
+        Find the category for a file name by its suffixes only.
+        """
+        lowered = name.lower()
+        dot = lowered.rfind(".")
+        if dot <= 0:
+            # No suffix, or a dotfile like ".bashrc"
+            return None
+        if lowered[dot:] not in self._multi_tails:
+            return self.extensions.get(lowered[dot:])
+
+        first = dot
+        for _ in range(self.max_suffix_parts - 1):
+            dot = lowered.rfind(".", 0, first)
+            if dot <= 0:
+                break
+            first = dot
+        # Try the longest candidate suffix first, then shorter ones
+        start = first
+        while 0 < start < len(lowered):
+            category = self.extensions.get(lowered[start:])
+            if category is not None:
+                return category
+            start = lowered.find(".", start + 1)
+        return None
+
+
+def compile_rules(organize_rules, name_rules=(), size_rules=(), logger=None):
+    """
+    Compile the rule configuration, warning about duplicate and conflicting entries.
+
+    Args:
+        organize_rules (dict): category -> list of extensions (ORGANIZE_RULES)
+        name_rules (iterable): (pattern, category) name rules
+        size_rules (iterable): (min_bytes, max_bytes or None, category) size rules
+        logger: Logger instance to use for logging
+
+    Returns:
+        CompiledRules: The compiled rules
+    """
+    logger = logger or setup_logging()
+    extensions = {}
+    for category, suffixes in organize_rules.items():
+        seen = set()
+        for suffix in suffixes:
+            ext = suffix.lower()
+            if not ext.startswith("."):
+                ext = f".{ext}"
+            if ext in seen:
+                logger.warning("Duplicate extension %s in ORGANIZE_RULES[%r]", ext, category)
+                continue
+            seen.add(ext)
+            if ext in extensions:
+                logger.warning(
+                    "Extension %s is listed under both %r and %r; keeping %r",
+                    ext, extensions[ext], category, extensions[ext],
+                )
+                continue
+            extensions[ext] = category
+
+    known = set(organize_rules) | {"Documents", "Misc"}
+    for _, category in name_rules:
+        if category not in known:
+            logger.warning("Name rule targets unknown category %r", category)
+    for _, _, category in size_rules:
+        if category not in known:
+            logger.warning("Size rule targets unknown category %r", category)
+
+    return CompiledRules(extensions, name_rules, size_rules)
+
+
+RULE_KEYS = ("organize_rules", "name_rules", "size_rules")
+
+
+def _parse_rules_text(path, text):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError("TOML rules files need Python 3.11+ or the tomli package") from None
+        return tomllib.loads(text)
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML rules files need the pyyaml package") from None
+        return yaml.safe_load(text) or {}
+    if suffix == ".json":
+        return json.loads(text)
+    raise ValueError(f"Unsupported rules file type {suffix!r} (use .toml, .yaml or .json)")
+
+
+def _size_rule(rule):
+    # TOML has no null, so tables with an optional "max" are accepted besides lists
+    if isinstance(rule, dict):
+        return (int(rule["min"]), rule.get("max"), rule["category"])
+    min_size, max_size, category = rule
+    return (int(min_size), max_size if max_size not in ("", None) else None, category)
+
+
+def load_rules_file(path):
+    """
+    Read rule settings from a TOML, YAML or JSON file.
+
+    The file may set "organize_rules" (category -> extensions), "name_rules"
+    ([pattern, category] pairs) and "size_rules" ([min_bytes, max_bytes, category],
+    or tables with min, max and category). Keys left out fall back to config.py.
+
+    Args:
+        path (str): Rules file
+
+    Returns:
+        dict: The keys present in the file, normalized
+
+    Raises:
+        ValueError: The file is malformed or the rules do not compile
+        RuntimeError: The parser for the file type is not installed
+    """
+    with open(os.path.expanduser(path), encoding="utf-8") as f:
+        data = _parse_rules_text(path, f.read())
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a table of rule settings")
+    unknown = set(data) - set(RULE_KEYS)
+    if unknown:
+        raise ValueError(f"{path}: unknown keys {sorted(unknown)}")
+    values = {}
+    try:
+        if "organize_rules" in data:
+            values["organize_rules"] = {
+                str(category): [str(ext) for ext in suffixes]
+                for category, suffixes in data["organize_rules"].items()
+            }
+        if "name_rules" in data:
+            values["name_rules"] = [
+                (rule["pattern"], rule["category"]) if isinstance(rule, dict) else tuple(rule)
+                for rule in data["name_rules"]
+            ]
+        if "size_rules" in data:
+            values["size_rules"] = [_size_rule(rule) for rule in data["size_rules"]]
+        # Catch bad patterns now rather than on the first file
+        CompiledRules({}, values.get("name_rules", ()), values.get("size_rules", ()))
+    except (AttributeError, KeyError, TypeError, re.error) as e:
+        raise ValueError(f"{path}: invalid rules: {type(e).__name__}: {e}") from None
+    return values
+
+
+class RulesFile:
+    """
+    A rules file checked for changes in the background.
+
+    Readers use `values`, a dict that is replaced, never mutated, so reading
+    it needs no lock. A stat() every `interval` seconds detects edits,
+    including editors that save by renaming a new file over the old one.
+    A file that fails to load is logged and the previous rules stay in effect.
+    """
+
+    def __init__(self, path, interval=2.0, logger=None):
+        """
+        Args:
+            path (str): Rules file (.toml, .yaml or .json)
+            interval (float): Seconds between checks for changes
+            logger: Logger instance to use for logging
+
+        Raises:
+            OSError, ValueError, RuntimeError: The initial load failed
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.interval = interval
+        self.logger = logger or setup_logging()
+        self._signature = self._stat()
+        self.values = load_rules_file(self.path)
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def subscribe(self, callback):
+        """
+        Call callback(values) after each successful reload.
+        """
+        self._listeners.append(callback)
+
+    def start(self):
+        """
+        Start checking for changes.
+        """
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="mk-rules", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop checking for changes.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self):
+        """
+        Reload the file if it changed since the last check.
+
+        Returns:
+            bool: True if new rules were loaded
+        """
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        if signature is None:
+            self.logger.warning("Rules file %s is gone; keeping the current rules", self.path)
+            return False
+        try:
+            values = load_rules_file(self.path)
+        except (OSError, ValueError, RuntimeError) as e:
+            self.logger.error("Not reloading %s: %s", self.path, e)
+            metrics.inc("rules_reload_failures_total")
+            return False
+        self.values = values
+        metrics.inc("rules_reloads_total")
+        self.logger.info("Reloaded rules from %s", self.path)
+        for callback in self._listeners:
+            callback(values)
+        return True
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                self.logger.exception("Applying rules from %s failed", self.path)
+
+
+def benchmark_lookup(rules, names, organize_rules, iterations=100000):
+    """
+    Time rule lookups against the linear ORGANIZE_RULES scan they replace.
+
+    Args:
+        rules (CompiledRules): Compiled rules to benchmark
+        names (list): Sample file names
+        organize_rules (dict): Uncompiled rules for the linear scan
+        iterations (int): Number of lookups per variant
+
+    Returns:
+        dict: Nanoseconds per lookup for "compiled" and "linear"
+    """
+    linear_rules = organize_rules
+
+    def linear(name):
+        ext = name[name.rfind("."):].lower() if "." in name else ""
+        for category, extensions in linear_rules.items():
+            if ext in extensions:
+                return category
+        return None
+
+    results = {}
+    for label, func in (("compiled", rules.lookup), ("linear", linear)):
+        count = len(names)
+        started = time.perf_counter()
+        for i in range(iterations):
+            func(names[i % count])
+        results[label] = (time.perf_counter() - started) * 1e9 / iterations
+    return results
+
+
+if __name__ == "__main__":
+    from config import ORGANIZE_RULES, NAME_RULES, SIZE_RULES
+
+    sample = [
+        "photo.JPG", "report.pdf", "setup.exe", "backup.tar.gz", "song.m4b",
+        "notes", "unknown.xyz", "movie.m4v", "archive.7z", "data.bin",
+    ]
+    compiled = compile_rules(ORGANIZE_RULES, NAME_RULES, SIZE_RULES)
+    timings = benchmark_lookup(compiled, sample, ORGANIZE_RULES)
+    for label, ns in timings.items():
+        print(f"{label:>8}: {ns:8.1f} ns/lookup")
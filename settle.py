@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Settle scheduler that holds files back until they have stopped changing.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from logger import setup_logging
+
+
+class _Pending:
+    """
+    Per-path settle state.
+    """
+    __slots__ = ("deadline", "size", "mtime")
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.size = None
+        self.mtime = None
+
+
+class SettleScheduler:
+    """
+    Merges created/modified/moved events per path and fires a callback once
+    the file's size and mtime have been stable for the settle window.
+
+    All pending paths live on a single hashed timer wheel driven by one
+    thread, so a burst of thousands of downloads costs one thread, not one
+    timer per file.
+
+    The callback may block (a full pipeline lane), which stalls the wheel.
+    New paths are then held back in touch() once max_pending paths are
+    waiting, so the backpressure reaches the event source instead of the
+    pending map growing without bound.
+    """
+
+    def __init__(self, callback, settle_seconds=2.0, temp_suffixes=(),
+                 tick=0.25, wheel_size=512, max_pending=0, logger=None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            callback (callable): Called with the Path of each settled file
+            settle_seconds (float): Seconds a file must stay unchanged
+            temp_suffixes (iterable): In-progress download suffixes (e.g. ".part")
+                that are held until renamed to their final name
+            tick (float): Timer wheel resolution in seconds
+            wheel_size (int): Number of wheel slots
+            max_pending (int): Paths waiting to settle before touch() blocks
+                on new ones (0 = no limit)
+            logger: Logger instance to use for logging
+        """
+        self.callback = callback
+        self.settle_seconds = max(0.0, float(settle_seconds))
+        self.temp_suffixes = tuple(s.lower() for s in temp_suffixes)
+        self.tick = tick
+        self.logger = logger or setup_logging()
+        self._slots = [set() for _ in range(wheel_size)]
+        self._pending = {}
+        self.max_pending = max_pending
+        self._current_tick = 0
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_temporary(self, path):
+        """
+        Return True if the path looks like an in-progress download.
+        """
+        return Path(path).name.lower().endswith(self.temp_suffixes) if self.temp_suffixes else False
+
+    def touch(self, path):
+        """
+        Record activity on a path and (re)start its settle window.
+        Blocks on new paths while max_pending paths are already waiting.
+
+        Args:
+            path (str or Path): Path of the created or modified file
+        """
+        path = Path(path)
+        if self.is_temporary(path):
+            self.logger.debug("Holding in-progress download until renamed: %s", path.name)
+            return
+        with self._lock:
+            pending = self._pending.get(path)
+            if pending is None and 0 < self.max_pending <= len(self._pending):
+                self._wait_for_room()
+                pending = self._pending.get(path)
+            deadline = self._current_tick + self._ticks(self.settle_seconds)
+            if pending is None:
+                self._pending[path] = _Pending(deadline)
+                self._insert(path, deadline)
+            else:
+                # Already on the wheel; it is re-slotted lazily when its old slot fires
+                pending.deadline = deadline
+
+    def rename(self, src_path, dest_path):
+        """
+        Follow a rename: forget the old path and settle the new one.
+
+        Args:
+            src_path (str or Path): Old path
+            dest_path (str or Path): New path
+        """
+        self.discard(src_path)
+        self.touch(dest_path)
+
+    def discard(self, path):
+        """
+        Stop tracking a path.
+        """
+        with self._lock:
+            if self._pending.pop(Path(path), None) is not None:
+                self._room.notify()
+
+    def pending_count(self):
+        """
+        Return the number of paths waiting to settle.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def start(self):
+        """
+        Start the timer wheel thread.
+        """
+        self._thread = threading.Thread(target=self._run, name="mk-settle", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the timer wheel thread. Unsettled paths are dropped.
+        """
+        self._stop_event.set()
+        with self._lock:
+            self._room.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _wait_for_room(self):
+        """
+        Wait, holding the lock, until fewer than max_pending paths are waiting.
+        """
+        self.logger.warning(
+            "%d files waiting to settle, holding back new events until the workers catch up",
+            len(self._pending),
+        )
+        started = time.monotonic()
+        while len(self._pending) >= self.max_pending and not self._stop_event.is_set():
+            self._room.wait(1.0)
+        self.logger.warning("Settler accepted new events after %.2fs", time.monotonic() - started)
+
+    def _ticks(self, seconds):
+        return max(1, int(-(-seconds // self.tick)))
+
+    def _insert(self, path, deadline):
+        self._slots[deadline % len(self._slots)].add(path)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+            with self._lock:
+                self._current_tick += 1
+                slot = self._slots[self._current_tick % len(self._slots)]
+                due = []
+                for path in list(slot):
+                    pending = self._pending.get(path)
+                    if pending is None:
+                        slot.discard(path)
+                    elif pending.deadline <= self._current_tick:
+                        slot.discard(path)
+                        due.append((path, pending))
+                    elif pending.deadline % len(self._slots) != self._current_tick % len(self._slots):
+                        # Deadline moved by a later touch; re-slot it
+                        slot.discard(path)
+                        self._insert(path, pending.deadline)
+            for path, pending in due:
+                self._check(path, pending)
+
+    def _check(self, path, pending):
+        """
+        Fire the callback if the file is stable, otherwise push it back a window.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.discard(path)
+            return
+        except OSError as e:
+            self.logger.warning("Could not stat %s while settling: %s", path, e)
+            self.discard(path)
+            return
+
+        unchanged = pending.size is None or (pending.size, pending.mtime) == (st.st_size, st.st_mtime)
+        quiet_for = time.time() - st.st_mtime
+        if unchanged and quiet_for >= self.settle_seconds:
+            with self._lock:
+                if self._pending.get(path) is not pending:
+                    return
+                del self._pending[path]
+                self._room.notify()
+            try:
+                self.callback(path)
+            except Exception as e:
+                self.logger.error("Settle callback failed for %s: %s", path, e)
+            return
+
+        with self._lock:
+            if self._pending.get(path) is not pending:
+                return
+            pending.size, pending.mtime = st.st_size, st.st_mtime
+            wait = max(self.settle_seconds - max(quiet_for, 0.0), self.tick)
+            pending.deadline = self._current_tick + self._ticks(wait)
+            self._insert(path, pending.deadline)
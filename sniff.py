@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Content sniffing: identify a file's format from its first bytes.
+"""
+
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from metrics import registry as metrics
+
+# (regex matched at offset 0, extension). Order matters: the first matching
+# entry wins, so specific signatures come before generic ones.
+SIGNATURES = (
+    (rb"%PDF-", ".pdf"),
+    (rb"\x89PNG\r\n\x1a\n", ".png"),
+    (rb"\xff\xd8\xff", ".jpg"),
+    (rb"GIF8[79]a", ".gif"),
+    (rb"RIFF.{4}WEBP", ".webp"),
+    (rb"RIFF.{4}WAVE", ".wav"),
+    (rb"BM.{4}\x00\x00\x00\x00", ".bmp"),
+    (rb"II\*\x00|MM\x00\*", ".tiff"),
+    (rb"\x00\x00\x01\x00[\x01-\x20]\x00", ".ico"),
+    (rb"PK\x03\x04|PK\x05\x06", ".zip"),
+    (rb"Rar!\x1a\x07", ".rar"),
+    (rb"7z\xbc\xaf\x27\x1c", ".7z"),
+    (rb"\x1f\x8b\x08", ".gz"),
+    (rb"BZh[1-9]1AY&SY", ".bz2"),
+    (rb"\xfd7zXZ\x00", ".xz"),
+    (rb".{257}ustar", ".tar"),
+    (rb".{4}ftyp", ".mp4"),
+    (rb"ID3|\xff[\xfb\xf3\xf2\xfa]", ".mp3"),
+    (rb"fLaC", ".flac"),
+    (rb"OggS", ".ogg"),
+    (rb"FORM.{4}AIF[FC]", ".aiff"),
+    (rb"\x30\x26\xb2\x75\x8e\x66\xcf\x11", ".wma"),
+    (rb"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", ".ole"),
+    (rb"!<arch>\ndebian", ".deb"),
+    (rb"\xed\xab\xee\xdb", ".rpm"),
+    (rb"xar!", ".pkg"),
+    (rb"MZ", ".exe"),  # Only with a PE header, see _is_pe()
+)
+
+# Containers whose members or brand tell the actual format apart
+_ZIP_MEMBERS = ((b"word/", ".docx"), (b"xl/", ".xlsx"), (b"ppt/", ".pptx"))
+_OLE_NAMES = (
+    ("WordDocument".encode("utf-16-le"), ".doc"),
+    ("Workbook".encode("utf-16-le"), ".xls"),
+    ("PowerPoint".encode("utf-16-le"), ".ppt"),
+)
+_FTYP_BRANDS = {b"M4A ": ".m4a", b"M4B ": ".m4b", b"M4P ": ".m4p", b"M4V ": ".m4v", b"qt  ": ".mov"}
+
+# Bytes that never occur in text (NUL and most C0 controls)
+_BINARY_BYTES = bytes(set(range(32)) - {7, 8, 9, 10, 12, 13, 27})
+
+
+def compile_signatures(signatures=SIGNATURES):
+    """
+    Combine the signature table into one anchored regex.
+
+    Returns:
+        tuple: (compiled regex, group name -> extension)
+    """
+    branches = []
+    extensions = {}
+    for index, (pattern, ext) in enumerate(signatures):
+        group = f"s{index}"
+        branches.append(b"(?P<%s>%s)" % (group.encode(), pattern))
+        extensions[group] = ext
+    return re.compile(b"|".join(branches), re.DOTALL), extensions
+
+
+_SIGNATURE_REGEX, _SIGNATURE_EXTENSIONS = compile_signatures()
+
+
+def identify(head, text=True):
+    """
+    Identify a format from the leading bytes of a file.
+
+    Args:
+        head (bytes): The first bytes of the file
+        text (bool): Report plain text as ".txt"; otherwise text is unknown
+
+    Returns:
+        str | None: Extension of the detected format (".pdf", ".docx", ".txt", ...)
+    """
+    match = _SIGNATURE_REGEX.match(head)
+    ext = _SIGNATURE_EXTENSIONS[match.lastgroup] if match is not None else None
+    if ext is None or (ext == ".exe" and not _is_pe(head)):
+        return ".txt" if text and _looks_like_text(head) else None
+    if ext == ".zip":
+        for member, member_ext in _ZIP_MEMBERS:
+            if member in head:
+                return member_ext
+    elif ext == ".ole":
+        for name, ole_ext in _OLE_NAMES:
+            if name in head:
+                return ole_ext
+        return None  # Could be an installer (.msi) as well as an Office file
+    elif ext == ".mp4":
+        return _FTYP_BRANDS.get(head[8:12], ".mp4")
+    return ext
+
+
+def _is_pe(head):
+    """
+    Return True if an "MZ" header points at a "PE\\0\\0" signature within head.
+    """
+    if len(head) < 0x40:
+        return False
+    offset = int.from_bytes(head[0x3C:0x40], "little")
+    return head[offset:offset + 4] == b"PE\0\0"
+
+
+def _looks_like_text(head):
+    if not head:
+        return False
+    if head.translate(None, _BINARY_BYTES) != head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the read is fine
+        return e.start >= len(head) - 3
+    return True
+
+
+class ContentSniffer:
+    """
+    Maps file content to a category through the same extension rules.
+
+    Reads at most max_bytes with a single pread. Results are memoized by
+    (device, inode, size, mtime), so rescans and retries of an unchanged
+    file never read it again.
+    """
+
+    def __init__(self, rules, max_bytes=4096, ambiguous_extensions=(), memo_size=10000):
+        """
+        Args:
+            rules (CompiledRules): Rules whose extension index maps formats to categories
+            max_bytes (int): Bytes read from the start of a file
+            ambiguous_extensions (iterable): Suffixes that are sniffed even
+                when a rule lists them (".bin", ".dat")
+            memo_size (int): Most recent results kept
+        """
+        self.rules = rules
+        self.max_bytes = max_bytes
+        self.ambiguous = frozenset(ext.lower() for ext in ambiguous_extensions)
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def with_rules(self, rules):
+        """
+        Return a sniffer mapping formats through new rules that shares this
+        one's memo.
+        """
+        sniffer = copy.copy(self)
+        sniffer.rules = rules
+        return sniffer
+
+    def wants(self, name, category):
+        """
+        Return True if a file's content should decide its category: it has
+        no extension and no rule matched its name, or its extension is a
+        generic one. Files with any other unlisted extension are not read.
+        """
+        dot = name.rfind(".")
+        if dot <= 0:
+            return category is None
+        return name[dot:].lower() in self.ambiguous
+
+    def category(self, path, st=None):
+        """
+        Return the category for a file's content, or None when unknown.
+        """
+        ext = self.sniff(path, st)
+        if ext is None:
+            return None
+        # ".xz" is only listed as ".tar.xz" by default
+        return self.rules.lookup_extension(ext) or self.rules.lookup_extension(".tar" + ext)
+
+    def sniff(self, path, st=None):
+        """
+        Identify a file's format from its first bytes. Plain text is only
+        reported for files without an extension: a generic extension such as
+        ".dat" is no evidence of a text document.
+
+        Args:
+            path (str or Path): File to look at
+            st (os.stat_result): Its stat result, if already known
+
+        Returns:
+            str | None: Detected extension, or None when unknown or unreadable
+        """
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        text = os.path.basename(path).rfind(".") <= 0
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, text)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                metrics.inc("sniff_memo_hits_total")
+                return self._memo[key]
+        try:
+            head = _read_head(path, self.max_bytes)
+        except OSError:
+            return None
+        metrics.inc("sniff_reads_total")
+        ext = identify(head, text)
+        with self._lock:
+            self._memo[key] = ext
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return ext
+
+
+def _read_head(path, size):
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, 0)
+        return os.read(fd, size)  # Windows: a fresh descriptor starts at offset 0
+    finally:
+        os.close(fd)
+
+
+def benchmark_identify(iterations=100000):
+    """
+    Time identify() on the first 4 KiB of a few common formats.
+
+    Returns:
+        float: Microseconds per call
+    """
+    samples = [
+        b"%PDF-1.7\n" + bytes(4087),
+        b"PK\x03\x04" + bytes(26) + b"word/document.xml" + bytes(4049),
+        b"\x00\x00\x00\x20ftypM4A " + bytes(4084),
+        ("plain text " * 400).encode()[:4096],
+        bytes(range(256)) * 16,
+    ]
+    started = time.perf_counter()
+    for i in range(iterations):
+        identify(samples[i % len(samples)])
+    return (time.perf_counter() - started) * 1e6 / iterations
+
+
+if __name__ == "__main__":
+    print(f"identify: {benchmark_identify():.2f} us/file")
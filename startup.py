@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Startup cost report: wall time to first event for the watcher, wall time
+for the CLI subcommands, and the slowest imports of each (python -X importtime).
+
+Run: python startup.py [--runs N] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Subcommands timed to exit; "watch" is timed to its first event instead
+COMMANDS = {
+    "help": ["--help"],
+    "undo": ["undo", "--last", "0", "--dry-run"],
+    "organize": ["organize", "{inbox}", "--dry-run", "--plan", os.devnull, "--max-workers", "1"],
+}
+
+
+def _environment(folder):
+    env = dict(os.environ)
+    env.update({
+        "WATCH_FOLDER": os.path.join(folder, "inbox"),
+        "STATE_FOLDER": os.path.join(folder, "state"),
+        "METRICS_PORT": "0",
+    })
+    env.pop("WATCH_ROOTS_FILE", None)
+    os.makedirs(env["WATCH_FOLDER"], exist_ok=True)
+    return env
+
+
+def time_watch(folder, importtime=False):
+    """
+    Start `main.py watch`, create a file once it is up, and return the seconds
+    from process start until the watcher handled that file's event.
+
+    Returns:
+        tuple: (seconds, stderr text)
+    """
+    env = _environment(folder)
+    env["LOG_LEVEL"] = "DEBUG"
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [MAIN, "watch"]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=folder, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    lines = []
+    elapsed = None
+    try:
+        for line in process.stderr:
+            lines.append(line)
+            if "File watcher started" in line:
+                probe = os.path.join(env["WATCH_FOLDER"], f"probe-{os.getpid()}-{started}.txt")
+                with open(probe, "w") as f:
+                    f.write("probe")
+            elif "Created event detected" in line:
+                elapsed = time.perf_counter() - started
+                break
+    finally:
+        process.terminate()
+        rest = process.communicate(timeout=30)[1]
+    if elapsed is None:
+        raise RuntimeError("watcher exited before its first event:\n" + "".join(lines) + rest)
+    return elapsed, "".join(lines) + rest
+
+
+def time_command(folder, args, importtime=False):
+    """
+    Run a main.py subcommand and return (seconds until it exited, stderr text).
+    """
+    env = _environment(folder)
+    env["LOG_LEVEL"] = "WARNING"
+    args = [arg.format(inbox=env["WATCH_FOLDER"]) for arg in args]
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [MAIN] + args
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=folder, env=env, capture_output=True, text=True)
+    return time.perf_counter() - started, completed.stderr
+
+
+def parse_importtime(stderr):
+    """
+    Parse -X importtime output.
+
+    Returns:
+        tuple: (total import seconds, [(cumulative seconds, module)] for
+        modules imported directly by the program, slowest first)
+    """
+    total = 0
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # Header line
+        total += int(self_us)
+        # One space, then two more per nesting level
+        if len(name) - len(name.lstrip(" ")) == 1:
+            top_level.append((int(cumulative_us) / 1e6, name.strip()))
+    top_level.sort(reverse=True)
+    return total / 1e6, top_level
+
+
+def report(runs=3, top=6):
+    """
+    Print the best of `runs` wall times and the slowest imports per command.
+    """
+    targets = [("watch", None)] + list(COMMANDS.items())
+    for name, args in targets:
+        with tempfile.TemporaryDirectory(prefix="mk-startup-") as folder:
+            if args is None:
+                best = min(time_watch(folder)[0] for _ in range(runs))
+                stderr = time_watch(folder, importtime=True)[1]
+                label = "to first event"
+            else:
+                best = min(time_command(folder, args)[0] for _ in range(runs))
+                stderr = time_command(folder, args, importtime=True)[1]
+                label = "to exit"
+        imports, modules = parse_importtime(stderr)
+        print(f"{name:>8}: {best * 1000:6.1f} ms {label}, {imports * 1000:5.1f} ms importing")
+        for seconds, module in modules[:top]:
+            print(f"          {seconds * 1000:6.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="timed runs per command (best is shown)")
+    parser.add_argument("--top", type=int, default=6, help="slowest top-level imports to list")
+    options = parser.parse_args()
+    report(options.runs, options.top)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+File transfer helpers: rename on the same device, streamed zero-copy
+copy with fsync and verification across devices.
+"""
+
+import errno
+import os
+import shutil
+import time
+from hashing import file_digest
+from logger import setup_logging
+
+CHUNK_SIZE = 8 * 1024 * 1024
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF}
+
+
+class TransferError(Exception):
+    """
+    Raised when a cross-device copy could not be verified.
+    """
+
+
+class Transfer:
+    """
+    Moves files between folders, picking the cheapest safe strategy.
+
+    Same device: a single os.replace. Different devices: the data is
+    streamed with os.copy_file_range (or os.sendfile, or plain reads and
+    writes as a last resort), fsynced, verified against the source, and only
+    then is the source unlinked.
+    """
+
+    def __init__(self, max_bytes_per_sec=0, verify="hash",
+                 progress_min_bytes=64 * 1024 * 1024, progress_interval=5.0, logger=None):
+        """
+        Args:
+            max_bytes_per_sec (int): Cross-device copy throttle (0 disables)
+            verify (str): "hash" (SHA-256 of both sides) or "size"
+            progress_min_bytes (int): Log progress for copies at least this large
+            progress_interval (float): Seconds between progress log lines
+            logger: Logger instance to use for logging
+        """
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.verify = verify
+        self.progress_min_bytes = progress_min_bytes
+        self.progress_interval = progress_interval
+        self.logger = logger or setup_logging()
+        self._devices = {}
+
+    def device_of(self, folder):
+        """
+        Return the st_dev of a folder, looked up once per folder.
+        """
+        folder = os.fspath(folder)
+        device = self._devices.get(folder)
+        if device is None:
+            device = os.stat(folder).st_dev
+            self._devices[folder] = device
+        return device
+
+    def move(self, src, dest, src_stat=None):
+        """
+        Move src to dest, replacing dest (a placeholder the caller owns).
+
+        Args:
+            src (Path): Source file
+            dest (Path): Destination path
+            src_stat (os.stat_result): Source stat if already known
+
+        Returns:
+            int: Bytes copied (0 for a rename)
+        """
+        src_stat = src_stat or os.stat(src)
+        if src_stat.st_dev == self.device_of(dest.parent):
+            try:
+                os.replace(src, dest)
+                return 0
+            except OSError as e:
+                # Bind mounts share st_dev but still refuse renames across them
+                if e.errno != errno.EXDEV:
+                    raise
+        return self.copy_across(src, dest, src_stat)
+
+    def copy_across(self, src, dest, src_stat):
+        """
+        Stream src into dest, fsync, verify, then unlink src.
+        On any failure dest is removed again and src is left untouched.
+        """
+        size = src_stat.st_size
+        try:
+            with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+                self._stream(fsrc.fileno(), fdst.fileno(), size, src.name)
+                fdst.flush()
+                os.fsync(fdst.fileno())
+            shutil.copystat(src, dest)
+            self._fsync_dir(dest.parent)
+
+            dest_size = os.stat(dest).st_size
+            if dest_size != size:
+                raise TransferError(f"Size mismatch copying {src} ({size} != {dest_size} bytes)")
+            if self.verify == "hash" and file_digest(src) != file_digest(dest):
+                raise TransferError(f"Checksum mismatch copying {src}")
+        except BaseException:
+            # Never leave an unverified copy in the destination folder
+            try:
+                os.unlink(dest)
+            except FileNotFoundError:
+                pass
+            raise
+
+        os.unlink(src)
+        self._fsync_dir(src.parent)
+        return size
+
+    def _stream(self, in_fd, out_fd, size, label):
+        copied = 0
+        started = last_report = time.monotonic()
+        report = size >= self.progress_min_bytes
+        strategy = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile"
+        while copied < size:
+            count = min(CHUNK_SIZE, size - copied)
+            sent = 0
+            if strategy == "copy_file_range":
+                try:
+                    sent = os.copy_file_range(in_fd, out_fd, count)
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                    strategy = "sendfile"
+                    continue
+            elif strategy == "sendfile" and hasattr(os, "sendfile"):
+                try:
+                    sent = os.sendfile(out_fd, in_fd, None, count)
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+                    strategy = "readwrite"
+                    continue
+            else:
+                strategy = "readwrite"
+                chunk = os.read(in_fd, count)
+                view = memoryview(chunk)
+                while view:
+                    written = os.write(out_fd, view)
+                    view = view[written:]
+                sent = len(chunk)
+            if sent == 0:
+                raise TransferError(f"Source shrank while copying {label} ({copied}/{size} bytes)")
+            copied += sent
+
+            now = time.monotonic()
+            if self.max_bytes_per_sec > 0:
+                ahead = copied / self.max_bytes_per_sec - (now - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+                    now = time.monotonic()
+            if report and now - last_report >= self.progress_interval:
+                last_report = now
+                rate = copied / max(now - started, 1e-6) / (1024 * 1024)
+                self.logger.info(
+                    "Copying %s: %d%% (%d/%d bytes, %.1f MiB/s)", label, copied * 100 // size, copied, size, rate
+                )
+        if report:
+            self.logger.info(
+                "Copied %s (%d bytes) in %.1fs via %s", label, size, time.monotonic() - started, strategy
+            )
+
+    @staticmethod
+    def _fsync_dir(folder):
+        try:
+            fd = os.open(folder, os.O_RDONLY)
+        except OSError:
+            return  # Not supported (e.g. Windows)
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)